@@ -0,0 +1,43 @@
+from route_geometry import RouteGeometry
+
+def get_adas_message(vehicle_idx, route_geometry, adas_segments):
+    """
+    Build the HTML notification for the vehicle at the given route index.
+    :param vehicle_idx: Index of the vehicle position in route_geometry.
+    :param route_geometry: RouteGeometry, or [lon, lat] pairs of the route. Pass the same RouteGeometry on
+                           every tick so the closest-index lookups are reused.
+    :param adas_segments: List of dicts with 'start', 'end', and 'ADAS' keys.
+    :return: HTML string with the enable/disable message, or None.
+    """
+    route_geometry = RouteGeometry.from_any(route_geometry)
+    for seg in adas_segments:
+        # Find closest indices for start and end
+        start_idx = route_geometry.closest_index(*seg["start"])
+        end_idx = route_geometry.closest_index(*seg["end"])
+        if start_idx > end_idx:
+            start_idx, end_idx = end_idx, start_idx
+
+        adas_str = ", ".join(seg["ADAS"]) if isinstance(seg["ADAS"], list) else str(seg["ADAS"])
+
+        # Before the start point (e.g., 5 points before)
+        if max(start_idx - 5, 0) <= vehicle_idx < start_idx and adas_str.lower() != "none":
+            return f"""
+                <div style='text-align: right; color: green; font-weight: bold; font-size: 18px;'>
+                    In 100 metres, Enable: {adas_str}
+                </div>
+            """
+        # From the start point until 10 points before end
+        if start_idx <= vehicle_idx < max(end_idx - 10, 0) and adas_str.lower() != "none":
+            return f"""
+                <div style='text-align: right; color: green; font-weight: bold; font-size: 18px;'>
+                    Enable: {adas_str}
+                </div>
+            """
+        # Show Disable message from 10 points before end to 10 points after end
+        if max(end_idx - 10, 0) <= vehicle_idx <= min(end_idx + 10, len(route_geometry) - 1) and adas_str.lower() != "none":
+            return f"""
+                <div style='text-align: right; color: orange; font-weight: bold; font-size: 18px;'>
+                    In 100 metres, Disable: {adas_str}
+                </div>
+            """
+    return None
@@ -0,0 +1,106 @@
+from identify_highways import HighwayIdentifier
+from identify_major_roads import MajorRoadIdentifier
+from identify_local_roads import LocalRoadIdentifier
+from adas_processor_level0 import ADASProcessorLevel0
+from adas_processor_level1 import ADASProcessorLevel1
+from adas_processor_level2 import ADASProcessorLevel2
+from add_adas_markers import get_color_for_adas
+
+class ADASSegmentStream:
+    def __init__(self, autonomous_level):
+        """
+        Incremental version of the grouping and ADAS stages for one autonomous level.
+        Intersection tuples are fed in route order; road groups and ADAS segments are
+        returned as soon as they are final, using the same rules as the batch processors.
+        :param autonomous_level: "Level 0", "Level 1" or "Level 2".
+        """
+        self.autonomous_level = autonomous_level
+        self.identifiers = [
+            ("highway", HighwayIdentifier()),
+            ("major", MajorRoadIdentifier()),
+            ("local", LocalRoadIdentifier()),
+        ]
+        # Closed groups per identifier kind, in route order: the identifiers' batch output so far
+        self.groups = {kind: [] for kind, _ in self.identifiers}
+        # Level 0 combines a highway group with an adjacent major road group, so the
+        # last closed group waits until the next one shows whether they merge
+        self.pending = None
+
+    def add_entry(self, entry):
+        """
+        Feed the next intersection tuple.
+        :return: List of ("group", group_tuple) and ("segment", adas_segment) events that became final.
+        """
+        events = []
+        for kind, identifier in self.identifiers:
+            group = identifier.add_entry(entry)
+            if group is not None:
+                self.groups[kind].append(group)
+                events.append(("group", group))
+                events.extend(self.close_group(kind, group))
+        return events
+
+    def finish(self):
+        """
+        End the route: close the open groups and flush the pending Level 0 group.
+        :return: List of the remaining ("group", ...) and ("segment", ...) events.
+        """
+        events = []
+        for kind, identifier in self.identifiers:
+            group = identifier.finish()
+            if group is not None:
+                self.groups[kind].append(group)
+                events.append(("group", group))
+                events.extend(self.close_group(kind, group))
+        if self.pending is not None:
+            events.extend(self.level0_segments(self.pending[1]))
+            self.pending = None
+        return events
+
+    def close_group(self, kind, group):
+        if self.autonomous_level == "Level 1":
+            if kind == "highway":
+                return self.segments(ADASProcessorLevel1([group], []))
+            if kind == "major":
+                return self.segments(ADASProcessorLevel1([], [group]))
+            return []
+
+        if self.autonomous_level == "Level 2":
+            if kind == "highway":
+                return self.segments(ADASProcessorLevel2([group], [], []))
+            if kind == "major":
+                return self.segments(ADASProcessorLevel2([], [group], []))
+            return self.segments(ADASProcessorLevel2([], [], [group]))
+
+        if self.autonomous_level != "Level 0" or kind == "local":
+            return []
+
+        # Level 0: merge with the pending group if one ends where the other starts (as CombinedRoadGrouper)
+        if self.pending is not None:
+            pending_kind, pending_group = self.pending
+            if pending_kind != kind:
+                highway, major = (pending_group, group) if pending_kind == "highway" else (group, pending_group)
+                h_start, h_end, h_type, h_dist, h_dur = highway
+                m_start, m_end, m_type, m_dist, m_dur = major
+                merged = None
+                if h_end == m_start:
+                    merged = (h_start, m_end, f"{h_type}+{m_type}", round(h_dist + m_dist, 3), round(h_dur + m_dur, 2))
+                elif m_end == h_start:
+                    merged = (m_start, h_end, f"{m_type}+{h_type}", round(m_dist + h_dist, 3), round(m_dur + h_dur, 2))
+                if merged is not None:
+                    self.pending = None
+                    return self.level0_segments(merged)
+
+        events = self.level0_segments(self.pending[1]) if self.pending is not None else []
+        self.pending = (kind, group)
+        return events
+
+    def level0_segments(self, combined_segment):
+        return self.segments(ADASProcessorLevel0([combined_segment]))
+
+    def segments(self, adas_processor):
+        events = []
+        for seg in adas_processor.process_adas():
+            seg["color"] = get_color_for_adas(seg["ADAS"])
+            events.append(("segment", seg))
+        return events
@@ -1,5 +1,6 @@
-import folium
 import csv
+from geometry_codec import latlon_list
+from route_geometry import RouteGeometry
 
 def get_color_for_adas(adas_list):
     adas_set = set([a.upper() for a in adas_list])
@@ -26,13 +27,15 @@ def add_adas_markers_to_map(route_geometry, adas_segments, output_map_path):
     - adas_segments: list of dicts with 'start', 'end', and 'ADAS' keys
     - output_map_path: path to save the updated map
     """
+    import folium
+
     # Center the map on the first route point
-    if route_geometry:
+    if route_geometry is not None and len(route_geometry) > 0:
         first_lat, first_lon = route_geometry[0][1], route_geometry[0][0]
         m = folium.Map(location=[first_lat, first_lon], zoom_start=13)
         # Add the route as a PolyLine
         folium.PolyLine(
-            locations=[[lat, lon] for lon, lat in route_geometry],
+            locations=latlon_list(route_geometry),
             color="blue",
             weight=5,
             opacity=0.8
@@ -65,10 +68,27 @@ def add_adas_colored_route(route_geometry, adas_segments, output_map_path):
     The route is blue by default, and only colored differently where ADAS is active.
     Always marks the start and end of the route.
     """
-    if not route_geometry:
-        m = folium.Map(location=[0, 0], zoom_start=2)
-        m.save(output_map_path)
-        return
+    m = build_adas_colored_map(route_geometry, adas_segments)
+    m.save(output_map_path)
+    # print(f"ADAS-colored route map saved to: {output_map_path}")
+
+def render_adas_colored_route(route_geometry, adas_segments):
+    """
+    Same map as add_adas_colored_route, returned as an HTML string instead of saved to a file.
+    """
+    return build_adas_colored_map(route_geometry, adas_segments).get_root().render()
+
+def build_adas_colored_map(route_geometry, adas_segments):
+    """
+    Build the folium map drawn by add_adas_colored_route without saving it.
+    Also used to render partial results while a route is still being processed.
+    :return: folium.Map
+    """
+    import folium
+
+    if route_geometry is None or len(route_geometry) == 0:
+        return folium.Map(location=[0, 0], zoom_start=2)
+    route_geometry = RouteGeometry.from_any(route_geometry)
 
     first_lat, first_lon = route_geometry[0][1], route_geometry[0][0]
     m = folium.Map(location=[first_lat, first_lon], zoom_start=13)
@@ -91,14 +111,6 @@ def add_adas_colored_route(route_geometry, adas_segments, output_map_path):
         [route_geometry[-1][1], route_geometry[-1][0]]
     ])
 
-    # Helper to find the closest index in route_geometry for a given (lat, lon)
-    def find_closest_index(coord):
-        lat, lon = coord
-        return min(
-            range(len(route_geometry)),
-            key=lambda i: (route_geometry[i][1] - lat) ** 2 + (route_geometry[i][0] - lon) ** 2
-        )
-
     # Build a list of colored segments
     colored_segments = []
     last_idx = 0
@@ -106,8 +118,8 @@ def add_adas_colored_route(route_geometry, adas_segments, output_map_path):
     # Prepare a list of (start_idx, end_idx, color) for all ADAS segments
     adas_colored_ranges = []
     for seg in adas_segments:
-        start_idx = find_closest_index(seg["start"])
-        end_idx = find_closest_index(seg["end"])
+        start_idx = route_geometry.closest_index(*seg["start"])
+        end_idx = route_geometry.closest_index(*seg["end"])
         if start_idx > end_idx:
             start_idx, end_idx = end_idx, start_idx
         color = get_color_for_adas(seg["ADAS"])
@@ -133,7 +145,7 @@ def add_adas_colored_route(route_geometry, adas_segments, output_map_path):
     for coords, color in colored_segments:
         if len(coords) > 1:
             folium.PolyLine(
-                locations=[[lat, lon] for lon, lat in coords],
+                locations=latlon_list(coords),
                 color=color,
                 weight=7,
                 opacity=0.9
@@ -147,8 +159,7 @@ def add_adas_colored_route(route_geometry, adas_segments, output_map_path):
                 fill_color=color
             ).add_to(m)
 
-    m.save(output_map_path)
-    # print(f"ADAS-colored route map saved to: {output_map_path}")
+    return m
 
 # def save_adas_segments_to_csv(adas_segments, output_csv):
 #     """
@@ -0,0 +1,90 @@
+"""
+Client for api_server.py, used by the Streamlit UI when ADAS_API_URL is set.
+"""
+import time
+
+import requests
+
+import config
+from geometry_codec import decode_polyline_array
+
+# Longest Retry-After honored before giving up on a busy server
+MAX_RETRY_WAIT_S = 30
+
+
+class RouteAPIClient:
+    def __init__(self, base_url=None, timeout=300, max_retries=2):
+        """
+        :param base_url: API base URL, defaults to config.API_URL.
+        :param timeout: Seconds to wait for a route response.
+        :param max_retries: Retries after a 503, each after the server's Retry-After.
+        """
+        self.base_url = (base_url or config.API_URL).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+
+    def process_route(self, source, destination, autonomous_level, include_maps=True, via=()):
+        """
+        Same result as main.process_route, computed by the API server.
+        The geometry is decoded into an (N, 2) [lon, lat] numpy array.
+        Map artifacts live on the server; fetch them with get_artifact_text.
+        The result also has "degraded": True when the server skipped the maps under load.
+        :param via: Optional place names of stops between source and destination.
+        :raises ValueError: On a request the server rejected or could not route.
+        """
+        payload = {
+            "source": source,
+            "destination": destination,
+            "autonomous_level": autonomous_level,
+            "include_maps": include_maps,
+            "via": list(via),
+        }
+        for attempt in range(self.max_retries + 1):
+            response = self.session.post(f"{self.base_url}/route", json=payload, timeout=self.timeout)
+            if response.status_code != 503 or attempt == self.max_retries:
+                break
+            retry_after = float(response.headers.get("Retry-After", 1))
+            if retry_after > MAX_RETRY_WAIT_S:
+                break
+            time.sleep(retry_after)
+
+        if response.status_code in (400, 422):
+            raise ValueError(response.json().get("error", response.text))
+        response.raise_for_status()
+        result = response.json()
+
+        result["route_geometry"] = decode_polyline_array(result.pop("geometry"))
+        result.pop("geometry_format", None)
+        for seg in result["adas_segments"]:
+            seg["start"] = tuple(seg["start"])
+            seg["end"] = tuple(seg["end"])
+        for leg in result["legs"]:
+            leg["start"] = tuple(leg["start"])
+            leg["end"] = tuple(leg["end"])
+        return result
+
+    def iter_route_events(self, source, destination, autonomous_level, via=()):
+        """
+        Same interface as main.iter_route_events; the server answers in one piece, so only "done" is yielded.
+        """
+        yield "done", self.process_route(source, destination, autonomous_level, via=via)
+
+    def get_artifact(self, digest):
+        """
+        :return: The artifact's bytes, or None if the server no longer has it.
+        """
+        response = self.session.get(f"{self.base_url}/artifacts/{digest}", timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    def get_artifact_text(self, digest):
+        data = self.get_artifact(digest)
+        return data.decode("utf-8") if data is not None else None
+
+    def metrics(self):
+        response = self.session.get(f"{self.base_url}/metrics", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
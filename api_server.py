@@ -0,0 +1,330 @@
+"""
+Headless HTTP API for route + ADAS processing.
+
+Runs process_route on a bounded worker pool in one long-lived process, so every
+client shares the warm imports and caches:
+- POST /route              {"source", "destination", "autonomous_level", "include_maps", "via"}
+                           -> distance, duration, per-leg summaries, ADAS segments and polyline6 geometry
+- GET  /artifacts/<digest> Generated map/JSON/CSV by the digest returned with the route
+- GET  /metrics            Queue depth, in-flight work, rejections, requests shared with an
+                           identical one queued or running, latency percentiles and
+                           how many calls were coalesced with identical ones in flight,
+                           and per upstream the rate-limit waits and throttling
+- GET  /healthz            Liveness, and whether the warm-up has finished
+
+When all workers are busy, requests wait in a bounded queue; beyond it they are
+rejected with 503 and a Retry-After estimate. A request identical to one already queued
+or running waits for that one's result and takes no worker or queue slot. From
+ADAS_API_DEGRADE_AT queued requests on, maps are skipped ("degraded": true) so the
+queue drains faster.
+
+Usage:
+    python api_server.py --port 8000 --workers 4 --max-queue 16
+    ADAS_API_URL=http://127.0.0.1:8000 streamlit run streamlit_ui.py
+"""
+import argparse
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import config
+import ratelimit
+import prefetch
+import result_store
+from artifacts import default_store
+from geometry_codec import encode_polyline
+from main import process_route, route_calls
+from routeprocessing import upstream_calls
+from singleflight import normalize_place
+from warmup import prewarm
+
+AUTONOMOUS_LEVELS = ("Level 0", "Level 1", "Level 2")
+
+# Stops allowed between source and destination
+MAX_VIA = 10
+
+# Requests kept for the latency percentiles in /metrics
+LATENCY_WINDOW = 1000
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Queue full, retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+def percentiles(values):
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": round(ordered[round(0.50 * last)], 4),
+        "p95": round(ordered[round(0.95 * last)], 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class RouteWorkerPool:
+    """
+    Thread pool with a bounded queue, load shedding and metrics.
+    """
+
+    def __init__(self, workers=None, max_queue=None, degrade_at=None):
+        """
+        :param workers: Jobs run at once.
+        :param max_queue: Jobs allowed to wait for a worker; submit raises QueueFull beyond it.
+        :param degrade_at: Queue depth from which jobs are told to run degraded.
+        """
+        self.workers = workers if workers is not None else config.API_WORKERS
+        self.max_queue = max_queue if max_queue is not None else config.API_MAX_QUEUE
+        self.degrade_at = degrade_at if degrade_at is not None else config.API_DEGRADE_AT
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="route-worker")
+        self.lock = threading.Lock()
+        self.pending = 0  # submitted and not finished
+        self.in_flight = 0
+        self.counts = {"completed": 0, "failed": 0, "rejected": 0, "degraded": 0, "shared": 0}
+        self.jobs = {}  # key -> (future, degraded) of the queued and running keyed jobs
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.queue_waits = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def queue_depth(self):
+        return self.pending - self.in_flight
+
+    def retry_after(self):
+        """
+        Seconds until a slot is likely free: the queue ahead, drained at the recent mean latency.
+        """
+        mean = sum(self.latencies) / len(self.latencies) if self.latencies else 1.0
+        return max(1, math.ceil(mean * (self.queue_depth + 1) / self.workers))
+
+    def submit(self, job, key=None):
+        """
+        Queue a job.
+        :param job: Callable taking one argument, degraded (bool).
+        :param key: Optional hashable key of identical jobs: while one with this key is queued or running,
+                    it is returned instead of queueing another, so duplicates never count against the queue.
+        :return: (concurrent.futures.Future, degraded)
+        """
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            with self.lock:
+                self.in_flight += 1
+                self.queue_waits.append(started - submitted)
+            ok = False
+            try:
+                result = job(degraded)
+                ok = True
+                return result
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+                    self.pending -= 1
+                    if key is not None:
+                        self.jobs.pop(key, None)
+                    self.counts["completed" if ok else "failed"] += 1
+                    self.latencies.append(time.perf_counter() - submitted)
+
+        with self.lock:
+            if key is not None and key in self.jobs:
+                self.counts["shared"] += 1
+                return self.jobs[key]
+            if self.pending >= self.workers + self.max_queue:
+                self.counts["rejected"] += 1
+                raise QueueFull(self.retry_after())
+            degraded = self.queue_depth >= self.degrade_at
+            if degraded:
+                self.counts["degraded"] += 1
+            self.pending += 1
+            # Submitted under the lock, so the job cannot finish before its key is registered
+            future = self.executor.submit(run)
+            if key is not None:
+                self.jobs[key] = future, degraded
+        return future, degraded
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "degrade_at": self.degrade_at,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                **self.counts,
+                "latency_s": percentiles(self.latencies),
+                "queue_wait_s": percentiles(self.queue_waits),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def compact_result(result, degraded):
+    """
+    JSON response for a process_route result: geometry as polyline6, coordinates at 6 decimals.
+    """
+    return {
+        "route_distance_km": result["route_distance_km"],
+        "estimated_duration_minutes": result["estimated_duration_minutes"],
+        "geometry": encode_polyline(result["route_geometry"]),
+        "geometry_format": "polyline6",
+        "legs": [
+            {
+                **leg,
+                "start": [round(leg["start"][0], 6), round(leg["start"][1], 6)],
+                "end": [round(leg["end"][0], 6), round(leg["end"][1], 6)],
+            }
+            for leg in result["legs"]
+        ],
+        "adas_segments": [
+            {
+                **seg,
+                "start": [round(seg["start"][0], 6), round(seg["start"][1], 6)],
+                "end": [round(seg["end"][0], 6), round(seg["end"][1], 6)],
+            }
+            for seg in result["adas_segments"]
+        ],
+        "artifacts": result["artifacts"],
+        "degraded": degraded,
+    }
+
+
+def error(status, message, headers=None):
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+async def route_endpoint(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return error(400, "Request body must be JSON")
+    if not isinstance(body, dict):
+        return error(400, "Request body must be a JSON object")
+    source = body.get("source")
+    destination = body.get("destination")
+    if not isinstance(source, str) or not source.strip() or not isinstance(destination, str) or not destination.strip():
+        return error(400, "Both source and destination are required")
+    autonomous_level = str(body.get("autonomous_level", "Level 0")).strip()
+    if autonomous_level not in AUTONOMOUS_LEVELS:
+        return error(400, f"autonomous_level must be one of {', '.join(AUTONOMOUS_LEVELS)}")
+    include_maps = body.get("include_maps", True)
+    if not isinstance(include_maps, bool):
+        return error(400, "include_maps must be true or false")
+    via = body.get("via") or []
+    if not isinstance(via, list) or not all(isinstance(place, str) and place.strip() for place in via):
+        return error(400, "via must be a list of place names")
+    if len(via) > MAX_VIA:
+        return error(400, f"At most {MAX_VIA} via stops are allowed")
+
+    def job(degraded):
+        return process_route(source, destination, autonomous_level, render_maps=include_maps and not degraded, via=via)
+
+    # Same normalization as main.process_route's coalescing, before a slot is taken
+    key = (
+        normalize_place(source), tuple(normalize_place(place) for place in via), normalize_place(destination),
+        autonomous_level, include_maps,
+    )
+    try:
+        future, degraded = request.app.state.pool.submit(job, key)
+    except QueueFull as e:
+        return error(503, "Server busy, try again later", headers={"Retry-After": str(e.retry_after)})
+    try:
+        result = await asyncio.wrap_future(future)
+    except ValueError as e:
+        return error(422, str(e))
+    except Exception as e:
+        return error(502, f"Route processing failed: {e}")
+    return JSONResponse(compact_result(result, degraded))
+
+
+async def artifact_endpoint(request):
+    data = default_store().get(request.path_params["digest"])
+    if data is None:
+        return error(404, "Unknown or expired artifact")
+    # Content-addressed, so the response never changes
+    return Response(data, media_type="application/octet-stream", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+async def metrics_endpoint(request):
+    store = default_store()
+    metrics = request.app.state.pool.metrics()
+    metrics["artifacts"] = {**store.stats, "bytes": store.total_bytes}
+    metrics["coalesced"] = {"routes": dict(route_calls.stats), "upstream": dict(upstream_calls.stats)}
+    metrics["upstreams"] = ratelimit.stats()
+    metrics["prefetch"] = prefetch.stats()
+    results = result_store.default_result_store()
+    metrics["results"] = results.snapshot() if results is not None else {}
+    return JSONResponse(metrics)
+
+
+async def health_endpoint(request):
+    return JSONResponse({"status": "ok", "warm": request.app.state.warmup is not None})
+
+
+def create_app(workers=None, max_queue=None, degrade_at=None, warm=True):
+    """
+    :param warm: Run warmup.prewarm in the background on startup.
+    :return: Starlette application.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.pool = RouteWorkerPool(workers, max_queue, degrade_at)
+        app.state.warmup = None
+        warm_task = None
+        if warm:
+            async def run_warmup():
+                app.state.warmup = await asyncio.to_thread(prewarm)
+                print(f"Pre-warm: {app.state.warmup}")
+            warm_task = asyncio.create_task(run_warmup())
+        try:
+            yield
+        finally:
+            if warm_task is not None:
+                warm_task.cancel()
+            app.state.pool.shutdown()
+
+    return Starlette(
+        routes=[
+            Route("/route", route_endpoint, methods=["POST"]),
+            Route("/artifacts/{digest}", artifact_endpoint, methods=["GET"]),
+            Route("/metrics", metrics_endpoint, methods=["GET"]),
+            Route("/healthz", health_endpoint, methods=["GET"]),
+        ],
+        middleware=[Middleware(GZipMiddleware, minimum_size=1024)],
+        lifespan=lifespan,
+    )
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve route + ADAS processing over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=config.API_WORKERS, help="Routes processed at once.")
+    parser.add_argument("--max-queue", type=int, default=config.API_MAX_QUEUE, help="Requests waiting before 503s.")
+    parser.add_argument("--degrade-at", type=int, default=config.API_DEGRADE_AT, help="Queue depth from which maps are skipped.")
+    parser.add_argument("--no-warm", action="store_true", help="Skip the background pre-warm on startup.")
+    args = parser.parse_args(argv)
+
+    app = create_app(args.workers, args.max_queue, args.degrade_at, warm=not args.no_warm)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+In-memory, content-addressed storage for generated artifacts (maps, route JSON, CSV).
+
+Artifacts are kept as bytes keyed by their SHA-256 digest. A request gets back a
+small {name: digest} dict instead of files at fixed paths, so concurrent sessions
+never overwrite each other and nothing touches the disk unless persistence is
+enabled. Identical artifacts are stored once.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import config
+
+
+class ArtifactStore:
+    def __init__(self, max_bytes=None, persist_dir=None, max_persist_bytes=None):
+        """
+        :param max_bytes: Memory budget; least recently used artifacts are evicted beyond it.
+        :param persist_dir: Optional directory where artifacts are also written as <digest> files.
+                            Evicted artifacts are then reloaded from disk on demand.
+        :param max_persist_bytes: Optional size budget for persist_dir, least recently used files go first.
+        """
+        self.max_bytes = max_bytes if max_bytes is not None else config.ARTIFACT_MAX_BYTES
+        self.persist_dir = persist_dir
+        self.max_persist_bytes = max_persist_bytes
+        self.blobs = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {"puts": 0, "hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    def put(self, data):
+        """
+        Store an artifact.
+        :param data: bytes, or str (stored as UTF-8).
+        :return: The artifact's hex digest.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self.stats["puts"] += 1
+            if digest in self.blobs:
+                self.blobs.move_to_end(digest)
+            else:
+                self.blobs[digest] = data
+                self.total_bytes += len(data)
+                self._evict()
+        if self.persist_dir:
+            self._persist(digest, data)
+        return digest
+
+    def get(self, digest):
+        """
+        :return: The artifact's bytes, or None if it was evicted and not persisted.
+        """
+        with self.lock:
+            data = self.blobs.get(digest)
+            if data is not None:
+                self.blobs.move_to_end(digest)
+                self.stats["hits"] += 1
+                return data
+        if self.persist_dir:
+            path = os.path.join(self.persist_dir, digest)
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                with self.lock:
+                    self.stats["disk_hits"] += 1
+                    if digest not in self.blobs:
+                        self.blobs[digest] = data
+                        self.total_bytes += len(data)
+                        self._evict()
+                return data
+        with self.lock:
+            self.stats["misses"] += 1
+        return None
+
+    def get_text(self, digest):
+        data = self.get(digest)
+        return data.decode("utf-8") if data is not None else None
+
+    def __contains__(self, digest):
+        with self.lock:
+            if digest in self.blobs:
+                return True
+        return bool(self.persist_dir) and os.path.exists(os.path.join(self.persist_dir, digest))
+
+    def _evict(self):
+        # Called with the lock held; always keeps the most recent artifact
+        while self.total_bytes > self.max_bytes and len(self.blobs) > 1:
+            _, data = self.blobs.popitem(last=False)
+            self.total_bytes -= len(data)
+            self.stats["evictions"] += 1
+
+    def _persist(self, digest, data):
+        path = os.path.join(self.persist_dir, digest)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+        # Write then rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.persist_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        if self.max_persist_bytes is not None:
+            self._prune_persisted()
+
+    def _prune_persisted(self):
+        entries = []
+        for entry in os.scandir(self.persist_dir):
+            if entry.is_file() and not entry.name.startswith(".tmp-"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_persist_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def default_store():
+    """
+    Process-wide store shared by all sessions, configured from config (ADAS_ARTIFACT_*).
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ArtifactStore(
+                max_bytes=config.ARTIFACT_MAX_BYTES,
+                persist_dir=config.ARTIFACT_DIR,
+                max_persist_bytes=config.ARTIFACT_MAX_PERSIST_BYTES,
+            )
+        return _default_store
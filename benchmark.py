@@ -0,0 +1,563 @@
+"""
+Benchmark suite for the route/ADAS pipeline.
+
+Every stage runs against route fixtures in fixtures/routes/: an OSRM response
+plus the road type recorded for each step, so a run needs no network access.
+The routes grow from a short city hop to a ~600 km Autobahn trip.
+
+Usage:
+    python benchmark.py                    # run and compare against the local baseline, if saved
+    python benchmark.py --save-baseline    # run and store the results as this machine's baseline
+    python benchmark.py --routes city_hop  # run only some routes
+    python benchmark.py record             # record the fixtures from OSRM, Nominatim and Overpass
+    python benchmark.py synthesize         # generate OSRM-shaped fixtures offline
+    python benchmark.py startup            # measure cold import and time-to-first-render
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from routeprocessing import RouteProcessor, extract_intersection_data, load_osmnx
+from identify_highways import HighwayIdentifier
+from identify_major_roads import MajorRoadIdentifier
+from identify_local_roads import LocalRoadIdentifier
+from combined_road_grouper import CombinedRoadGrouper
+from adas_processor_level0 import ADASProcessorLevel0
+from adas_processor_level1 import ADASProcessorLevel1
+from adas_processor_level2 import ADASProcessorLevel2
+from curvatureprocessor import CurvatureProcessor
+from add_adas_markers import add_adas_colored_route, render_adas_colored_route
+from geometry_codec import encode_polyline, decode_polyline_array
+from route_geometry import RouteGeometry
+from adas_messages import get_adas_message
+from simulator import Simulator
+from fleet_simulator import FleetSimulator
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ROUTE_FIXTURE_DIR = os.path.join(FIXTURE_DIR, "routes")
+# Absolute ops/s only compare on the machine that measured them, so the baseline is
+# written locally by --save-baseline and not checked in
+BASELINE_FILE = os.path.join(FIXTURE_DIR, "benchmark_baseline.json")
+
+# Routes of increasing length, from a city hop to a long Autobahn trip.
+# "plan" lists (kind, length_km, name, ref) sections used by the offline synthesizer.
+ROUTES = [
+    {
+        "name": "city_hop", "source": "Heilbronn", "destination": "Neckarsulm",
+        "source_coords": (49.1427, 9.2109), "destination_coords": (49.1912, 9.2244),
+        "plan": [
+            ("local", 0.8, "Allee", ""), ("major", 2.5, "Karlstraße", "L 1100"),
+            ("major", 3.0, "Neckarsulmer Straße", "B 27"), ("local", 1.2, "Binswanger Straße", ""),
+            ("major", 2.4, "Heilbronner Straße", "K 2000"), ("local", 0.9, "Rathausstraße", ""),
+        ],
+    },
+    {
+        "name": "regional", "source": "Heilbronn", "destination": "Stuttgart",
+        "source_coords": (49.1427, 9.2109), "destination_coords": (48.7784, 9.1800),
+        "plan": [
+            ("local", 1.0, "Allee", ""), ("major", 3.5, "Weinsberger Straße", "B 39"),
+            ("link", 0.6, "", ""), ("highway", 38.0, "", "A 81"), ("link", 0.7, "", ""),
+            ("major", 6.5, "Heilbronner Straße", "B 27"), ("major", 2.2, "Wolframstraße", ""),
+            ("local", 0.8, "Königstraße", ""),
+        ],
+    },
+    {
+        "name": "long_distance", "source": "Stuttgart", "destination": "München",
+        "source_coords": (48.7784, 9.1800), "destination_coords": (48.1372, 11.5755),
+        "plan": [
+            ("local", 1.1, "Königstraße", ""), ("major", 4.0, "Hauptstätter Straße", "B 14"),
+            ("major", 7.5, "Neue Weinsteige", "B 27"), ("link", 0.8, "", ""),
+            ("highway", 205.0, "", "A 8"), ("link", 0.9, "", ""),
+            ("major", 6.0, "Verdistraße", ""), ("major", 4.5, "Arnulfstraße", ""),
+            ("local", 1.0, "Neuhauser Straße", ""),
+        ],
+    },
+    {
+        "name": "autobahn_600km", "source": "Köln", "destination": "München",
+        "source_coords": (50.9384, 6.9599), "destination_coords": (48.1372, 11.5755),
+        "plan": [
+            ("local", 1.2, "Hohe Straße", ""), ("major", 3.0, "Rheinuferstraße", ""),
+            ("major", 5.5, "Severinsbrücke", "B 55a"), ("link", 0.7, "", ""),
+            ("highway", 178.0, "", "A 3"), ("link", 1.1, "", ""), ("highway", 74.0, "", "A 5"),
+            ("link", 1.0, "", ""), ("highway", 122.0, "", "A 6"), ("link", 1.2, "", ""),
+            ("highway", 181.0, "", "A 9"), ("link", 0.8, "", ""),
+            ("major", 7.0, "Leopoldstraße", ""), ("major", 3.2, "Ludwigstraße", ""),
+            ("local", 0.9, "Theatinerstraße", ""),
+        ],
+    },
+]
+
+# Per road kind: speed (km/h), geometry point spacing (m), longest step (km),
+# heading noise (deg) and the road type get_combined_road_type reports without a ref
+ROAD_KINDS = {
+    "local": (30, 15, 0.4, 14.0, "Local Road"),
+    "major": (60, 30, 2.0, 6.0, "Major Road"),
+    "link": (60, 20, 1.5, 10.0, "Highway_link"),
+    "highway": (120, 50, 18.0, 1.5, "Highway"),
+}
+
+# Number of simulation ticks sampled along the route for get_adas_message
+MESSAGE_TICKS = 25
+
+# Fleet benchmark: vehicles, alternating between the Level 0 and Level 2 route, and steps per drive
+FLEET_SIZE = 200
+FLEET_STEPS = 200
+
+
+def fixture_path(name):
+    return os.path.join(ROUTE_FIXTURE_DIR, f"{name}.json.gz")
+
+
+def load_fixture(name):
+    """
+    Load a recorded route fixture.
+    :param name: Name of the route fixture.
+    :return: Dict with the OSRM response, coordinates and recorded road types.
+    """
+    with gzip.open(fixture_path(name), "rt", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def record_fixtures(routes):
+    """
+    Geocode, route and classify each benchmark route and store the result as a fixture.
+    Classification runs with a throwaway osmnx cache folder so cache/ does not grow.
+    """
+    ox = load_osmnx()
+    processor = RouteProcessor()
+    default_cache_folder = ox.settings.cache_folder
+    for route in routes:
+        print(f"Recording {route['name']}: {route['source']} -> {route['destination']}")
+        source_coords = processor.get_lat_lon(route["source"])
+        destination_coords = processor.get_lat_lon(route["destination"])
+        data = processor.fetch_route(source_coords, destination_coords)
+        if data["code"] != "Ok":
+            raise ValueError(f"OSRM error: {data['code']} - {data.get('message', 'No message provided')}")
+
+        with tempfile.TemporaryDirectory() as scratch_cache:
+            ox.settings.cache_folder = scratch_cache
+            try:
+                steps = data["routes"][0]["legs"][0]["steps"]
+                intersection_data = extract_intersection_data(steps)
+            finally:
+                ox.settings.cache_folder = default_cache_folder
+
+        save_fixture(route, source_coords, destination_coords, data, [entry[9] for entry in intersection_data])
+
+
+def save_fixture(route, source_coords, destination_coords, data, road_types, synthetic=False):
+    fixture = {
+        "name": route["name"],
+        "source": route["source"],
+        "destination": route["destination"],
+        "source_coords": list(source_coords),
+        "destination_coords": list(destination_coords),
+        "synthetic": synthetic,
+        "road_types": road_types,
+        "osrm": data,
+    }
+    os.makedirs(ROUTE_FIXTURE_DIR, exist_ok=True)
+    with gzip.open(fixture_path(route["name"]), "wt", encoding="utf-8") as file:
+        json.dump(fixture, file, separators=(",", ":"))
+    steps = data["routes"][0]["legs"][0]["steps"]
+    print(f"  {route['name']}: {len(steps)} steps, {data['routes'][0]['distance'] / 1000:.1f} km")
+
+
+def haversine_m(coord1, coord2):
+    """
+    Great-circle distance in metres between two (lat, lon) pairs.
+    """
+    lat1, lon1 = math.radians(coord1[0]), math.radians(coord1[1])
+    lat2, lon2 = math.radians(coord2[0]), math.radians(coord2[1])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371000 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def bearing_deg(coord1, coord2):
+    lat1, lat2 = math.radians(coord1[0]), math.radians(coord2[0])
+    dlon = math.radians(coord2[1] - coord1[1])
+    x = math.sin(dlon) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+    return math.degrees(math.atan2(x, y)) % 360
+
+
+def transition_maneuver(previous_kind, kind, rng):
+    """
+    Pick a plausible OSRM maneuver (type, modifier) for moving from one road kind to the next.
+    """
+    if kind == "link" and previous_kind == "highway":
+        return "off ramp", "slight right"
+    if kind == "link":
+        return "on ramp", "slight right"
+    if kind == "highway" and previous_kind == "link":
+        return "merge", "slight left"
+    if previous_kind == "link":
+        return "turn", rng.choice(["left", "right"])
+    if kind == previous_kind == "major":
+        return "new name", rng.choice(["straight", "slight left", "slight right"])
+    return rng.choice(["turn", "end of road"]), rng.choice(["left", "right"])
+
+
+def synthesize_route(route, seed=0):
+    """
+    Generate a deterministic OSRM-shaped response and per-step road types for a benchmark route.
+    Geometry is a random walk from the source that steers towards the destination,
+    with point spacing, step lengths and maneuvers following ROAD_KINDS.
+    :return: (OSRM response dict, list of road types per step)
+    """
+    rng = random.Random(f"{route['name']}:{seed}")
+    position = tuple(route["source_coords"])
+    destination = tuple(route["destination_coords"])
+    heading = bearing_deg(position, destination)
+    overview = [[round(position[1], 6), round(position[0], 6)]]
+    steps = []
+    road_types = []
+    total_distance = 0.0
+    total_duration = 0.0
+    previous_kind = None
+
+    for kind, length_km, name, ref in route["plan"]:
+        speed_kmph, spacing_m, max_step_km, noise_deg, road_type = ROAD_KINDS[kind]
+        remaining_km = length_km
+        first_step_of_section = True
+        while remaining_km > 1e-6:
+            step_km = min(remaining_km, max_step_km * rng.uniform(0.6, 1.0))
+            if remaining_km - step_km < 0.05:
+                step_km = remaining_km
+            remaining_km -= step_km
+
+            if previous_kind is None:
+                maneuver_type, modifier = "depart", None
+            elif first_step_of_section:
+                maneuver_type, modifier = transition_maneuver(previous_kind, kind, rng)
+            else:
+                maneuver_type, modifier = "continue", rng.choice(["straight", "straight", "slight left", "slight right"])
+
+            coordinates = [overview[-1]]
+            point_count = max(int(step_km * 1000 / spacing_m), 1)
+            for _ in range(point_count):
+                target = bearing_deg(position, destination)
+                drift = (target - heading + 540) % 360 - 180
+                heading = (heading + 0.1 * drift + rng.gauss(0, noise_deg)) % 360
+                distance_m = step_km * 1000 / point_count
+                lat = position[0] + distance_m * math.cos(math.radians(heading)) / 111320
+                lon = position[1] + distance_m * math.sin(math.radians(heading)) / (111320 * math.cos(math.radians(position[0])))
+                position = (lat, lon)
+                coordinates.append([round(lon, 6), round(lat, 6)])
+            overview.extend(coordinates[1:])
+
+            distance = round(sum(haversine_m((a[1], a[0]), (b[1], b[0])) for a, b in zip(coordinates, coordinates[1:])), 1)
+            duration = round(distance / (speed_kmph / 3.6) * rng.uniform(0.9, 1.15), 1)
+            maneuver = {"type": maneuver_type, "location": coordinates[0]}
+            if modifier:
+                maneuver["modifier"] = modifier
+            steps.append({
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+                "maneuver": maneuver,
+                "mode": "driving",
+                "name": name,
+                "ref": ref,
+                "distance": distance,
+                "duration": duration,
+            })
+            road_types.append("Highway" if ref.startswith(("A", "B")) else road_type)
+            total_distance += distance
+            total_duration += duration
+            previous_kind = kind
+            first_step_of_section = False
+
+    steps.append({
+        "geometry": {"type": "LineString", "coordinates": [overview[-1], overview[-1]]},
+        "maneuver": {"type": "arrive", "location": overview[-1]},
+        "mode": "driving",
+        "name": route["plan"][-1][2],
+        "distance": 0,
+        "duration": 0,
+    })
+    road_types.append(ROAD_KINDS[route["plan"][-1][0]][4])
+
+    data = {
+        "code": "Ok",
+        "routes": [{
+            "geometry": {"type": "LineString", "coordinates": overview},
+            "legs": [{"steps": steps, "distance": round(total_distance, 1), "duration": round(total_duration, 1), "summary": ""}],
+            "distance": round(total_distance, 1),
+            "duration": round(total_duration, 1),
+            "weight_name": "routability",
+            "weight": round(total_duration, 1),
+        }],
+        "waypoints": [
+            {"name": steps[0]["name"], "location": overview[0]},
+            {"name": steps[-1]["name"], "location": overview[-1]},
+        ],
+    }
+    return data, road_types
+
+
+def synthesize_fixtures(routes):
+    """
+    Write OSRM-shaped fixtures for routes without touching the network.
+    """
+    for route in routes:
+        data, road_types = synthesize_route(route)
+        save_fixture(route, route["source_coords"], route["destination_coords"], data, road_types, synthetic=True)
+
+
+def replay_classifier(road_types):
+    """
+    Build a classify callable for extract_intersection_data that returns the recorded road types in order.
+    """
+    iterator = iter(road_types)
+
+    def classify(ref, coord):
+        return next(iterator)
+
+    return classify
+
+
+def measure(func, min_time=0.2, max_runs=1000):
+    """
+    Time a callable and trace its memory use.
+    :param func: Zero-argument callable to benchmark.
+    :param min_time: Keep repeating the call until this many seconds have passed.
+    :param max_runs: Upper bound on the number of timed calls.
+    :return: Dict with ops_per_s, retained_blocks and peak_kib. retained_blocks counts the memory
+             blocks still allocated after the call (mostly its output), not every allocation it
+             made: a stage that allocates heavily and frees it all reads about 0. peak_kib shows
+             how much memory the call used at its high point.
+    """
+    # Warm-up call, so lazy imports and first-use caches are not measured
+    func()
+
+    # Memory is traced on a separate call so tracing overhead does not skew the timing
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    output = func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del output
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, "lineno") if stat.count_diff > 0)
+
+    runs = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while runs < max_runs and (runs == 0 or elapsed < min_time):
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - start
+
+    return {
+        "ops_per_s": round(runs / elapsed, 3),
+        "retained_blocks": retained_blocks,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def route_stages(fixture, scratch_dir):
+    """
+    Build the (stage name, callable) pairs benchmarked for one route fixture.
+    """
+    steps = fixture["osrm"]["routes"][0]["legs"][0]["steps"]
+    route_geometry = fixture["osrm"]["routes"][0]["geometry"]["coordinates"]
+    road_types = fixture["road_types"]
+
+    intersection_data = tuple(extract_intersection_data(steps, classify=replay_classifier(road_types)))
+    grouped_highways = HighwayIdentifier(intersection_data).group_highways()
+    grouped_major_roads = MajorRoadIdentifier(intersection_data).group_major_roads()
+    grouped_local_roads = LocalRoadIdentifier(intersection_data).group_local_roads()
+    combined_segments = CombinedRoadGrouper(grouped_highways, grouped_major_roads).combine()
+    adas_segments = ADASProcessorLevel2(grouped_highways, grouped_major_roads, grouped_local_roads).process_adas()
+    curvature_coords = [(lat, lon) for lon, lat in route_geometry]
+    map_file = os.path.join(scratch_dir, f"{fixture['name']}.html")
+    encoded_geometry = encode_polyline(route_geometry)
+    tick_stride = max(len(route_geometry) // MESSAGE_TICKS, 1)
+    ticks = range(0, len(route_geometry), tick_stride)
+
+    stages = [
+        ("extract_intersection_data",
+         lambda: extract_intersection_data(steps, classify=replay_classifier(road_types))),
+        ("HighwayIdentifier", lambda: HighwayIdentifier(intersection_data).group_highways()),
+        ("MajorRoadIdentifier", lambda: MajorRoadIdentifier(intersection_data).group_major_roads()),
+        ("LocalRoadIdentifier", lambda: LocalRoadIdentifier(intersection_data).group_local_roads()),
+        ("CombinedRoadGrouper.combine",
+         lambda: CombinedRoadGrouper(grouped_highways, grouped_major_roads).combine()),
+        ("ADASProcessorLevel0", lambda: ADASProcessorLevel0(combined_segments).process_adas()),
+        ("ADASProcessorLevel1", lambda: ADASProcessorLevel1(grouped_highways, grouped_major_roads).process_adas()),
+        ("ADASProcessorLevel2",
+         lambda: ADASProcessorLevel2(grouped_highways, grouped_major_roads, grouped_local_roads).process_adas()),
+        ("CurvatureProcessor", lambda: CurvatureProcessor(curvature_coords).process_curvatures()),
+        ("add_adas_colored_route", lambda: add_adas_colored_route(route_geometry, adas_segments, map_file)),
+        ("render_adas_colored_route", lambda: render_adas_colored_route(route_geometry, adas_segments)),
+        ("decode_polyline6", lambda: decode_polyline_array(encoded_geometry)),
+    ]
+    # The UI keeps one RouteGeometry per route in session state and passes it on every tick
+    session_geometry = RouteGeometry(route_geometry)
+
+    def message_tick():
+        for vehicle_idx in ticks:
+            get_adas_message(vehicle_idx, session_geometry, adas_segments)
+
+    # Reported per tick rather than per sweep, see run_benchmarks
+    stages.append(("get_adas_message", message_tick))
+
+    # Level 0 segments carry no road type, so the simulators run on both kinds
+    duration_min = fixture["osrm"]["routes"][0]["duration"] / 60
+    level2_route = {"route_geometry": session_geometry, "adas_segments": adas_segments,
+                    "estimated_duration_minutes": duration_min}
+    level0_route = dict(level2_route, adas_segments=ADASProcessorLevel0(combined_segments).process_adas())
+    fleet_dt = max(duration_min * 60 / FLEET_STEPS, 1.0)
+    stages.extend([
+        ("Simulator.events", lambda: Simulator(level2_route).events()),
+        ("Simulator.events (Level 0)", lambda: Simulator(level0_route).events()),
+        ("FleetSimulator.run", lambda: FleetSimulator(
+            [level0_route, level2_route], [number % 2 for number in range(FLEET_SIZE)],
+            departure_s=[number * fleet_dt for number in range(FLEET_SIZE)],
+            profile="cautious", profiles={"cautious": {"Highway": 0.85, "default": 0.95}},
+        ).run(dt=fleet_dt)),
+    ])
+    return stages, len(ticks)
+
+
+def run_benchmarks(route_names, min_time):
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        for route in ROUTES:
+            if route_names and route["name"] not in route_names:
+                continue
+            fixture = load_fixture(route["name"])
+            osrm_route = fixture["osrm"]["routes"][0]
+            print(f"\n{route['name']}: {route['source']} -> {route['destination']} "
+                  f"({osrm_route['distance'] / 1000:.1f} km, {len(osrm_route['legs'][0]['steps'])} steps, "
+                  f"{len(osrm_route['geometry']['coordinates'])} points)")
+            print(f"  {'stage':<30}{'ops/s':>14}{'retained blocks':>17}{'peak KiB':>12}")
+
+            stages, tick_count = route_stages(fixture, scratch_dir)
+            results[route["name"]] = {}
+            for stage_name, func in stages:
+                result = measure(func, min_time=min_time)
+                if stage_name == "get_adas_message":
+                    result["ops_per_s"] = round(result["ops_per_s"] * tick_count, 3)
+                results[route["name"]][stage_name] = result
+                print(f"  {stage_name:<30}{result['ops_per_s']:>14,.1f}{result['retained_blocks']:>17,}{result['peak_kib']:>12,.1f}")
+    return results
+
+
+# Cold-start measurements, each run in a fresh interpreter. The Streamlit
+# render runs without the pre-warm step, which happens after the page is sent.
+STARTUP_SNIPPETS = [
+    ("import main", "", "import main"),
+    ("import streamlit_ui dependencies", "",
+     "import streamlit, main, add_adas_markers, adas_messages, warmup"),
+    ("first render (streamlit_ui)",
+     "from streamlit.testing.v1 import AppTest",
+     "AppTest.from_file('streamlit_ui.py', default_timeout=120).run()"),
+]
+
+
+def measure_startup(repeats=3):
+    """
+    Time cold imports and the first Streamlit script run in fresh interpreters.
+    :return: Dict of measurement name -> median seconds.
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, ADAS_PREWARM="0")
+    results = {}
+    for name, setup, statement in STARTUP_SNIPPETS:
+        code = (f"{setup}\nimport time\nstart = time.perf_counter()\n{statement}\n"
+                f"print(time.perf_counter() - start)")
+        timings = []
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, "-c", code], cwd=base_dir, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            timings.append(float(output.strip().splitlines()[-1]))
+        results[name] = round(statistics.median(timings), 3)
+        print(f"  {name:<36}{results[name]:>8.3f} s")
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compare benchmark results against the stored baseline.
+    A stage regresses when its ops/s drop, or its peak memory grows, by more than the tolerance.
+    :return: List of human-readable regression descriptions.
+    """
+    regressions = []
+    for route_name, stages in results.items():
+        for stage_name, result in stages.items():
+            base = baseline.get(route_name, {}).get(stage_name)
+            if not base:
+                continue
+            if result["ops_per_s"] < base["ops_per_s"] * (1 - tolerance):
+                regressions.append(
+                    f"{route_name}/{stage_name}: {result['ops_per_s']:,.1f} ops/s "
+                    f"(baseline {base['ops_per_s']:,.1f})"
+                )
+            if result["peak_kib"] > base["peak_kib"] * (1 + tolerance) + 1:
+                regressions.append(
+                    f"{route_name}/{stage_name}: peak {result['peak_kib']:,.1f} KiB "
+                    f"(baseline {base['peak_kib']:,.1f})"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the route/ADAS pipeline on recorded routes.")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "record", "synthesize", "startup"])
+    parser.add_argument("--routes", nargs="*", help="Only run these routes (default: all).")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds spent timing each stage.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (default 0.25).")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    args = parser.parse_args(argv)
+
+    selected = [route for route in ROUTES if not args.routes or route["name"] in args.routes]
+    if args.command == "record":
+        record_fixtures(selected)
+        return 0
+    if args.command == "synthesize":
+        synthesize_fixtures(selected)
+        return 0
+    if args.command == "startup":
+        measure_startup()
+        return 0
+
+    results = run_benchmarks(args.routes, args.min_time)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE, "r", encoding="utf-8") as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to: {BASELINE_FILE}")
+        return 0
+
+    if not os.path.exists(BASELINE_FILE):
+        print("\nNo baseline stored yet. Run with --save-baseline to create one.")
+        return 0
+
+    with open(BASELINE_FILE, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nNo regressions beyond {args.tolerance:.0%} of the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
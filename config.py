@@ -0,0 +1,157 @@
+"""
+Upstream service endpoints, read from environment variables.
+
+    ADAS_REPLAY_URL      Base URL of a replay_server.py instance. When set, geocoding,
+                         routing and Overpass all default to the replay server.
+    ADAS_OSRM_URL        OSRM server (default: the public OSRM demo server).
+    ADAS_NOMINATIM_URL   Nominatim server (default: the public Nominatim server).
+    ADAS_OVERPASS_URL    Overpass API endpoint used by osmnx (default: overpass-api.de).
+    ADAS_OSRM_GEOMETRIES "geojson" (default) or "polyline6". With polyline6 the route and step
+                         geometry is transferred encoded and decoded into numpy arrays.
+
+Generated artifacts (maps, route JSON, CSV) are kept in memory:
+
+    ADAS_ARTIFACT_MAX_MB          In-memory budget for artifacts (default: 256).
+    ADAS_ARTIFACT_DIR             Optional directory to also persist artifacts to, by content hash.
+    ADAS_ARTIFACT_MAX_PERSIST_MB  Optional size budget for ADAS_ARTIFACT_DIR.
+
+HTTP API (api_server.py):
+
+    ADAS_API_URL          Base URL of a running api_server.py. When set, the Streamlit UI sends
+                          route requests there instead of processing them in its own process.
+    ADAS_API_WORKERS      Routes processed at once by the API (default: 4).
+    ADAS_API_MAX_QUEUE    Requests allowed to wait for a worker before 503s are returned (default: 16).
+    ADAS_API_DEGRADE_AT   Queue depth from which maps are skipped to shed load (default: 8).
+
+Upstream rate limits (ratelimit.py), per service NOMINATIM, OSRM and OVERPASS:
+
+    ADAS_<SERVICE>_RATE         Requests per second, 0 for no limit (public defaults: Nominatim 1,
+                                OSRM 1, Overpass 2; no limits against a replay server).
+    ADAS_<SERVICE>_CONCURRENCY  Requests in flight to start with, 0 for no limit (Nominatim 1, OSRM 2, Overpass 2).
+    ADAS_<SERVICE>_MAX_CONCURRENCY  Ceiling the adaptive limit may probe up to while the server keeps
+                                answering (Nominatim 1, OSRM 4, Overpass 4; never below the start).
+    ADAS_RATE_LIMIT_DB          Optional SQLite file to share the rate limits between processes.
+
+Offline routing (local_router.py) on the OSM data in the osmnx cache:
+
+    ADAS_LOCAL_ROUTING     "off" (default), "fallback" to route locally when OSRM fails, or "always".
+    ADAS_LOCAL_GRAPH_DIR   Overpass JSON files the graph is built from (default: cache, the osmnx cache).
+    ADAS_LOCAL_GRAPH_FILE  Optional .npz snapshot of the built graph, written on first build and
+                           loaded instead of rebuilding afterwards.
+
+Road type classification (road_index.py):
+
+    ADAS_ROAD_INDEX        Optional regional road snapshot (GraphML, GeoParquet, .npz or a directory of
+                           Overpass JSON). Points inside its region are classified from it in one
+                           vectorized lookup per route instead of an Overpass download per step.
+    ADAS_DENSE_ROAD_CLASSES  "1" to classify every route vertex against ADAS_ROAD_INDEX and group
+                             those classes (map_matching.py) instead of one road type per step.
+    ADAS_PREFETCH_TILES      "1" to download the roads around a route's lookup points in tiles in the
+                             background (prefetch.py) as soon as the route is known, instead of per step.
+    ADAS_PREFETCH_TILE_DEG   Tile size in degrees (default: 0.01, about 1.1 x 0.7 km in Germany).
+    ADAS_PREFETCH_MAX_TILES  Tiles kept in memory (default: 512).
+
+Processed routes stored across processes and restarts (result_store.py):
+
+    ADAS_RESULT_DB         Optional SQLite file for complete process_route results.
+    ADAS_RESULT_MAX_MB     Size budget of the stored results (default: 512), least recently used dropped first.
+    ADAS_OSM_TIMESTAMP     Date of the OSM data behind OSRM and Overpass, e.g. 2026-10-01. Results stored
+                           under another value are dropped; without it the snapshot files' dates are used.
+"""
+import os
+import sys
+
+REPLAY_URL = os.environ.get("ADAS_REPLAY_URL") or None
+
+ARTIFACT_MAX_BYTES = int(float(os.environ.get("ADAS_ARTIFACT_MAX_MB", "256")) * 1024 * 1024)
+ARTIFACT_DIR = os.environ.get("ADAS_ARTIFACT_DIR") or None
+ARTIFACT_MAX_PERSIST_BYTES = (
+    int(float(os.environ["ADAS_ARTIFACT_MAX_PERSIST_MB"]) * 1024 * 1024)
+    if os.environ.get("ADAS_ARTIFACT_MAX_PERSIST_MB") else None
+)
+
+API_URL = (os.environ.get("ADAS_API_URL") or "").rstrip("/") or None
+API_WORKERS = int(os.environ.get("ADAS_API_WORKERS", "4"))
+API_MAX_QUEUE = int(os.environ.get("ADAS_API_MAX_QUEUE", "16"))
+API_DEGRADE_AT = int(os.environ.get("ADAS_API_DEGRADE_AT", "8"))
+
+OSRM_GEOMETRIES = os.environ.get("ADAS_OSRM_GEOMETRIES", "geojson")
+
+RATE_LIMIT_DB = os.environ.get("ADAS_RATE_LIMIT_DB") or None
+
+LOCAL_ROUTING = os.environ.get("ADAS_LOCAL_ROUTING", "off").lower()
+LOCAL_GRAPH_DIR = os.environ.get("ADAS_LOCAL_GRAPH_DIR", "cache")
+LOCAL_GRAPH_FILE = os.environ.get("ADAS_LOCAL_GRAPH_FILE") or None
+
+ROAD_INDEX = os.environ.get("ADAS_ROAD_INDEX") or None
+DENSE_ROAD_CLASSES = os.environ.get("ADAS_DENSE_ROAD_CLASSES", "").lower() in ("1", "true", "yes")
+
+PREFETCH_TILES = os.environ.get("ADAS_PREFETCH_TILES", "").lower() in ("1", "true", "yes")
+PREFETCH_TILE_DEG = float(os.environ.get("ADAS_PREFETCH_TILE_DEG", "0.01"))
+PREFETCH_MAX_TILES = int(os.environ.get("ADAS_PREFETCH_MAX_TILES", "512"))
+
+RESULT_DB = os.environ.get("ADAS_RESULT_DB") or None
+RESULT_MAX_BYTES = int(float(os.environ.get("ADAS_RESULT_MAX_MB", "512")) * 1024 * 1024)
+OSM_TIMESTAMP = os.environ.get("ADAS_OSM_TIMESTAMP") or None
+
+# Usage policies of the public servers: (requests per second, concurrent requests to start with,
+# most concurrent requests to probe up to). Nominatim's policy allows a single connection.
+PUBLIC_RATE_LIMITS = {
+    "nominatim": (1.0, 1, 1),
+    "osrm": (1.0, 2, 4),
+    "overpass": (2.0, 2, 4),
+}
+
+OSRM_BASE_URL = None
+NOMINATIM_URL = None
+OVERPASS_URL = None
+RATE_LIMITS = {}
+
+
+def use_services(replay_url=None):
+    """
+    (Re)configure the upstream endpoints.
+    :param replay_url: Base URL of a replay server to route every upstream call to, or None for the
+                       endpoints given by the environment (or the public servers).
+    """
+    global REPLAY_URL, OSRM_BASE_URL, NOMINATIM_URL, OVERPASS_URL, RATE_LIMITS
+    REPLAY_URL = replay_url.rstrip("/") if replay_url else None
+    if REPLAY_URL:
+        OSRM_BASE_URL = REPLAY_URL
+        NOMINATIM_URL = REPLAY_URL
+        OVERPASS_URL = f"{REPLAY_URL}/api"
+    else:
+        OSRM_BASE_URL = os.environ.get("ADAS_OSRM_URL", "https://router.project-osrm.org")
+        NOMINATIM_URL = os.environ.get("ADAS_NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+        OVERPASS_URL = os.environ.get("ADAS_OVERPASS_URL", "https://overpass-api.de/api")
+
+    RATE_LIMITS = {}
+    for service, (rate, concurrency, max_concurrency) in PUBLIC_RATE_LIMITS.items():
+        if REPLAY_URL:
+            rate, concurrency, max_concurrency = 0, 0, 0
+        prefix = f"ADAS_{service.upper()}"
+        concurrency = int(os.environ.get(f"{prefix}_CONCURRENCY", concurrency))
+        max_concurrency = int(os.environ.get(f"{prefix}_MAX_CONCURRENCY", max_concurrency))
+        RATE_LIMITS[service] = (
+            float(os.environ.get(f"{prefix}_RATE", rate)),
+            concurrency,
+            max(max_concurrency, concurrency),
+        )
+
+    if "osmnx" in sys.modules:
+        apply_osmnx_settings(sys.modules["osmnx"])
+
+
+def apply_osmnx_settings(ox):
+    """
+    Point osmnx at the configured Overpass endpoint and throttle its requests with the Overpass limiter.
+    Replayed responses are not written to the osmnx cache, so cache/ only ever holds real downloads.
+    """
+    import ratelimit
+
+    ox.settings.overpass_url = OVERPASS_URL
+    ox.settings.use_cache = REPLAY_URL is None
+    ox.settings.requests_kwargs = ratelimit.limiter("overpass").requests_kwargs()
+
+
+use_services(REPLAY_URL)
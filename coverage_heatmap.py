@@ -0,0 +1,345 @@
+"""
+Where in the road network each ADAS feature is available, aggregated over many routes.
+
+CoverageGrid bins route distance into square lat/lon cells (cell_deg, 0.005° by default,
+about 550 x 350 m in Germany). Every route is sampled along its geometry in pieces of a
+quarter cell; each piece adds its length to its cell's "route" column and to the column
+of every feature active on it, in one vectorized np.add.at per batch of routes. Only
+cells a route has passed are stored (sorted cell keys with one row of metres each), so
+a grid covering thousands of routes stays small.
+
+Grids built by separate workers or processes are combined with merge(), or saved with
+save() and merged later (--merge). The result is rendered as one folium HeatMap layer
+per feature, weighted by ADAS-active metres per cell, or exported per feature as an
+ESRI ASCII grid (.asc), which GDAL and QGIS read as a raster.
+
+Usage:
+    python coverage_heatmap.py --routes routes.txt --level "Level 2" --workers 4 --grid coverage.npz --map coverage.html
+    python coverage_heatmap.py --merge part1.npz part2.npz --grid coverage.npz --raster rasters/
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from road_index import METRES_PER_DEGREE
+from route_geometry import RouteGeometry
+from simulator import segment_ranges
+
+DEFAULT_CELL_DEG = 0.005
+
+# Column with all route distance, ADAS active or not
+ROUTE_COLUMN = "route"
+
+# Samples buffered before they are added into the grid
+MAX_PENDING_SAMPLES = 1000000
+
+
+def cell_keys(lat, lon, cell_deg):
+    """
+    :return: int64 key per point, the cell's row in the high and its column in the low 32 bits.
+    """
+    rows = np.floor(np.asarray(lat) / cell_deg).astype(np.int64)
+    columns = np.floor(np.asarray(lon) / cell_deg).astype(np.int64)
+    return (rows << 32) | (columns & 0xFFFFFFFF)
+
+
+def key_cells(keys):
+    """
+    :return: (rows, columns) of cell keys.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys >> 32, (keys & 0xFFFFFFFF).astype(np.uint32).astype(np.int32).astype(np.int64)
+
+
+class CoverageGrid:
+    def __init__(self, cell_deg=DEFAULT_CELL_DEG, features=()):
+        """
+        :param cell_deg: Cell size in degrees of latitude and longitude.
+        :param features: Feature columns to start with; others are added as routes bring them.
+        """
+        self.cell_deg = cell_deg
+        self.columns = [ROUTE_COLUMN] + [feature for feature in features if feature != ROUTE_COLUMN]
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros((0, len(self.columns)))
+        self.pending = []            # (keys, metres per column) of samples not yet added
+        self.pending_samples = 0
+        self.routes = 0
+
+    @property
+    def features(self):
+        return self.columns[1:]
+
+    def column(self, feature):
+        """
+        :return: Column index of feature, added if it is new.
+        """
+        if feature not in self.columns:
+            self.columns.append(feature)
+        return self.columns.index(feature)
+
+    def add_route(self, route_details):
+        """
+        Add a processed route (the process_route result: route_geometry and adas_segments).
+        """
+        geometry = RouteGeometry.from_any(route_details["route_geometry"])
+        adas_segments = route_details.get("adas_segments", [])
+        self.routes += 1
+        if len(geometry) < 2 or geometry.length_m <= 0:
+            return
+        ranges = segment_ranges(geometry, adas_segments)
+        cumulative = geometry.cumulative_distance
+
+        # Pieces of at most a quarter cell (in longitude, the narrower side), split at the ADAS segment ends
+        mid_lat = np.radians(geometry.coords[len(geometry) // 2, 1])
+        spacing = self.cell_deg * METRES_PER_DEGREE * max(np.cos(mid_lat), 0.01) / 4
+        bounds = np.unique(np.r_[
+            np.arange(0.0, geometry.length_m, spacing), geometry.length_m,
+            [start for _, start, _ in ranges], [end for _, _, end in ranges],
+        ])
+        lengths = np.diff(bounds)
+        middles = bounds[:-1] + lengths / 2
+        lat = np.interp(middles, cumulative, geometry.coords[:, 1])
+        lon = np.interp(middles, cumulative, geometry.coords[:, 0])
+
+        for number, _, _ in ranges:
+            for feature in adas_segments[number]["ADAS"]:
+                self.column(feature)
+        metres = np.zeros((len(lengths), len(self.columns)))
+        metres[:, 0] = lengths
+        for number, start_m, end_m in ranges:
+            first, last = np.searchsorted(bounds, [start_m, end_m])
+            for feature in adas_segments[number]["ADAS"]:
+                metres[first:last, self.columns.index(feature)] = lengths[first:last]
+        self.add_samples(cell_keys(lat, lon, self.cell_deg), metres)
+
+    def add_samples(self, keys, metres):
+        """
+        Queue metres (one row per sample, one column per self.columns entry at the time) for the cells keys.
+        """
+        self.pending.append((keys, metres))
+        self.pending_samples += len(keys)
+        if self.pending_samples >= MAX_PENDING_SAMPLES:
+            self.compact()
+
+    def compact(self):
+        """
+        Add the queued samples into the grid.
+        """
+        if not self.pending:
+            return
+        width = len(self.columns)
+        keys = np.concatenate([self.keys] + [keys for keys, _ in self.pending])
+        values = np.zeros((len(keys), width))
+        values[:len(self.keys), :self.values.shape[1]] = self.values
+        row = len(self.keys)
+        for sample_keys, metres in self.pending:
+            values[row:row + len(sample_keys), :metres.shape[1]] = metres
+            row += len(sample_keys)
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.values = np.zeros((len(self.keys), width))
+        np.add.at(self.values, inverse, values)
+        self.pending = []
+        self.pending_samples = 0
+
+    def merge(self, other):
+        """
+        Add another grid with the same cell size (e.g. from a parallel worker) into this one.
+        """
+        if other.cell_deg != self.cell_deg:
+            raise ValueError(f"Cannot merge grids with cell sizes {self.cell_deg} and {other.cell_deg}")
+        other.compact()
+        metres = np.zeros((len(other.keys), len(self.columns)))
+        for column, name in enumerate(other.columns):
+            index = self.column(name)
+            if index >= metres.shape[1]:
+                metres = np.pad(metres, ((0, 0), (0, index + 1 - metres.shape[1])))
+            metres[:, index] = other.values[:, column]
+        self.add_samples(other.keys, metres)
+        self.routes += other.routes
+        return self
+
+    def cells(self, feature=ROUTE_COLUMN):
+        """
+        :return: (lat, lon, metres) arrays of the cell centres with distance for feature.
+        """
+        self.compact()
+        if feature not in self.columns:
+            return np.zeros(0), np.zeros(0), np.zeros(0)
+        metres = self.values[:, self.columns.index(feature)]
+        keep = metres > 0
+        rows, columns = key_cells(self.keys[keep])
+        return (rows + 0.5) * self.cell_deg, (columns + 0.5) * self.cell_deg, metres[keep]
+
+    def share(self, feature):
+        """
+        :return: (lat, lon, share) of the cells routes passed: the fraction of their route distance with feature active.
+        """
+        self.compact()
+        route = self.values[:, 0]
+        keep = route > 0
+        rows, columns = key_cells(self.keys[keep])
+        if feature in self.columns:
+            share = self.values[keep, self.columns.index(feature)] / route[keep]
+        else:
+            share = np.zeros(int(keep.sum()))
+        return (rows + 0.5) * self.cell_deg, (columns + 0.5) * self.cell_deg, share
+
+    def summary(self):
+        """
+        :return: Dict with routes, cells and km per column.
+        """
+        self.compact()
+        return {
+            "routes": self.routes,
+            "cells": len(self.keys),
+            "km": {name: round(float(self.values[:, column].sum()) / 1000, 3) for column, name in enumerate(self.columns)},
+        }
+
+    # --- Output ---
+
+    def heatmap_layer(self, feature, name=None):
+        """
+        :return: folium HeatMap of feature's metres per cell, normalized to the busiest cell.
+        """
+        from folium.plugins import HeatMap
+
+        lat, lon, metres = self.cells(feature)
+        weights = metres / metres.max() if len(metres) else metres
+        return HeatMap(
+            np.column_stack([lat, lon, weights]).round(5).tolist(),
+            name=name or feature, radius=12, blur=10, min_opacity=0.2,
+        )
+
+    def render_map(self, path=None, features=None):
+        """
+        One map with a HeatMap layer per feature (default: every feature), switchable in the layer control.
+        :param path: Optional HTML file to save the map to.
+        :return: folium.Map
+        """
+        import folium
+
+        lat, lon, _ = self.cells()
+        center = [float(lat.mean()), float(lon.mean())] if len(lat) else [0, 0]
+        m = folium.Map(location=center, zoom_start=8 if len(lat) else 2)
+        for number, feature in enumerate(features or self.features):
+            layer = self.heatmap_layer(feature)
+            layer.control = True
+            layer.show = number == 0
+            layer.add_to(m)
+        folium.LayerControl(collapsed=False).add_to(m)
+        if path:
+            m.save(path)
+        return m
+
+    def raster(self, feature=ROUTE_COLUMN):
+        """
+        Dense array of feature's metres per cell over the grid's extent, north row first.
+        :return: (array, (west, south)) with the lower left corner of the extent in degrees.
+        """
+        self.compact()
+        rows, columns = key_cells(self.keys)
+        array = np.zeros((0, 0))
+        if not len(rows):
+            return array, (0.0, 0.0)
+        south, west = rows.min(), columns.min()
+        array = np.zeros((int(rows.max() - south) + 1, int(columns.max() - west) + 1))
+        if feature in self.columns:
+            array[rows.max() - rows, columns - west] = self.values[:, self.columns.index(feature)]
+        return array, (float(west * self.cell_deg), float(south * self.cell_deg))
+
+    def save_raster(self, path, feature=ROUTE_COLUMN):
+        """
+        Write feature's metres per cell as an ESRI ASCII grid; cells no route passed are nodata.
+        """
+        array, (west, south) = self.raster(feature)
+        route, _ = self.raster(ROUTE_COLUMN)
+        array = np.where(route > 0, array, -1)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(f"ncols {array.shape[1]}\nnrows {array.shape[0]}\n")
+            file.write(f"xllcorner {west!r}\nyllcorner {south!r}\ncellsize {self.cell_deg!r}\nNODATA_value -1\n")
+            np.savetxt(file, array, fmt="%.1f")
+
+    def save(self, path):
+        self.compact()
+        np.savez_compressed(
+            path, cell_deg=self.cell_deg, columns=np.array(self.columns), keys=self.keys, values=self.values, routes=self.routes
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            grid = cls(float(data["cell_deg"]), data["columns"].tolist())
+            grid.keys = data["keys"]
+            grid.values = data["values"]
+            grid.routes = int(data["routes"])
+        return grid
+
+
+def aggregate(pairs, autonomous_level, workers=4, cell_deg=DEFAULT_CELL_DEG):
+    """
+    Process routes on workers threads, each filling its own grid, and merge the grids.
+    :param pairs: (source, destination) pairs.
+    :return: CoverageGrid.
+    """
+    from main import process_route
+
+    def work(worker):
+        grid = CoverageGrid(cell_deg)
+        for source, destination in pairs[worker::workers]:
+            try:
+                grid.add_route(process_route(source, destination, autonomous_level, render_maps=False))
+            except ValueError as e:
+                print(f"Skipping {source} -> {destination}: {e}")
+        return grid
+
+    workers = max(1, min(workers, len(pairs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coverage") as pool:
+        grids = list(pool.map(work, range(workers)))
+    grid = CoverageGrid(cell_deg)
+    for worker_grid in grids:
+        grid.merge(worker_grid)
+    return grid
+
+
+def main(argv=None):
+    from exporter import read_route_list
+
+    parser = argparse.ArgumentParser(description="ADAS coverage heatmap over many routes.")
+    parser.add_argument("--routes", help='File with one "source;destination" pair per line.')
+    parser.add_argument("--merge", nargs="+", default=[], help="Grids saved with --grid to merge.")
+    parser.add_argument("--level", default="Level 2", help="Autonomous level.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cell", type=float, default=DEFAULT_CELL_DEG, help="Cell size in degrees.")
+    parser.add_argument("--grid", help="Save the grid (.npz) for later merging.")
+    parser.add_argument("--map", help="HTML file for the heatmap.")
+    parser.add_argument("--raster", help="Directory for one ESRI ASCII grid per feature.")
+    args = parser.parse_args(argv)
+    if not args.routes and not args.merge:
+        parser.error("give --routes and/or --merge")
+
+    grid = CoverageGrid(args.cell)
+    if args.routes:
+        grid.merge(aggregate(read_route_list(args.routes), args.level, args.workers, args.cell))
+    for path in args.merge:
+        grid.merge(CoverageGrid.load(path))
+
+    summary = grid.summary()
+    print(f"{summary['routes']} routes, {summary['cells']} cells")
+    for name, km in summary["km"].items():
+        print(f"  {name}: {km:.1f} km")
+    if args.grid:
+        grid.save(args.grid)
+    if args.map:
+        grid.render_map(args.map)
+        print(f"Heatmap -> {args.map}")
+    if args.raster:
+        os.makedirs(args.raster, exist_ok=True)
+        for name in grid.columns:
+            grid.save_raster(os.path.join(args.raster, f"{name}.asc"), name)
+        print(f"Rasters -> {args.raster}")
+
+
+if __name__ == "__main__":
+    main()
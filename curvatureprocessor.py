@@ -37,8 +37,9 @@ class CurvatureProcessor:
         if magnitude1 == 0 or magnitude2 == 0:
             return 0
 
-        # Calculate the angle in radians
-        angle_radians = math.acos(dot_product / (magnitude1 * magnitude2))
+        # Calculate the angle in radians (clamped, rounding can push collinear points past +/-1)
+        cos_angle = max(-1.0, min(1.0, dot_product / (magnitude1 * magnitude2)))
+        angle_radians = math.acos(cos_angle)
 
         # Calculate the cross product to determine the sign of the angle
         cross_product = vector1[0] * vector2[1] - vector1[1] * vector2[0]
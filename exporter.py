@@ -0,0 +1,397 @@
+"""
+Streaming columnar export of the pipeline outputs for analytics over many routes.
+
+Three layers are written, one file each, with typed columns and a LineString geometry:
+- steps:    the intersection tuples (start -> intermediate -> end point of each step),
+- groups:   the grouped highway / major / local road segments,
+- segments: the ADAS segments, with the feature list as a list<string> column.
+Group and segment geometries follow the route between their start and end when the
+route geometry is known, otherwise they are straight lines.
+
+Formats, chosen by the file extension or format argument:
+- "geoparquet" (.parquet, .geoparquet): WKB geometry with GeoParquet 1.0 metadata,
+- "arrow" (.arrow, .feather, .ipc): Arrow IPC file, geometry as a geoarrow.wkb column,
+- "flatgeobuf" (.fgb): written through pyogrio/GDAL.
+Rows are buffered per layer and flushed every row_group_size rows as one Parquet row
+group / IPC record batch, so memory stays the same however many routes are exported.
+
+Usage:
+    python exporter.py exports/ --routes routes.txt --level "Level 2" --format geoparquet
+routes.txt has one "source;destination" pair per line.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from route_geometry import RouteGeometry
+
+LAYERS = ("steps", "groups", "segments")
+
+FORMAT_EXTENSIONS = {"geoparquet": ".parquet", "arrow": ".arrow", "flatgeobuf": ".fgb"}
+
+# Rows per Parquet row group / IPC record batch
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+# Geometry points buffered per layer before a row group is written early (16 bytes each),
+# as group and segment geometries of long routes can have thousands of points per row
+MAX_BUFFERED_POINTS = 1000000
+
+
+def layer_schema(layer):
+    """
+    Arrow schema of one layer; the geometry column holds WKB.
+    """
+    import pyarrow as pa
+
+    location = [("start_lat", pa.float64()), ("start_lon", pa.float64()), ("end_lat", pa.float64()), ("end_lon", pa.float64())]
+    if layer == "steps":
+        fields = [
+            ("route_id", pa.string()), ("step", pa.int32()), ("leg", pa.int32()),
+            ("name", pa.string()), ("ref", pa.string()),
+            ("distance_m", pa.float64()), ("duration_s", pa.float64()),
+            ("modifier", pa.string()), ("maneuver_type", pa.string()),
+            ("road_type", pa.string()), ("road_change", pa.bool_()),
+        ]
+    elif layer == "groups":
+        fields = [
+            ("route_id", pa.string()), ("group", pa.int32()), ("road_type", pa.string()),
+            ("distance_km", pa.float64()), ("duration_min", pa.float64()),
+        ]
+    elif layer == "segments":
+        fields = [
+            ("route_id", pa.string()), ("segment", pa.int32()), ("road_type", pa.string()),
+            ("adas", pa.list_(pa.string())), ("distance_km", pa.float64()), ("duration_min", pa.float64()),
+            ("color", pa.string()),
+        ]
+    else:
+        raise ValueError(f"Unknown layer: {layer}")
+    return pa.schema([pa.field(name, dtype) for name, dtype in fields + location] + [pa.field("geometry", pa.binary())])
+
+
+def geo_metadata(bbox):
+    """
+    GeoParquet 1.0 "geo" metadata for the WKB geometry column.
+    """
+    column = {"encoding": "WKB", "geometry_types": ["LineString"]}
+    if bbox is not None:
+        column["bbox"] = [float(value) for value in bbox]
+    return json.dumps({"version": "1.0.0", "primary_column": "geometry", "columns": {"geometry": column}})
+
+
+class LayerWriter:
+    def __init__(self, path, layer, file_format, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        """
+        Buffered writer for one layer file.
+        :param path: Output file.
+        :param layer: "steps", "groups" or "segments".
+        :param file_format: "geoparquet", "arrow" or "flatgeobuf".
+        :param row_group_size: Rows buffered before they are written out (fewer if their geometries
+                               reach MAX_BUFFERED_POINTS first).
+        """
+        import pyarrow as pa
+
+        self.path = path
+        self.layer = layer
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.schema = layer_schema(layer)
+        self.columns = {name: [] for name in self.schema.names if name != "geometry"}
+        self.lines = []          # (K, 2) [lon, lat] arrays, one per buffered row
+        self.buffered_points = 0
+        self.rows = 0
+        self.bbox = None
+        self.writer = None
+        self.batches = None
+        self.thread = None
+        self.error = None
+
+        if file_format == "geoparquet":
+            import pyarrow.parquet as pq
+
+            self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        elif file_format == "arrow":
+            # Mark the geometry column as GeoArrow WKB, and keep GeoParquet-style metadata for geopandas
+            geometry = pa.field("geometry", pa.binary(), metadata={"ARROW:extension:name": "geoarrow.wkb", "ARROW:extension:metadata": "{}"})
+            self.schema = self.schema.set(self.schema.get_field_index("geometry"), geometry).with_metadata({"geo": geo_metadata(None)})
+            self.writer = pa.ipc.new_file(path, self.schema)
+        elif file_format == "flatgeobuf":
+            # GDAL pulls the batches from a bounded queue on its own thread, so they are written as they come
+            self.batches = queue.Queue(maxsize=2)
+            self.thread = threading.Thread(target=self.write_flatgeobuf, daemon=True)
+            self.thread.start()
+        else:
+            raise ValueError(f"Unknown export format: {file_format}")
+
+    def write_flatgeobuf(self):
+        import pyarrow as pa
+        from pyogrio.raw import write_arrow
+
+        def batches():
+            while True:
+                batch = self.batches.get()
+                if batch is None:
+                    return
+                yield batch
+
+        # GDAL has no list<string> field type for FlatGeobuf, so the ADAS list is written as text
+        schema = self.flatgeobuf_schema()
+        try:
+            reader = pa.RecordBatchReader.from_batches(schema, batches())
+            write_arrow(reader, self.path, layer=self.layer, driver="FlatGeobuf", geometry_name="geometry",
+                        geometry_type="LineString", crs="EPSG:4326")
+        except Exception as e:
+            self.error = e
+            # Drain the queue so append() never blocks on a writer that is gone
+            while self.batches.get() is not None:
+                pass
+
+    def flatgeobuf_schema(self):
+        import pyarrow as pa
+
+        schema = self.schema
+        if "adas" in schema.names:
+            schema = schema.set(schema.get_field_index("adas"), pa.field("adas", pa.string()))
+        geometry = pa.field("geometry", pa.binary(), metadata={"ARROW:extension:name": "geoarrow.wkb"})
+        return schema.set(schema.get_field_index("geometry"), geometry)
+
+    def append(self, row, line):
+        """
+        :param row: Dict of column values (all columns but geometry).
+        :param line: [lon, lat] points of the row's geometry.
+        """
+        for name, values in self.columns.items():
+            values.append(row[name])
+        # A copy, so a slice of a route's geometry does not keep the whole route alive until the flush
+        self.lines.append(np.array(line, dtype=np.float64).reshape(-1, 2))
+        self.buffered_points += len(self.lines[-1])
+        if len(self.lines) >= self.row_group_size or self.buffered_points >= MAX_BUFFERED_POINTS:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows as one row group / record batch.
+        """
+        import pyarrow as pa
+        import shapely
+
+        if not self.lines:
+            return
+        coords = np.concatenate(self.lines)
+        line_index = np.repeat(np.arange(len(self.lines)), [len(line) for line in self.lines])
+        geometry = shapely.to_wkb(shapely.linestrings(coords, indices=line_index))
+        low, high = coords.min(axis=0), coords.max(axis=0)
+        bbox = (low[0], low[1], high[0], high[1])
+        self.bbox = bbox if self.bbox is None else (
+            min(self.bbox[0], bbox[0]), min(self.bbox[1], bbox[1]), max(self.bbox[2], bbox[2]), max(self.bbox[3], bbox[3])
+        )
+
+        arrays = [pa.array(self.columns[name], type=self.schema.field(name).type) for name in self.columns]
+        arrays.append(pa.array(geometry, type=pa.binary()))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.file_format == "geoparquet":
+            self.writer.write_batch(batch, row_group_size=len(self.lines))
+        elif self.file_format == "arrow":
+            self.writer.write_batch(batch)
+        else:
+            if self.error is not None:
+                raise self.error
+            if "adas" in self.columns:
+                adas = pa.array([", ".join(features) for features in self.columns["adas"]], type=pa.string())
+                batch = batch.set_column(batch.schema.get_field_index("adas"), "adas", adas)
+            self.batches.put(pa.RecordBatch.from_arrays(batch.columns, schema=self.flatgeobuf_schema()))
+
+        self.rows += len(self.lines)
+        for values in self.columns.values():
+            values.clear()
+        self.lines = []
+        self.buffered_points = 0
+
+    def close(self):
+        self.flush()
+        if self.file_format == "geoparquet":
+            # The bounding box is only known at the end; the metadata goes into the file footer
+            self.writer.add_key_value_metadata({"geo": geo_metadata(self.bbox)})
+            self.writer.close()
+        elif self.file_format == "arrow":
+            self.writer.close()
+        else:
+            self.batches.put(None)
+            self.thread.join()
+            if self.error is not None:
+                raise self.error
+
+
+class RouteExporter:
+    def __init__(self, directory, file_format="geoparquet", row_group_size=DEFAULT_ROW_GROUP_SIZE, layers=LAYERS):
+        """
+        Export steps, road groups and ADAS segments of many routes into one file per layer,
+        <directory>/<layer><extension>.
+        :param file_format: "geoparquet", "arrow" or "flatgeobuf".
+        :param row_group_size: Rows per layer buffered before they are written out.
+        :param layers: Layers to write.
+        """
+        if file_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unknown export format: {file_format}")
+        os.makedirs(directory, exist_ok=True)
+        self.paths = {layer: os.path.join(directory, layer + FORMAT_EXTENSIONS[file_format]) for layer in layers}
+        self.writers = {
+            layer: LayerWriter(path, layer, file_format, row_group_size) for layer, path in self.paths.items()
+        }
+        self.routes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_step(self, route_id, index, entry):
+        """
+        :param entry: Intersection tuple (see routeprocessing.iter_intersection_data).
+        """
+        writer = self.writers.get("steps")
+        if writer is None:
+            return
+        start, end, intermediate = entry[0], entry[1], entry[2]
+        points = [start, intermediate, end] if intermediate is not None else [start, end]
+        writer.append({
+            "route_id": route_id, "step": index, "leg": entry[11],
+            "name": entry[3], "ref": entry[4], "distance_m": entry[5], "duration_s": entry[6],
+            "modifier": entry[7], "maneuver_type": entry[8], "road_type": entry[9], "road_change": bool(entry[10]),
+            "start_lat": start[0], "start_lon": start[1], "end_lat": end[0], "end_lon": end[1],
+        }, [(lon, lat) for lat, lon in points])
+
+    def add_group(self, route_id, index, group, route_geometry=None):
+        """
+        :param group: Grouped segment tuple (start, end, road_type, distance_km, duration_min).
+        """
+        writer = self.writers.get("groups")
+        if writer is None:
+            return
+        start, end, road_type, distance_km, duration_min = group
+        writer.append({
+            "route_id": route_id, "group": index, "road_type": road_type,
+            "distance_km": distance_km, "duration_min": duration_min,
+            "start_lat": start[0], "start_lon": start[1], "end_lat": end[0], "end_lon": end[1],
+        }, self.section(route_geometry, start, end))
+
+    def add_segment(self, route_id, index, seg, route_geometry=None):
+        """
+        :param seg: ADAS segment dict.
+        """
+        writer = self.writers.get("segments")
+        if writer is None:
+            return
+        start, end = seg["start"], seg["end"]
+        writer.append({
+            "route_id": route_id, "segment": index, "road_type": seg.get("road_type"), "adas": list(seg["ADAS"]),
+            "distance_km": seg["distance_km"], "duration_min": seg["duration_min"], "color": seg.get("color"),
+            "start_lat": start[0], "start_lon": start[1], "end_lat": end[0], "end_lon": end[1],
+        }, self.section(route_geometry, start, end))
+
+    @staticmethod
+    def section(route_geometry, start, end):
+        """
+        The route's points from start to end (both (lat, lon)), or the straight line without a route.
+        """
+        if route_geometry is None or len(route_geometry) == 0:
+            return [(start[1], start[0]), (end[1], end[0])]
+        start_idx = route_geometry.closest_index(*start)
+        end_idx = route_geometry.closest_index(*end)
+        if start_idx > end_idx:
+            start_idx, end_idx = end_idx, start_idx
+        if start_idx == end_idx:
+            return [(start[1], start[0]), (end[1], end[0])]
+        return route_geometry.coords[start_idx:end_idx + 1]
+
+    def add_route(self, route_id, intersection_data=(), groups=(), adas_segments=(), route_geometry=None):
+        """
+        Export one route's outputs, e.g. from process_route and compute_adas_segments.
+        """
+        route_geometry = RouteGeometry.from_any(route_geometry) if route_geometry is not None else None
+        for index, entry in enumerate(intersection_data):
+            self.add_step(route_id, index, entry)
+        for index, group in enumerate(groups):
+            self.add_group(route_id, index, group, route_geometry)
+        for index, seg in enumerate(adas_segments):
+            self.add_segment(route_id, index, seg, route_geometry)
+        self.routes += 1
+
+    def add_events(self, route_id, events):
+        """
+        Export a route while it streams, from main.iter_route_events.
+        :return: The "done" result, or None if the events ended without one.
+        """
+        route_geometry = None
+        counts = {"step": 0, "group": 0, "segment": 0}
+        result = None
+        for kind, payload in events:
+            if kind == "route":
+                route_geometry = RouteGeometry.from_any(payload["route_geometry"])
+            elif kind == "step":
+                self.add_step(route_id, counts[kind], payload)
+            elif kind == "group":
+                self.add_group(route_id, counts[kind], payload, route_geometry)
+            elif kind == "segment":
+                self.add_segment(route_id, counts[kind], payload, route_geometry)
+            elif kind == "done":
+                result = payload
+            if kind in counts:
+                counts[kind] += 1
+        self.routes += 1
+        return result
+
+    def close(self):
+        """
+        Write the remaining rows and finish the files.
+        :return: Dict of layer -> (path, rows written).
+        """
+        written = {}
+        for layer, writer in self.writers.items():
+            writer.close()
+            written[layer] = (writer.path, writer.rows)
+        return written
+
+
+def read_route_list(path):
+    """
+    :return: List of (source, destination) pairs from "source;destination" lines (# starts a comment).
+    """
+    pairs = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                source, destination = (part.strip() for part in line.split(";", 1))
+                pairs.append((source, destination))
+    return pairs
+
+
+def main(argv=None):
+    from main import iter_route_events
+
+    parser = argparse.ArgumentParser(description="Export steps, road groups and ADAS segments of many routes.")
+    parser.add_argument("directory", help="Output directory, one file per layer.")
+    parser.add_argument("--routes", required=True, help='File with one "source;destination" pair per line.')
+    parser.add_argument("--level", default="Level 2", help="Autonomous level.")
+    parser.add_argument("--format", default="geoparquet", choices=sorted(FORMAT_EXTENSIONS))
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE)
+    args = parser.parse_args(argv)
+
+    with RouteExporter(args.directory, args.format, args.row_group_size) as exporter:
+        for number, (source, destination) in enumerate(read_route_list(args.routes)):
+            route_id = f"{number}:{source}->{destination}"
+            try:
+                exporter.add_events(route_id, iter_route_events(source, destination, args.level))
+            except ValueError as e:
+                print(f"Skipping {source} -> {destination}: {e}")
+    for layer, writer in exporter.writers.items():
+        print(f"{layer}: {writer.rows} rows -> {writer.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Vectorized simulation of many vehicles on a set of processed routes.
+
+Every route is turned into an ADAS timeline: the distances where the set of active
+features changes, and for each interval between them a bitmask of the active features
+and the road type. All routes are laid end to end on one distance axis (each route
+starts at its own base offset), so the timelines of all routes form one sorted array.
+Vehicle state is held in NumPy arrays (route, distance travelled, base speed, speed
+profile, departure time), and one step() advances all of them at once: the interval
+of every vehicle is one np.searchsorted on the flat timeline, its speed a lookup in
+the profile table, and the feature-active time per vehicle and feature a masked
+add of the tick. A fleet of 10,000 vehicles takes about a millisecond per tick.
+
+Accounting is per tick: a vehicle's interval is taken where it is at the start of the
+tick, so ticks should be short compared to the ADAS segments (seconds, not minutes).
+
+Usage:
+    fleet = FleetSimulator(routes, route_index=np.arange(1000) % len(routes),
+                           departure_s=np.random.uniform(0, 3600, 1000),
+                           profile=profile_names, profiles={"cautious": {"Highway": 0.85, "default": 0.95}})
+    fleet.run(dt=1.0)
+    fleet.summary()["feature_time_s"]   # (vehicles, features) seconds with each feature active
+"""
+import numpy as np
+
+from route_geometry import RouteGeometry
+from simulator import segment_ranges
+
+# Road type of the timeline intervals outside every ADAS segment
+NO_SEGMENT = "Other"
+
+# Distance left between consecutive routes on the shared axis, so a route's end never falls into the next route
+ROUTE_GAP_M = 1.0
+
+
+class FleetSimulator:
+    def __init__(self, routes, route_index, departure_s=0.0, speed_kmph=None, profile=None, profiles=None):
+        """
+        :param routes: process_route results (route_geometry, adas_segments, estimated_duration_minutes).
+        :param route_index: Per vehicle, the index of its route in routes.
+        :param departure_s: Departure time per vehicle (or one for all), in simulated seconds.
+        :param speed_kmph: Base speed per vehicle (or one for all); defaults to each route's average speed.
+        :param profile: Profile name per vehicle (or one for all), see profiles; None drives at the base speed.
+        :param profiles: Dict of profile name -> {road type: speed factor, "default": factor for the rest},
+                         e.g. {"truck": {"Highway": 0.7, "default": 0.9}}.
+        """
+        self.routes = [RouteGeometry.from_any(route["route_geometry"]) for route in routes]
+        self.build_timelines(routes)
+
+        self.route_index = np.asarray(route_index, dtype=np.int64)
+        count = len(self.route_index)
+        self.departure_s = np.broadcast_to(np.asarray(departure_s, dtype=np.float64), (count,)).copy()
+        if speed_kmph is None:
+            self.speed_mps = self.route_speed_mps[self.route_index]
+        else:
+            self.speed_mps = np.broadcast_to(np.asarray(speed_kmph, dtype=np.float64) / 3.6, (count,)).copy()
+        self.build_profiles(profile, profiles or {}, count)
+
+        self.time_s = 0.0
+        self.distance_m = np.zeros(count)
+        self.arrival_s = np.full(count, np.nan)
+        self.feature_time_s = np.zeros((count, len(self.features)))
+        self.assisted_time_s = np.zeros(count)
+        self.driving_time_s = np.zeros(count)
+        self.transitions = np.zeros(count, dtype=np.int64)   # changes of the active feature set
+        self.last_mask = np.zeros(count, dtype=np.int64)
+
+    def build_timelines(self, routes):
+        """
+        Flatten the ADAS timelines of all routes onto one distance axis.
+        """
+        features = sorted({feature for route in routes for seg in route.get("adas_segments", []) for feature in seg["ADAS"]})
+        if len(features) > 63:
+            raise ValueError("At most 63 distinct ADAS features are supported")
+        self.features = features
+        feature_bits = {feature: 1 << bit for bit, feature in enumerate(features)}
+        road_types = [NO_SEGMENT]
+
+        lengths = np.array([geometry.length_m for geometry in self.routes])
+        self.route_length_m = lengths
+        self.route_base_m = np.r_[0.0, np.cumsum(lengths + ROUTE_GAP_M)[:-1]]
+        self.route_speed_mps = np.array([
+            length / (route.get("estimated_duration_minutes", 0) * 60) if route.get("estimated_duration_minutes") else 50 / 3.6
+            for route, length in zip(routes, lengths)
+        ])
+
+        bounds, masks, types = [], [], []
+        for route, geometry, base, length in zip(routes, self.routes, self.route_base_m, lengths):
+            ranges = segment_ranges(geometry, route.get("adas_segments", []))
+            route_bounds = np.unique(np.r_[0.0, length, [start for _, start, _ in ranges], [end for _, _, end in ranges]])
+            route_masks = np.zeros(len(route_bounds), dtype=np.int64)
+            route_types = np.zeros(len(route_bounds), dtype=np.int64)
+            for number, start_m, end_m in ranges:
+                seg = route["adas_segments"][number]
+                first, last = np.searchsorted(route_bounds, [start_m, end_m])
+                for feature in seg["ADAS"]:
+                    route_masks[first:last] |= feature_bits[feature]
+                # Level 0 segments have no road type
+                road_type = seg.get("road_type") or NO_SEGMENT
+                if road_type not in road_types:
+                    road_types.append(road_type)
+                covered = route_types[first:last]
+                covered[covered == 0] = road_types.index(road_type)
+            # The last bound is the route's end; past it (the gap) nothing is active
+            bounds.append(route_bounds + base)
+            masks.append(route_masks)
+            types.append(route_types)
+        self.bounds_m = np.concatenate(bounds) if bounds else np.zeros(1)
+        self.interval_mask = np.concatenate(masks) if masks else np.zeros(1, dtype=np.int64)
+        self.interval_type = np.concatenate(types) if types else np.zeros(1, dtype=np.int64)
+        self.road_types = road_types
+        self.feature_bits = np.array([feature_bits[feature] for feature in features], dtype=np.int64)
+
+    def build_profiles(self, profile, profiles, count):
+        """
+        Speed factor table (profile, road type), row 0 being the plain base speed.
+        """
+        names = [None] + sorted(profiles)
+        table = np.ones((len(names), len(self.road_types)))
+        for row, name in enumerate(names[1:], 1):
+            factors = profiles[name]
+            for column, road_type in enumerate(self.road_types):
+                table[row, column] = factors.get(road_type, factors.get("default", 1.0))
+        self.profile_names = names
+        self.profile_table = table
+        if profile is None or isinstance(profile, str):
+            self.profile_index = np.full(count, names.index(profile), dtype=np.int64)
+        else:
+            self.profile_index = np.array([names.index(name) for name in profile], dtype=np.int64)
+
+    @property
+    def vehicle_count(self):
+        return len(self.route_index)
+
+    def intervals(self):
+        """
+        :return: Index into the flat timeline of every vehicle's current interval.
+        """
+        position = self.route_base_m[self.route_index] + self.distance_m
+        return np.searchsorted(self.bounds_m, position, side="right") - 1
+
+    def step(self, dt):
+        """
+        Advance every vehicle by dt simulated seconds.
+        :return: Number of vehicles still on the road.
+        """
+        start, end = self.time_s, self.time_s + dt
+        remaining = self.route_length_m[self.route_index] - self.distance_m
+        # Seconds each vehicle drives in this tick: none before its departure or after its arrival
+        moving = np.clip(end - np.maximum(start, self.departure_s), 0.0, dt)
+        moving[remaining <= 0] = 0.0
+
+        interval = self.intervals()
+        mask = np.where(moving > 0, self.interval_mask[interval], 0)
+        speed = self.speed_mps * self.profile_table[self.profile_index, self.interval_type[interval]]
+        travelled = np.minimum(speed * moving, remaining)
+        # Time actually driven, shorter than moving for vehicles arriving during the tick
+        driven = np.divide(travelled, speed, out=np.zeros_like(travelled), where=speed > 0)
+
+        active = (mask[:, None] & self.feature_bits[None, :]) != 0
+        self.feature_time_s += active * driven[:, None]
+        self.assisted_time_s += np.where(mask != 0, driven, 0.0)
+        self.driving_time_s += driven
+        on_road = moving > 0
+        self.transitions += on_road & (mask != self.last_mask)
+        self.last_mask = np.where(on_road, mask, self.last_mask)
+
+        self.distance_m += travelled
+        arrived = np.isnan(self.arrival_s) & (self.distance_m >= self.route_length_m[self.route_index])
+        self.arrival_s[arrived] = np.maximum(start, self.departure_s[arrived]) + driven[arrived]
+        self.transitions += arrived & (self.last_mask != 0)   # features end on arrival
+        self.last_mask[arrived] = 0
+        self.time_s = end
+        return int(np.count_nonzero(np.isnan(self.arrival_s)))
+
+    def run(self, dt=1.0, until_s=None, callback=None):
+        """
+        Step until every vehicle has arrived (or until_s).
+        :param callback: Optional callable(fleet) after every step, e.g. to draw positions.
+        :return: Number of steps.
+        """
+        steps = 0
+        while until_s is None or self.time_s < until_s:
+            on_road = self.step(dt)
+            steps += 1
+            if callback is not None:
+                callback(self)
+            if on_road == 0:
+                break
+        return steps
+
+    def positions(self):
+        """
+        :return: (lat, lon) arrays of all vehicles, interpolated on their route geometry.
+        """
+        lat = np.empty(self.vehicle_count)
+        lon = np.empty(self.vehicle_count)
+        for number, geometry in enumerate(self.routes):
+            on_route = np.flatnonzero(self.route_index == number)
+            if not len(on_route) or not len(geometry):
+                continue
+            cumulative = geometry.cumulative_distance
+            lon[on_route] = np.interp(self.distance_m[on_route], cumulative, geometry.coords[:, 0])
+            lat[on_route] = np.interp(self.distance_m[on_route], cumulative, geometry.coords[:, 1])
+        return lat, lon
+
+    def summary(self):
+        """
+        :return: Dict of per-vehicle arrays (route_index, departure_s, arrival_s, distance_m, driving_time_s,
+                 assisted_time_s, transitions, feature_time_s with one column per feature), and features.
+        """
+        return {
+            "features": list(self.features),
+            "route_index": self.route_index,
+            "departure_s": self.departure_s,
+            "arrival_s": self.arrival_s,
+            "distance_m": self.distance_m,
+            "driving_time_s": self.driving_time_s,
+            "assisted_time_s": self.assisted_time_s,
+            "transitions": self.transitions,
+            "feature_time_s": self.feature_time_s,
+        }
@@ -0,0 +1,294 @@
+"""
+Differential harness: the reference pipeline against alternative engines, on recorded routes.
+
+Every engine turns a recorded route (an OSRM response plus the road type recorded for
+each step, the benchmark fixtures in fixtures/routes/) into the pipeline's outputs for an
+autonomous level:
+
+    intersection_data   classified steps (extract_intersection_data)
+    groups              (grouped_highways, grouped_major_roads, grouped_local_roads)
+    combined            CombinedRoadGrouper segments
+    adas_segments       ADAS segment dicts, with color
+
+ReferenceEngine runs the current implementation stage by stage, as main.compute_adas_segments
+does. An alternative engine returns whichever of these outputs it produces; each one is
+diffed against the reference with the given Tolerances (floats, segment boundaries in
+metres, order) and both engines are timed with benchmark.measure, reported side by side.
+The process exits with 1 if any output differs beyond the tolerances, so a faster engine
+can land with proof that drivers see the same segments.
+
+Built-in alternatives: "stream" (iter_intersection_data and ADASSegmentStream, the
+streaming path of iter_route_events). Others are loaded as module:attribute, an object or
+class with a name and run(steps, road_types, autonomous_level) -> dict of outputs. An
+engine whose ADAS segments come in another order than the reference's (e.g. in the order
+they become final) sets ordered = False, and its segments are compared by position.
+
+Usage:
+    python golden_harness.py                                  # reference vs stream, all fixtures and levels
+    python golden_harness.py --engine fast_engine:FastEngine --boundary-m 5 --float-tol 0.001
+    python golden_harness.py --corpus recorded/ --levels "Level 2" --unordered
+"""
+import argparse
+import glob
+import gzip
+import importlib
+import json
+import math
+import os
+import sys
+
+from adas_processor_level0 import ADASProcessorLevel0
+from adas_processor_level1 import ADASProcessorLevel1
+from adas_processor_level2 import ADASProcessorLevel2
+from adas_stream import ADASSegmentStream
+from add_adas_markers import get_color_for_adas
+from benchmark import ROUTE_FIXTURE_DIR, measure, replay_classifier
+from combined_road_grouper import CombinedRoadGrouper
+from identify_highways import HighwayIdentifier
+from identify_local_roads import LocalRoadIdentifier
+from identify_major_roads import MajorRoadIdentifier
+from routeprocessing import extract_intersection_data, iter_intersection_data, route_steps
+
+LEVELS = ("Level 0", "Level 1", "Level 2")
+OUTPUTS = ("intersection_data", "groups", "combined", "adas_segments")
+
+# Differences listed per output before the rest is only counted
+MAX_REPORTED_DIFFS = 5
+
+
+class Tolerances:
+    def __init__(self, float_abs=1e-9, float_rel=1e-9, boundary_m=0.0, unordered=False):
+        """
+        :param float_abs: Absolute tolerance for numbers (distance_km, duration_min, metres, seconds).
+        :param float_rel: Relative tolerance for numbers.
+        :param boundary_m: Distance two (lat, lon) points may be apart and still count as the same
+                           boundary (segment and group starts and ends, step coordinates).
+        :param unordered: Compare lists of ADAS segments as sets, sorted by position, e.g. for engines
+                          that emit segments in the order they become final.
+        """
+        self.float_abs = float_abs
+        self.float_rel = float_rel
+        self.boundary_m = boundary_m
+        self.unordered = unordered
+
+
+def haversine_m(coord1, coord2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*coord1, *coord2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_coordinate(value):
+    return isinstance(value, (list, tuple)) and len(value) == 2 and all(is_number(part) for part in value)
+
+
+def diff(reference, other, tolerances, path="", diffs=None):
+    """
+    Recursively compare two outputs.
+    :return: List of "path: reference != other" strings, empty when equal within the tolerances.
+    """
+    diffs = [] if diffs is None else diffs
+    if is_coordinate(reference) and is_coordinate(other):
+        distance = haversine_m(reference, other)
+        if distance > tolerances.boundary_m and not all(
+            math.isclose(a, b, rel_tol=tolerances.float_rel, abs_tol=tolerances.float_abs) for a, b in zip(reference, other)
+        ):
+            diffs.append(f"{path}: {tuple(reference)} != {tuple(other)} ({distance:.1f} m apart)")
+    elif is_number(reference) and is_number(other):
+        if not math.isclose(reference, other, rel_tol=tolerances.float_rel, abs_tol=tolerances.float_abs):
+            diffs.append(f"{path}: {reference!r} != {other!r}")
+    elif isinstance(reference, dict) and isinstance(other, dict):
+        for key in sorted(set(reference) | set(other), key=str):
+            if key not in other:
+                diffs.append(f"{path}.{key}: missing")
+            elif key not in reference:
+                diffs.append(f"{path}.{key}: unexpected {other[key]!r}")
+            else:
+                diff(reference[key], other[key], tolerances, f"{path}.{key}", diffs)
+    elif isinstance(reference, (list, tuple)) and isinstance(other, (list, tuple)):
+        if len(reference) != len(other):
+            diffs.append(f"{path}: {len(reference)} items != {len(other)} items")
+        for index, (a, b) in enumerate(zip(reference, other)):
+            diff(a, b, tolerances, f"{path}[{index}]", diffs)
+    elif reference != other:
+        diffs.append(f"{path}: {reference!r} != {other!r}")
+    return diffs
+
+
+def segment_order(seg):
+    # Level 0 segments have no road type
+    return tuple(seg["start"]), tuple(seg["end"]), seg.get("road_type", "")
+
+
+def diff_outputs(reference, other, tolerances, ordered=True):
+    """
+    :param ordered: False compares the ADAS segments unordered whatever the tolerances say.
+    :return: Dict of output name -> list of differences, for the outputs both engines produced.
+    """
+    results = {}
+    for name in OUTPUTS:
+        if name not in reference or name not in other:
+            continue
+        a, b = reference[name], other[name]
+        if name == "adas_segments" and (tolerances.unordered or not ordered):
+            a, b = sorted(a, key=segment_order), sorted(b, key=segment_order)
+        results[name] = diff(a, b, tolerances, name)
+    return results
+
+
+class ReferenceEngine:
+    name = "reference"
+    ordered = True
+
+    def run(self, steps, road_types, autonomous_level):
+        intersection_data = tuple(extract_intersection_data(steps, classify=replay_classifier(road_types)))
+        grouped_highways = HighwayIdentifier(intersection_data).group_highways()
+        grouped_major_roads = MajorRoadIdentifier(intersection_data).group_major_roads()
+        grouped_local_roads = LocalRoadIdentifier(intersection_data).group_local_roads()
+        combined_segments = CombinedRoadGrouper(grouped_highways, grouped_major_roads).combine()
+        if autonomous_level == "Level 0":
+            adas_segments = ADASProcessorLevel0(combined_segments).process_adas()
+        elif autonomous_level == "Level 1":
+            adas_segments = ADASProcessorLevel1(grouped_highways, grouped_major_roads).process_adas()
+        else:
+            adas_segments = ADASProcessorLevel2(grouped_highways, grouped_major_roads, grouped_local_roads).process_adas()
+        for seg in adas_segments:
+            seg["color"] = get_color_for_adas(seg["ADAS"])
+        return {
+            "intersection_data": intersection_data,
+            "groups": (grouped_highways, grouped_major_roads, grouped_local_roads),
+            "combined": combined_segments,
+            "adas_segments": adas_segments,
+        }
+
+
+class StreamEngine:
+    name = "stream"
+    # Segments are emitted as their group closes, not grouped by road class as in the batch processors
+    ordered = False
+
+    def run(self, steps, road_types, autonomous_level):
+        stream = ADASSegmentStream(autonomous_level)
+        intersection_data = []
+        events = []
+        for entry in iter_intersection_data(steps, classify=replay_classifier(road_types)):
+            intersection_data.append(entry)
+            events.extend(stream.add_entry(entry))
+        events.extend(stream.finish())
+        return {
+            "intersection_data": tuple(intersection_data),
+            # The groups of the ("group", ...) events, split by the identifier that closed them
+            "groups": tuple(stream.groups[kind] for kind in ("highway", "major", "local")),
+            "adas_segments": [payload for kind, payload in events if kind == "segment"],
+        }
+
+
+BUILTIN_ENGINES = {"reference": ReferenceEngine, "stream": StreamEngine}
+
+
+def load_engine(spec):
+    """
+    :param spec: A built-in engine name, or module:attribute naming an engine object or class.
+    """
+    if spec in BUILTIN_ENGINES:
+        return BUILTIN_ENGINES[spec]()
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Engine {spec!r} is neither built in ({', '.join(BUILTIN_ENGINES)}) nor module:attribute")
+    engine = getattr(importlib.import_module(module_name), attribute)
+    return engine() if isinstance(engine, type) else engine
+
+
+def load_corpus(directory=ROUTE_FIXTURE_DIR):
+    """
+    :return: List of (name, steps, road_types) of the recorded routes (*.json.gz fixtures) in directory.
+    """
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            fixture = json.load(file)
+        steps, _ = route_steps(fixture["osrm"]["routes"][0])
+        name = fixture.get("name") or os.path.basename(path).split(".")[0]
+        corpus.append((name, steps, fixture["road_types"]))
+    return corpus
+
+
+def compare(engines, corpus, levels=LEVELS, tolerances=None, min_time=0.2):
+    """
+    Run every engine on every route and level, diff it against the reference and time both.
+    :param engines: Alternative engines; the reference is always run.
+    :return: List of dicts with route, level, engine, reference_ops, engine_ops and diffs (output -> differences).
+    """
+    tolerances = tolerances or Tolerances()
+    reference = ReferenceEngine()
+    rows = []
+    for name, steps, road_types in corpus:
+        for level in levels:
+            expected = reference.run(steps, road_types, level)
+            reference_ops = measure(lambda: reference.run(steps, road_types, level), min_time=min_time)["ops_per_s"]
+            for engine in engines:
+                actual = engine.run(steps, road_types, level)
+                rows.append({
+                    "route": name,
+                    "level": level,
+                    "engine": engine.name,
+                    "reference_ops": reference_ops,
+                    "engine_ops": measure(lambda: engine.run(steps, road_types, level), min_time=min_time)["ops_per_s"],
+                    "diffs": diff_outputs(expected, actual, tolerances, getattr(engine, "ordered", True)),
+                })
+    return rows
+
+
+def print_report(rows):
+    """
+    :return: Number of rows with differences.
+    """
+    print(f"{'route':<16}{'level':<9}{'engine':<14}{'reference ops/s':>16}{'engine ops/s':>14}{'speedup':>9}  outputs")
+    failed = 0
+    for row in rows:
+        differing = {name: found for name, found in row["diffs"].items() if found}
+        status = ", ".join(f"{name} ({len(found)} diffs)" for name, found in differing.items()) or \
+            f"{len(row['diffs'])} equal"
+        speedup = row["engine_ops"] / row["reference_ops"] if row["reference_ops"] else 0.0
+        print(f"{row['route']:<16}{row['level']:<9}{row['engine']:<14}{row['reference_ops']:>16,.1f}"
+              f"{row['engine_ops']:>14,.1f}{speedup:>8.2f}x  {status}")
+        for name, found in differing.items():
+            for line in found[:MAX_REPORTED_DIFFS]:
+                print(f"    {line}")
+            if len(found) > MAX_REPORTED_DIFFS:
+                print(f"    ... {len(found) - MAX_REPORTED_DIFFS} more in {name}")
+        failed += bool(differing)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff alternative pipeline engines against the reference on recorded routes.")
+    parser.add_argument("--engine", action="append", help="Engine to compare: built-in name or module:attribute (default: stream).")
+    parser.add_argument("--corpus", default=ROUTE_FIXTURE_DIR, help="Directory of recorded route fixtures (*.json.gz).")
+    parser.add_argument("--levels", nargs="+", default=list(LEVELS))
+    parser.add_argument("--float-tol", type=float, default=1e-9, help="Absolute tolerance for numbers.")
+    parser.add_argument("--rel-tol", type=float, default=1e-9, help="Relative tolerance for numbers.")
+    parser.add_argument("--boundary-m", type=float, default=0.0, help="Distance boundaries may move, in metres.")
+    parser.add_argument("--unordered", action="store_true", help="Ignore the order of the ADAS segments.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds each engine is timed per route and level.")
+    args = parser.parse_args(argv)
+
+    engines = [load_engine(spec) for spec in (args.engine or ["stream"])]
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        parser.error(f"no route fixtures in {args.corpus}")
+    tolerances = Tolerances(args.float_tol, args.rel_tol, args.boundary_m, args.unordered)
+    failed = print_report(compare(engines, corpus, args.levels, tolerances, args.min_time))
+    if failed:
+        print(f"\n{failed} route/level/engine combination(s) differ from the reference.")
+        return 1
+    print("\nAll engines match the reference.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,9 @@
 import csv
 
 class MajorRoadIdentifier:
-    def __init__(self, intersection_data):
+    def __init__(self, intersection_data=()):
         self.intersection_data = intersection_data
+        self.current_group = None
 
     def group_major_roads(self):
         """
@@ -17,63 +18,75 @@ class MajorRoadIdentifier:
             return []
 
         grouped = []
-        current_group = None
+        self.current_group = None
 
         for entry in self.intersection_data:
-            start_coords = entry[0]
-            end_coords = entry[1]
-            modifier = entry[7]
-            maneuver_type = entry[8]
-            road_type = entry[9]
-            distance = entry[5]
-            duration = entry[6]
-
-            # Check if all conditions to be in a group are met
-            in_group = (
-                road_type == "Major Road" and
-                maneuver_type != "turn" and
-                modifier in ["slight left", "slight right", "straight"]
-            )
-
-            if in_group:
-                if current_group is None:
-                    # Start a new group
-                    current_group = {
-                        "start": start_coords,
-                        "end": end_coords,
-                        "road_type": road_type,
-                        "distance": distance,
-                        "duration": duration
-                    }
-                else:
-                    # Extend the current group
-                    current_group["end"] = end_coords
-                    current_group["distance"] += distance
-                    current_group["duration"] += duration
-            else:
-                if current_group is not None:
-                    # End the current group (convert units)
-                    grouped.append((
-                        current_group["start"],
-                        current_group["end"],
-                        current_group["road_type"],
-                        round(current_group["distance"] / 1000, 3),   # km
-                        round(current_group["duration"] / 60, 2)      # min
-                    ))
-                    current_group = None
+            closed_group = self.add_entry(entry)
+            if closed_group is not None:
+                grouped.append(closed_group)
 
         # Add the last group if it exists
-        if current_group is not None:
-            grouped.append((
-                current_group["start"],
-                current_group["end"],
-                current_group["road_type"],
-                round(current_group["distance"] / 1000, 3),   # km
-                round(current_group["duration"] / 60, 2)      # min
-            ))
+        closed_group = self.finish()
+        if closed_group is not None:
+            grouped.append(closed_group)
 
         return grouped
 
+    def add_entry(self, entry):
+        """
+        Feed the next intersection tuple, for grouping a route while it is still being classified.
+        Returns the grouped segment this entry closes, or None.
+        """
+        start_coords = entry[0]
+        end_coords = entry[1]
+        modifier = entry[7]
+        maneuver_type = entry[8]
+        road_type = entry[9]
+        distance = entry[5]
+        duration = entry[6]
+
+        # Check if all conditions to be in a group are met
+        in_group = (
+            road_type == "Major Road" and
+            maneuver_type != "turn" and
+            modifier in ["slight left", "slight right", "straight"]
+        )
+
+        if in_group:
+            if self.current_group is None:
+                # Start a new group
+                self.current_group = {
+                    "start": start_coords,
+                    "end": end_coords,
+                    "road_type": road_type,
+                    "distance": distance,
+                    "duration": duration
+                }
+            else:
+                # Extend the current group
+                self.current_group["end"] = end_coords
+                self.current_group["distance"] += distance
+                self.current_group["duration"] += duration
+            return None
+        # Do not start a new group until all conditions are met again
+        return self.finish()
+
+    def finish(self):
+        """
+        End the current group, if any, and return it as a grouped segment (converting units).
+        """
+        if self.current_group is None:
+            return None
+        group = self.current_group
+        self.current_group = None
+        return (
+            group["start"],
+            group["end"],
+            group["road_type"],
+            round(group["distance"] / 1000, 3),   # km
+            round(group["duration"] / 60, 2)      # min
+        )
+
     # def save_grouped_to_csv(self, grouped_data, output_csv):
     #     with open(output_csv, "w", newline="") as file:
     #         writer = csv.writer(file)
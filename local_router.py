@@ -0,0 +1,526 @@
+"""
+Offline routing on the OSM data already in the osmnx cache.
+
+The Overpass responses osmnx caches (cache/*.json) hold the ways and nodes around
+every road type lookup made so far. LocalRoadGraph merges them into one directed
+road graph in compressed sparse row form (numpy arrays: per node an offset into the
+edge arrays, per edge its target node, length, travel time and way), built once per
+process. Queries run A* on travel time with a straight-line heuristic at the
+graph's top speed, and come back in the shape of an OSRM route response, with the
+steps extract_intersection_data expects, so the rest of the pipeline is unchanged.
+
+The graph only covers the areas looked up before, in separate patches; a query
+whose ends are not near the same connected patch raises ValueError.
+
+Enable with ADAS_LOCAL_ROUTING=fallback (when OSRM fails) or =always; see config.py.
+Set ADAS_LOCAL_GRAPH_FILE to keep the built graph as a .npz snapshot between runs.
+"""
+import glob
+import heapq
+import json
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+import config
+
+EARTH_RADIUS_M = 6371000.0
+
+# Drivable highway types and their default speed in km/h, used when a way has no usable maxspeed
+DEFAULT_SPEEDS_KMH = {
+    "motorway": 120, "motorway_link": 60,
+    "trunk": 100, "trunk_link": 50,
+    "primary": 80, "primary_link": 50,
+    "secondary": 70, "secondary_link": 40,
+    "tertiary": 60, "tertiary_link": 40,
+    "unclassified": 50, "road": 40,
+    "residential": 30, "living_street": 10,
+}
+
+# Furthest a query point may be from the graph, in metres
+MAX_SNAP_M = 1000.0
+
+# OSRM-style turn modifiers by absolute turn angle (degrees, upper bound)
+TURN_MODIFIERS = [(20, "straight"), (60, "slight"), (120, ""), (170, "sharp")]
+
+
+def parse_maxspeed(value):
+    """
+    :param value: OSM maxspeed tag, e.g. "50", "30 mph" or "DE:urban".
+    :return: Speed in km/h, or None if it is not a number.
+    """
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", value or "")
+    if not match:
+        return None
+    speed = float(match.group(1))
+    return speed * 1.609344 if match.group(2) else speed
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in metres; takes scalars or numpy arrays in degrees.
+    """
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """
+    Initial bearing in degrees (0 = north, clockwise) from one point to another.
+    """
+    lat1, lat2 = math.radians(lat1), math.radians(lat2)
+    d_lon = math.radians(lon2 - lon1)
+    x = math.sin(d_lon) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(d_lon)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+
+def turn_modifier(bearing_before, bearing_after):
+    """
+    OSRM maneuver modifier ("straight", "slight left", "right", "uturn", ...) for a change of bearing.
+    """
+    angle = (bearing_after - bearing_before + 540) % 360 - 180  # -180..180, positive is right
+    for limit, modifier in TURN_MODIFIERS:
+        if abs(angle) <= limit:
+            if modifier == "straight":
+                return modifier
+            side = "right" if angle > 0 else "left"
+            return f"{modifier} {side}".strip()
+    return "uturn"
+
+
+def load_overpass_elements(paths):
+    """
+    Merge the nodes and ways of several Overpass JSON responses.
+    :param paths: Overpass response files (other JSON files are skipped).
+    :return: (dict of node id -> (lat, lon), dict of way id -> way element)
+    """
+    nodes = {}
+    ways = {}
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(data, dict):
+            continue
+        for element in data.get("elements", []):
+            if element.get("type") == "node":
+                nodes[element["id"]] = (element["lat"], element["lon"])
+            elif element.get("type") == "way":
+                ways[element["id"]] = element
+    return nodes, ways
+
+
+def way_directions(tags):
+    """
+    :return: (forward, backward) travel allowed along the way's node order.
+    """
+    oneway = tags.get("oneway", "")
+    if oneway == "-1":
+        return False, True
+    if oneway == "reversible":
+        return False, False
+    if oneway in ("yes", "true", "1") or tags.get("highway") == "motorway" or tags.get("junction") in ("roundabout", "circular"):
+        return True, False
+    return True, True
+
+
+def is_drivable(tags):
+    if tags.get("highway") not in DEFAULT_SPEEDS_KMH or tags.get("area") == "yes":
+        return False
+    access = tags.get("motor_vehicle", tags.get("access", "yes"))
+    return access not in ("no", "private")
+
+
+class LocalRoadGraph:
+    def __init__(self, lat, lon, indptr, targets, lengths, durations, edge_ways, way_names, way_refs, way_highways):
+        """
+        Directed road graph in CSR form; the edges leaving node i are indptr[i]:indptr[i + 1].
+        Use from_overpass_files / load instead of calling this directly.
+        :param lat: Node latitudes.
+        :param lon: Node longitudes.
+        :param targets: Edge target nodes.
+        :param lengths: Edge lengths in metres.
+        :param durations: Edge travel times in seconds.
+        :param edge_ways: Edge way index into way_names, way_refs and way_highways.
+        """
+        self.lat = lat
+        self.lon = lon
+        self.indptr = indptr
+        self.targets = targets
+        self.lengths = lengths
+        self.durations = durations
+        self.edge_ways = edge_ways
+        self.way_names = way_names
+        self.way_refs = way_refs
+        self.way_highways = way_highways
+        # Fastest edge, for an admissible A* heuristic
+        self.max_speed_ms = float(np.max(lengths / np.maximum(durations, 1e-6))) if len(lengths) else 1.0
+        self.components = self._components()
+        # Plain lists iterate much faster than array elements in the search loop
+        self._adjacency = (indptr.tolist(), targets.tolist(), durations.tolist())
+        self._lat_rad = np.radians(lat).tolist()
+        self._lon_rad = np.radians(lon).tolist()
+
+    @classmethod
+    def from_overpass_files(cls, paths):
+        """
+        Build the graph from Overpass responses, e.g. the osmnx cache files.
+        """
+        nodes, ways = load_overpass_elements(paths)
+        way_names, way_refs, way_highways = [], [], []
+        sources, targets, edge_ways, speeds = [], [], [], []
+        for way in ways.values():
+            tags = way.get("tags", {})
+            if not is_drivable(tags):
+                continue
+            forward, backward = way_directions(tags)
+            way_nodes = [node for node in way.get("nodes", []) if node in nodes]
+            if len(way_nodes) < 2 or not (forward or backward):
+                continue
+            way_index = len(way_names)
+            way_names.append(tags.get("name", ""))
+            way_refs.append(tags.get("ref", ""))
+            way_highways.append(tags["highway"])
+            speed = parse_maxspeed(tags.get("maxspeed")) or DEFAULT_SPEEDS_KMH[tags["highway"]]
+            for u, v in zip(way_nodes, way_nodes[1:]):
+                if forward:
+                    sources.append(u)
+                    targets.append(v)
+                if backward:
+                    sources.append(v)
+                    targets.append(u)
+                count = int(forward) + int(backward)
+                edge_ways.extend([way_index] * count)
+                speeds.extend([speed] * count)
+
+        node_ids, inverse = np.unique(np.array(sources + targets, dtype=np.int64), return_inverse=True)
+        sources, targets = inverse[:len(sources)], inverse[len(sources):]
+        coords = np.array([nodes[node] for node in node_ids.tolist()], dtype=np.float64).reshape(-1, 2)
+        lat, lon = coords[:, 0].copy(), coords[:, 1].copy()
+
+        order = np.argsort(sources, kind="stable")
+        sources, targets = sources[order], targets[order].astype(np.int32)
+        edge_ways = np.array(edge_ways, dtype=np.int32)[order]
+        speeds_ms = np.array(speeds, dtype=np.float64)[order] / 3.6
+        lengths = haversine_m(lat[sources], lon[sources], lat[targets], lon[targets])
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=indptr[1:])
+        return cls(
+            lat, lon, indptr, targets, lengths.astype(np.float32), (lengths / speeds_ms).astype(np.float32),
+            edge_ways, way_names, way_refs, way_highways,
+        )
+
+    @classmethod
+    def from_directory(cls, directory):
+        return cls.from_overpass_files(sorted(glob.glob(os.path.join(directory, "*.json"))))
+
+    def save(self, path):
+        """
+        Write the graph as a .npz snapshot (loads much faster than rebuilding from JSON).
+        """
+        np.savez_compressed(
+            path, lat=self.lat, lon=self.lon, indptr=self.indptr, targets=self.targets, lengths=self.lengths,
+            durations=self.durations, edge_ways=self.edge_ways, way_names=np.array(self.way_names, dtype=object),
+            way_refs=np.array(self.way_refs, dtype=object), way_highways=np.array(self.way_highways, dtype=object),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=True) as data:
+            return cls(
+                data["lat"], data["lon"], data["indptr"], data["targets"], data["lengths"], data["durations"],
+                data["edge_ways"], data["way_names"].tolist(), data["way_refs"].tolist(), data["way_highways"].tolist(),
+            )
+
+    @property
+    def node_count(self):
+        return len(self.lat)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def _components(self):
+        """
+        Weakly connected component label of each node. The cache holds separate patches of roads,
+        so both ends of a query are snapped into the same component.
+        """
+        if self.node_count == 0:
+            return np.zeros(0, dtype=np.int64)
+        sources = np.repeat(np.arange(self.node_count), np.diff(self.indptr))
+        labels = np.arange(self.node_count)
+        while True:
+            # Label propagation over both edge directions, with pointer jumping
+            previous = labels.copy()
+            np.minimum.at(labels, self.targets, labels[sources])
+            np.minimum.at(labels, sources, labels[self.targets])
+            labels = labels[labels]
+            if np.array_equal(labels, previous):
+                break
+        return labels
+
+    def nearest_nodes(self, lat, lon, max_distance_m=MAX_SNAP_M):
+        """
+        Closest node of each component within max_distance_m.
+        :return: Dict of component label -> (node index, distance in metres).
+        """
+        # Equirectangular prefilter in degrees, then exact distances for the few nodes left
+        radius_deg = max_distance_m / 111000.0
+        scale = max(math.cos(math.radians(lat)), 0.01)
+        near = np.flatnonzero((np.abs(self.lat - lat) <= radius_deg) & (np.abs(self.lon - lon) * scale <= radius_deg))
+        distances = haversine_m(lat, lon, self.lat[near], self.lon[near])
+        nearest = {}
+        for index in np.argsort(distances, kind="stable"):
+            if distances[index] > max_distance_m:
+                break
+            component = int(self.components[near[index]])
+            if component not in nearest:
+                nearest[component] = (int(near[index]), float(distances[index]))
+        return nearest
+
+    def snap(self, source_coords, destination_coords):
+        """
+        Pick start and end nodes in a shared component, minimizing the total snapping distance.
+        :return: (source node, source distance, target node, target distance)
+        :raises ValueError: If no component has roads near both points.
+        """
+        source_nodes = self.nearest_nodes(*source_coords)
+        target_nodes = self.nearest_nodes(*destination_coords)
+        shared = source_nodes.keys() & target_nodes.keys()
+        if not shared:
+            raise ValueError(f"No connected local road data within {MAX_SNAP_M:.0f} m of both route ends")
+        component = min(shared, key=lambda label: source_nodes[label][1] + target_nodes[label][1])
+        return (*source_nodes[component], *target_nodes[component])
+
+    def _heuristic(self, node, target_lat, target_lon, cos_target):
+        lat = self._lat_rad[node]
+        a = (math.sin((target_lat - lat) / 2) ** 2
+             + math.cos(lat) * cos_target * math.sin((target_lon - self._lon_rad[node]) / 2) ** 2)
+        return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0))) / self.max_speed_ms
+
+    def shortest_path(self, source, target):
+        """
+        A* on travel time.
+        :return: (list of node indices from source to target, list of edge indices between them)
+        :raises ValueError: If target cannot be reached.
+        """
+        indptr, targets, durations = self._adjacency
+        target_lat, target_lon = self._lat_rad[target], self._lon_rad[target]
+        cos_target = math.cos(target_lat)
+        best = {source: 0.0}
+        came_from = {}
+        heap = [(self._heuristic(source, target_lat, target_lon, cos_target), 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if cost > best[node]:
+                continue  # Stale entry
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = targets[edge]
+                new_cost = cost + durations[edge]
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    came_from[neighbor] = edge
+                    estimate = new_cost + self._heuristic(neighbor, target_lat, target_lon, cos_target)
+                    heapq.heappush(heap, (estimate, new_cost, neighbor))
+        else:
+            if source != target:
+                raise ValueError("No route between these points on the local road graph")
+
+        nodes, edges = [target], []
+        while nodes[-1] != source:
+            edge = came_from[nodes[-1]]
+            edges.append(edge)
+            # The edge's source is the node whose CSR range holds it
+            nodes.append(int(np.searchsorted(self.indptr, edge, side="right")) - 1)
+        return nodes[::-1], edges[::-1]
+
+    def _point(self, node):
+        return [float(self.lon[node]), float(self.lat[node])]
+
+    def _bearing(self, u, v):
+        return bearing(self.lat[u], self.lon[u], self.lat[v], self.lon[v])
+
+    def leg(self, source_coords, destination_coords):
+        """
+        Route one leg.
+        :param source_coords: (latitude, longitude) of the start.
+        :param destination_coords: (latitude, longitude) of the end.
+        :return: (OSRM-style leg dict, source waypoint dict, destination waypoint dict)
+        """
+        source, source_snap, target, target_snap = self.snap(source_coords, destination_coords)
+        nodes, edges = self.shortest_path(source, target)
+
+        # One step per stretch on the same name and ref, like OSRM's "new name"/"turn" steps
+        steps = []
+        start = 0
+        for i in range(1, len(edges) + 1):
+            if i < len(edges):
+                this_way, next_way = self.edge_ways[edges[i - 1]], self.edge_ways[edges[i]]
+                if (self.way_names[this_way], self.way_refs[this_way]) == (self.way_names[next_way], self.way_refs[next_way]):
+                    continue
+            steps.append(self._step(nodes, edges, start, i, first=not steps))
+            start = i
+        if not edges:
+            # Both ends snapped to the same node: OSRM answers with the point twice, as a depart step
+            steps.append(self._depart_in_place_step(nodes[0]))
+        steps.append(self._arrive_step(nodes, edges))
+
+        distance = sum(step["distance"] for step in steps)
+        duration = sum(step["duration"] for step in steps)
+        leg = {
+            "steps": steps,
+            "distance": round(distance, 1),
+            "duration": round(duration, 1),
+            "weight": round(duration, 1),
+            "summary": ", ".join(dict.fromkeys(step["name"] for step in steps if step["name"]))[:100],
+        }
+        waypoints = (
+            {"location": self._point(source), "name": steps[0]["name"], "distance": round(source_snap, 1)},
+            {"location": self._point(target), "name": steps[-1]["name"], "distance": round(target_snap, 1)},
+        )
+        return leg, waypoints[0], waypoints[1]
+
+    def _step(self, nodes, edges, start, end, first):
+        """
+        Step over edges[start:end], i.e. nodes[start] to nodes[end].
+        """
+        way = self.edge_ways[edges[start]]
+        step_edges = edges[start:end]
+        bearing_after = self._bearing(nodes[start], nodes[start + 1])
+        if first:
+            maneuver = {"type": "depart", "bearing_before": 0, "bearing_after": round(bearing_after)}
+        else:
+            bearing_before = self._bearing(nodes[start - 1], nodes[start])
+            modifier = turn_modifier(bearing_before, bearing_after)
+            previous_highway = self.way_highways[self.edge_ways[edges[start - 1]]]
+            highway = self.way_highways[way]
+            if highway.endswith("_link") and not previous_highway.endswith("_link"):
+                maneuver_type = "off ramp" if previous_highway in ("motorway", "trunk") else "on ramp"
+            elif modifier == "straight":
+                maneuver_type = "new name"
+            else:
+                maneuver_type = "turn"
+            maneuver = {"type": maneuver_type, "modifier": modifier,
+                        "bearing_before": round(bearing_before), "bearing_after": round(bearing_after)}
+        maneuver["location"] = self._point(nodes[start])
+
+        step = {
+            "geometry": {"type": "LineString", "coordinates": [self._point(node) for node in nodes[start:end + 1]]},
+            "name": self.way_names[way],
+            "distance": round(float(self.lengths[step_edges].sum()), 1),
+            "duration": round(float(self.durations[step_edges].sum()), 1),
+            "mode": "driving",
+            "driving_side": "right",
+            "maneuver": maneuver,
+            "intersections": [{"location": self._point(node)} for node in nodes[start:end]],
+        }
+        step["weight"] = step["duration"]
+        if self.way_refs[way]:
+            step["ref"] = self.way_refs[way]
+        return step
+
+    def _depart_in_place_step(self, node):
+        point = self._point(node)
+        return {
+            "geometry": {"type": "LineString", "coordinates": [point, list(point)]},
+            "name": "",
+            "distance": 0,
+            "duration": 0,
+            "weight": 0,
+            "mode": "driving",
+            "driving_side": "right",
+            "maneuver": {"type": "depart", "bearing_before": 0, "bearing_after": 0, "location": point},
+            "intersections": [{"location": point}],
+        }
+
+    def _arrive_step(self, nodes, edges):
+        last = nodes[-1]
+        name = self.way_names[self.edge_ways[edges[-1]]] if edges else ""
+        bearing_before = self._bearing(nodes[-2], last) if len(nodes) > 1 else 0
+        return {
+            "geometry": {"type": "LineString", "coordinates": [self._point(last), self._point(last)]},
+            "name": name,
+            "distance": 0,
+            "duration": 0,
+            "weight": 0,
+            "mode": "driving",
+            "driving_side": "right",
+            "maneuver": {"type": "arrive", "bearing_before": round(bearing_before), "bearing_after": 0,
+                         "location": self._point(last)},
+            "intersections": [{"location": self._point(last)}],
+        }
+
+    def route(self, waypoints):
+        """
+        Route through the waypoints, one leg per consecutive pair.
+        :param waypoints: List of (latitude, longitude) tuples.
+        :return: Response dict shaped like OSRM's /route with overview=full, geometries=geojson and steps=true.
+        """
+        legs, response_waypoints = [], []
+        for source_coords, destination_coords in zip(waypoints, waypoints[1:]):
+            leg, source_waypoint, destination_waypoint = self.leg(source_coords, destination_coords)
+            legs.append(leg)
+            if not response_waypoints:
+                response_waypoints.append(source_waypoint)
+            response_waypoints.append(destination_waypoint)
+
+        coordinates = []
+        for leg in legs:
+            for step in leg["steps"]:
+                if step["maneuver"]["type"] == "arrive":
+                    continue  # A repeated point, not part of the overview geometry
+                points = step["geometry"]["coordinates"]
+                coordinates.extend(points[1:] if coordinates and points[0] == coordinates[-1] else points)
+        distance = round(sum(leg["distance"] for leg in legs), 1)
+        duration = round(sum(leg["duration"] for leg in legs), 1)
+        return {
+            "code": "Ok",
+            "engine": "local",
+            "routes": [{
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+                "legs": legs,
+                "distance": distance,
+                "duration": duration,
+                "weight_name": "duration",
+                "weight": duration,
+            }],
+            "waypoints": response_waypoints,
+        }
+
+
+_default_graph = None
+_default_graph_lock = threading.Lock()
+
+
+def default_graph():
+    """
+    Process-wide graph, loaded from ADAS_LOCAL_GRAPH_FILE if that snapshot exists, otherwise built
+    from the Overpass responses in ADAS_LOCAL_GRAPH_DIR (and saved to the snapshot file, if set).
+    """
+    global _default_graph
+    with _default_graph_lock:
+        if _default_graph is None:
+            if config.LOCAL_GRAPH_FILE and os.path.exists(config.LOCAL_GRAPH_FILE):
+                _default_graph = LocalRoadGraph.load(config.LOCAL_GRAPH_FILE)
+            else:
+                _default_graph = LocalRoadGraph.from_directory(config.LOCAL_GRAPH_DIR)
+                if config.LOCAL_GRAPH_FILE:
+                    _default_graph.save(config.LOCAL_GRAPH_FILE)
+            print(f"Local road graph: {_default_graph.node_count} nodes, {_default_graph.edge_count} edges")
+        return _default_graph
+
+
+def route(waypoints):
+    """
+    Route on the process-wide local graph; see LocalRoadGraph.route.
+    """
+    return default_graph().route(waypoints)
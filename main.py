@@ -1,5 +1,11 @@
+import asyncio
 import json
-from routeprocessing import RouteProcessor
+from concurrent.futures import ThreadPoolExecutor
+from routeprocessing import (
+    RouteProcessor, extract_intersection_data, iter_intersection_data, get_combined_road_type, road_type_query, route_steps,
+    regional_road_types, ref_road_type,
+    intersections_csv, INTERSECTIONS_CSV_ARTIFACT, ADAS_MAP_ARTIFACT,
+)
 from identify_highways import HighwayIdentifier
 from identify_major_roads import MajorRoadIdentifier
 from identify_local_roads import LocalRoadIdentifier
@@ -7,24 +13,31 @@ from combined_road_grouper import CombinedRoadGrouper
 from adas_processor_level0 import ADASProcessorLevel0 
 from adas_processor_level1 import ADASProcessorLevel1
 from adas_processor_level2 import ADASProcessorLevel2
-from add_adas_markers import add_adas_markers_to_map, add_adas_colored_route, get_color_for_adas
-import streamlit as st
+from add_adas_markers import render_adas_colored_route, get_color_for_adas
+from adas_stream import ADASSegmentStream
+import map_matching
+import prefetch
+import result_store
+from artifacts import default_store
+from singleflight import SingleFlight, normalize_place
 
-def process_route(source, destination, autonomous_level):
+# Upper bound on upstream calls (geocoding, routing, Overpass) in flight at once per route
+DEFAULT_CONCURRENCY = 4
+
+# process_route result entries that are data for the maps, exports and replays rather than route details to print
+DETAIL_SKIP_KEYS = ("adas_segments", "route_geometry", "artifacts", "degraded", "legs", "intersection_data", "groups",
+                    "reroute")
+
+# Coalesces identical process_route calls made at the same time (e.g. several sessions, same route)
+route_calls = SingleFlight()
+
+def compute_adas_segments(intersection_data, autonomous_level):
     """
-    Process the route and return the distance, duration, intersection data, and ADAS segments.
+    Group the classified steps by road type and derive the ADAS segments for the autonomous level.
+    :param intersection_data: Tuple of intersection tuples from extract_intersection_data.
+    :param autonomous_level: "Level 0", "Level 1" or "Level 2".
+    :return: List of ADAS segment dicts.
     """
-    processor = RouteProcessor()
-    source_coords = processor.get_lat_lon(source)
-    destination_coords = processor.get_lat_lon(destination)
-
-    distance, duration, intersection_data, route_geometry = processor.calculate_shortest_route(
-        source_coords,
-        destination_coords,
-        output_file="shortest_path_output.json",
-        map_file="route_map.html"
-    )
-
     highway_identifier = HighwayIdentifier(intersection_data)
     grouped_highways = highway_identifier.group_highways()
     # highway_identifier.save_grouped_to_csv(grouped_highways, "grouped_highways.csv")
@@ -37,6 +50,14 @@ def process_route(source, destination, autonomous_level):
     grouped_local_roads = local_road_identifier.group_local_roads()
     # local_road_identifier.save_grouped_to_csv(grouped_local_roads, "grouped_local_roads.csv")
 
+    return adas_segments_from_groups(grouped_highways, grouped_major_roads, grouped_local_roads, autonomous_level)
+
+def adas_segments_from_groups(grouped_highways, grouped_major_roads, grouped_local_roads, autonomous_level):
+    """
+    Derive the ADAS segments for the autonomous level from grouped road segments,
+    as produced by the identifiers or by map_matching.
+    :return: List of ADAS segment dicts.
+    """
     grouper = CombinedRoadGrouper(grouped_highways, grouped_major_roads)
     combined_segments = grouper.combine()
     # grouper.save_combined_to_csv(combined_segments, "combined_highway_major_road.csv")
@@ -56,21 +77,331 @@ def process_route(source, destination, autonomous_level):
         adas_segments = adas_processor.process_adas()
         # adas_processor.save_adas_to_csv(adas_segments, "adas_segments_level2.csv")
 
-    add_adas_colored_route(route_geometry, adas_segments, "route_map_with_adas.html")
+    return adas_segments
+
+def route_groups(intersection_data, route_geometry, steps):
+    """
+    Road groups of a route: from dense per-vertex road classes when map_matching is enabled,
+    otherwise from the classified steps.
+    :return: (grouped_highways, grouped_major_roads, grouped_local_roads)
+    """
+    if map_matching.enabled():
+        return map_matching.MatchedRoute(route_geometry, steps).groups()
+    return (
+        HighwayIdentifier(intersection_data).group_highways(),
+        MajorRoadIdentifier(intersection_data).group_major_roads(),
+        LocalRoadIdentifier(intersection_data).group_local_roads(),
+    )
+
+def route_adas_segments(intersection_data, route_geometry, steps, autonomous_level):
+    """
+    ADAS segments of a route: from dense per-vertex road classes when map_matching is enabled,
+    otherwise from the classified steps (compute_adas_segments).
+    """
+    return adas_segments_from_groups(*route_groups(intersection_data, route_geometry, steps), autonomous_level)
+
+def leg_summaries(route, waypoint_coords):
+    """
+    Distance and duration of each leg of a route with stops.
+    :param route: One route from the OSRM response.
+    :param waypoint_coords: (latitude, longitude) of source, stops and destination.
+    :return: List of dicts with start, end, distance_km and duration_minutes, one per leg.
+    """
+    return [
+        {
+            "start": waypoint_coords[i],
+            "end": waypoint_coords[i + 1],
+            "distance_km": leg["distance"] / 1000,
+            "duration_minutes": leg["duration"] / 60,
+        }
+        for i, leg in enumerate(route["legs"])
+    ]
+
+def overpass_points(queries, known_road_types):
+    """
+    Points whose road type will come from Overpass: no known road type and no ref rule.
+    :param queries: road_type_query pairs of the steps.
+    :param known_road_types: Road types known so far, None where a lookup is still needed.
+    :return: List of (lat, lon) in step order, for prefetch.prefetch_route.
+    """
+    return [
+        coord for (ref, coord), road_type in zip(queries, known_road_types)
+        if road_type is None and coord and ref_road_type(ref) is None
+    ]
+
+async def process_route_async(source, destination, autonomous_level, concurrency=DEFAULT_CONCURRENCY, store=None, render_maps=True, via=(), reroute=None):
+    """
+    Asynchronous variant of process_route that overlaps the upstream calls.
+    All geocodes run at the same time. Once OSRM returns the steps, every step's road type
+    classification is scheduled at once, so early steps are classified while later ones are
+    still pending, and the route map is rendered alongside. All blocking calls share one
+    concurrency limit.
+    :param concurrency: Maximum number of upstream calls in flight at once.
+    :param store: ArtifactStore for the generated maps, JSON and CSV (default: the process-wide store).
+    :param render_maps: False skips the route JSON and both maps, e.g. to shed load.
+    :param via: Place names of stops between source and destination, routed in the same OSRM call.
+    :param reroute: Optional reroute.RerouteSession whose previous route's road types and groups are reused.
+    :return: Same dict as process_route (plus "reroute" stats with a session).
+    """
+    store = store if store is not None else default_store()
+    processor = RouteProcessor()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def upstream(func, *args):
+        async with limit:
+            return await asyncio.to_thread(func, *args)
+
+    waypoint_coords = await asyncio.gather(
+        *(upstream(processor.get_lat_lon, place) for place in (source, *via, destination))
+    )
+    source_coords, via_coords, destination_coords = waypoint_coords[0], waypoint_coords[1:-1], waypoint_coords[-1]
+
+    try:
+        data = await upstream(processor.fetch_trip, waypoint_coords)
+    except Exception as e:
+        raise ValueError(f"Error while calculating the shortest route: {e}")
+    if data["code"] != "Ok":
+        raise ValueError(f"OSRM error: {data['code']} - {data.get('message', 'No message provided')}")
+
+    route = data["routes"][0]
+    route_geometry = route["geometry"]["coordinates"]
+    steps, leg_indices = route_steps(route)
+
+    # Points covered by the regional road index are classified in one go, the rest through Overpass
+    queries = [road_type_query(step) for step in steps]
+    known_road_types = await asyncio.to_thread(regional_road_types, queries)
+    if reroute is not None:
+        # Steps the previous route already classified keep their road type
+        known_road_types = reroute.known_road_types(queries, known_road_types)
+    # The tiles of the points left for Overpass are downloaded in the background, in step order
+    prefetch_job = prefetch.prefetch_route(overpass_points(queries, known_road_types))
+    classifications = [
+        asyncio.create_task(upstream(get_combined_road_type, *query))
+        for query, road_type in zip(queries, known_road_types) if road_type is None
+    ]
+    # The route map does not depend on classification, so it is rendered in the meantime
+    artifacts = {}
+    if render_maps:
+        artifacts = await asyncio.to_thread(
+            processor.save_route_artifacts, data, source_coords, destination_coords, store=store, via_coords=via_coords
+        )
+    try:
+        classified = iter(await asyncio.gather(*classifications))
+    finally:
+        # Tiles still queued would only delay the next route
+        if prefetch_job is not None:
+            prefetch_job.cancel()
+    road_types = [road_type if road_type is not None else next(classified) for road_type in known_road_types]
+
+    intersection_data = tuple(extract_intersection_data(steps, road_types=road_types, leg_indices=leg_indices))
+    artifacts[INTERSECTIONS_CSV_ARTIFACT] = store.put(intersections_csv(intersection_data))
+
+    if reroute is not None:
+        reroute.remember_road_types(queries, road_types)
+    groups = None
+    if reroute is not None and not map_matching.enabled():
+        adas_segments = reroute.adas_segments(intersection_data, autonomous_level)
+    else:
+        groups = route_groups(intersection_data, route_geometry, steps)
+        adas_segments = adas_segments_from_groups(*groups, autonomous_level)
+    if render_maps:
+        adas_map_html = await asyncio.to_thread(render_adas_colored_route, route_geometry, adas_segments)
+        artifacts[ADAS_MAP_ARTIFACT] = store.put(adas_map_html)
 
     # Add color info to each ADAS segment
     for seg in adas_segments:
         seg["color"] = get_color_for_adas(seg["ADAS"])
 
-    return {
-        "route_distance_km": distance / 1000,
-        "estimated_duration_minutes": duration / 60,
+    result = {
+        "route_distance_km": route["distance"] / 1000,
+        "estimated_duration_minutes": route["duration"] / 60,
         "adas_segments": adas_segments,
-        "route_geometry": route_geometry  # <-- This must be present and not empty!
+        "route_geometry": route_geometry,  # <-- This must be present and not empty!
+        "legs": leg_summaries(route, waypoint_coords),
+        "intersection_data": intersection_data,
+        "groups": groups,
+        "artifacts": artifacts
     }
+    if reroute is not None:
+        result["reroute"] = reroute.stats()
+    return result
+
+def process_route(source, destination, autonomous_level, store=None, render_maps=True, via=()):
+    """
+    Process the route and return the distance, duration, intersection data, and ADAS segments.
+    The maps, route JSON and intersections CSV are kept in memory; "artifacts" maps their names
+    (e.g. ADAS_MAP_ARTIFACT) to digests in the store, nothing is written to the working directory.
+    Runs process_route_async to completion; must not be called from a running event loop.
+    :param store: ArtifactStore for the artifacts (default: the process-wide store).
+    :param render_maps: False skips the route JSON and both maps.
+    :param via: Optional place names of stops between source and destination. The whole trip costs one
+                OSRM call; "legs" has the distance and duration of each leg.
+    """
+    store = store if store is not None else default_store()
+    via = tuple(via)
+    key = (
+        "route", normalize_place(source), tuple(normalize_place(place) for place in via), normalize_place(destination),
+        autonomous_level.strip(), render_maps, id(store),
+    )
+    # Routes processed before, by this or any other process, come from the result store
+    results = result_store.default_result_store()
+    if results is not None:
+        cached = results.get(source, destination, autonomous_level, via, render_maps, store)
+        if cached is not None:
+            return cached
+
+    def run():
+        result = asyncio.run(process_route_async(source, destination, autonomous_level, store=store, render_maps=render_maps, via=via))
+        if results is not None:
+            results.put(source, destination, autonomous_level, result, via, store)
+        return result
+
+    result = route_calls.do(key, run)
+    # Coalesced callers share one result; give each its own containers to modify
+    return dict(
+        result,
+        adas_segments=[dict(seg) for seg in result["adas_segments"]],
+        legs=[dict(leg) for leg in result["legs"]],
+        artifacts=dict(result["artifacts"]),
+    )
+
+def iter_route_events(source, destination, autonomous_level, concurrency=DEFAULT_CONCURRENCY, store=None, via=()):
+    """
+    Streaming variant of process_route for progressive UIs.
+    Step classifications run in the background; results are yielded in route order as soon as they are determined:
+    - ("route", dict with route_distance_km, estimated_duration_minutes, route_geometry, legs and step_count)
+    - ("step", intersection tuple) for each classified step
+    - ("group", grouped segment tuple) for each closed road group
+    - ("segment", ADAS segment dict, with color) for each finalized ADAS segment
+    - ("done", the same dict process_route returns)
+    Segments are streamed in the order they become final; the "done" result keeps process_route's order.
+    :param concurrency: Maximum number of upstream calls in flight at once.
+    :param store: ArtifactStore for the artifacts (default: the process-wide store).
+    :param via: Optional place names of stops between source and destination.
+    """
+    store = store if store is not None else default_store()
+    results = result_store.default_result_store()
+    cached = results.get(source, destination, autonomous_level, via, True, store) if results is not None else None
+    if cached is not None:
+        yield from stored_route_events(cached)
+        return
+
+    processor = RouteProcessor()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    prefetch_job = None
+    try:
+        geocodes = [pool.submit(processor.get_lat_lon, place) for place in (source, *via, destination)]
+        waypoint_coords = [future.result() for future in geocodes]
+        source_coords, via_coords, destination_coords = waypoint_coords[0], waypoint_coords[1:-1], waypoint_coords[-1]
+
+        try:
+            data = processor.fetch_trip(waypoint_coords)
+        except Exception as e:
+            raise ValueError(f"Error while calculating the shortest route: {e}")
+        if data["code"] != "Ok":
+            raise ValueError(f"OSRM error: {data['code']} - {data.get('message', 'No message provided')}")
+
+        route = data["routes"][0]
+        route_geometry = route["geometry"]["coordinates"]
+        steps, leg_indices = route_steps(route)
+        legs = leg_summaries(route, waypoint_coords)
+        yield "route", {
+            "route_distance_km": route["distance"] / 1000,
+            "estimated_duration_minutes": route["duration"] / 60,
+            "route_geometry": route_geometry,
+            "legs": legs,
+            "step_count": len(steps),
+        }
+
+        queries = [road_type_query(step) for step in steps]
+        known_road_types = regional_road_types(queries)
+        prefetch_job = prefetch.prefetch_route(overpass_points(queries, known_road_types))
+        classifications = {
+            i: pool.submit(get_combined_road_type, *query)
+            for i, (query, road_type) in enumerate(zip(queries, known_road_types)) if road_type is None
+        }
+        route_artifacts = pool.submit(
+            processor.save_route_artifacts, data, source_coords, destination_coords, store=store, via_coords=via_coords
+        )
+
+        # Dense road classes are only known for the route as a whole, so nothing is grouped per step
+        dense = map_matching.enabled()
+        stream = None if dense else ADASSegmentStream(autonomous_level)
+        intersection_data = []
+        road_types = (
+            road_type if road_type is not None else classifications[i].result()
+            for i, road_type in enumerate(known_road_types)
+        )
+        for entry in iter_intersection_data(steps, road_types=road_types, leg_indices=leg_indices):
+            intersection_data.append(entry)
+            yield "step", entry
+            if stream is not None:
+                yield from stream.add_entry(entry)
+        if stream is not None:
+            yield from stream.finish()
+        artifacts = route_artifacts.result()
+    finally:
+        # Also reached when the consumer stops early: drop the classifications not started yet
+        pool.shutdown(wait=False, cancel_futures=True)
+        if prefetch_job is not None:
+            prefetch_job.cancel()
+
+    intersection_data = tuple(intersection_data)
+    artifacts[INTERSECTIONS_CSV_ARTIFACT] = store.put(intersections_csv(intersection_data))
+    if dense:
+        groups = map_matching.MatchedRoute(route_geometry, steps).groups()
+    else:
+        # The stream has already grouped the steps, in the same order as the identifiers in batch
+        groups = tuple(stream.groups[kind] for kind in ("highway", "major", "local"))
+    adas_segments = adas_segments_from_groups(*groups, autonomous_level)
+    artifacts[ADAS_MAP_ARTIFACT] = store.put(render_adas_colored_route(route_geometry, adas_segments))
+    for seg in adas_segments:
+        seg["color"] = get_color_for_adas(seg["ADAS"])
+    if dense:
+        for grouped in groups:
+            for group in grouped:
+                yield "group", group
+        for seg in adas_segments:
+            yield "segment", dict(seg)
+
+    result = {
+        "route_distance_km": route["distance"] / 1000,
+        "estimated_duration_minutes": route["duration"] / 60,
+        "adas_segments": adas_segments,
+        "route_geometry": route_geometry,
+        "legs": legs,
+        "intersection_data": intersection_data,
+        "groups": groups,
+        "artifacts": artifacts
+    }
+    if results is not None:
+        results.put(source, destination, autonomous_level, result, via, store)
+    yield "done", result
+
+def stored_route_events(result):
+    """
+    The iter_route_events events of a stored result, all at once.
+    """
+    yield "route", {
+        "route_distance_km": result["route_distance_km"],
+        "estimated_duration_minutes": result["estimated_duration_minutes"],
+        "route_geometry": result["route_geometry"],
+        "legs": result["legs"],
+        "step_count": len(result["intersection_data"]),
+    }
+    for entry in result["intersection_data"]:
+        yield "step", entry
+    for grouped in result["groups"] or ():
+        for group in grouped:
+            yield "group", group
+    for seg in result["adas_segments"]:
+        yield "segment", dict(seg)
+    yield "done", result
 
 # Streamlit UI
 if __name__ == "__main__":
+    import streamlit as st
+
     st.title("Route Visualization")
 
     source = "Heilbronn"
@@ -83,9 +414,8 @@ if __name__ == "__main__":
 
     route_details = process_route(source, destination, autonomous_level)
 
-    with open("route_map_with_adas.html", "r", encoding="utf-8") as f:
-        map_html = f.read()
+    map_html = default_store().get_text(route_details["artifacts"][ADAS_MAP_ARTIFACT])
     st.components.v1.html(map_html, height=500, width=700)
 
-    st.write("Route Details:", route_details)
+    st.write("Route Details:", {key: value for key, value in route_details.items() if key not in DETAIL_SKIP_KEYS})
 
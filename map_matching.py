@@ -0,0 +1,178 @@
+"""
+Dense road classes along the whole route geometry.
+
+The step-based pipeline labels each OSRM step from one point, so a long step that runs
+from a link onto the motorway, or from motorway onto trunk, gets a single road type and
+ADAS segment boundaries land at step ends, possibly kilometres off. MatchedRoute labels
+every stretch between two route vertices instead, all in one nearest-road query on the
+regional road index (road_index.py), then:
+- applies the A/B ref rule of get_combined_road_type per step (links keep their class),
+- smooths the labels run by run: runs shorter than MIN_RUN_M take the class before them,
+- masks the steps whose maneuver ends highway/major road groups (a turn, or a modifier
+  other than straight/slight), as the identifiers do,
+- spreads each step's OSRM distance and duration over its vertices.
+groups() turns the class array into the same grouped segments the identifiers return,
+which feed main.adas_segments_from_groups unchanged.
+
+Enabled with ADAS_DENSE_ROAD_CLASSES=1 together with ADAS_ROAD_INDEX.
+"""
+import numpy as np
+
+import config
+import road_index
+from route_geometry import RouteGeometry
+from routeprocessing import ref_road_type
+
+ROAD_CLASSES = ("Highway", "Highway_link", "Major Road", "MajorRoad_link", "Local Road", "Service Road", "Other", "Unknown")
+CLASS_CODES = {name: code for code, name in enumerate(ROAD_CLASSES)}
+LINK_CLASSES = (CLASS_CODES["Highway_link"], CLASS_CODES["MajorRoad_link"])
+
+# Runs of one class shorter than this (metres) are treated as noise and merged into the run before
+MIN_RUN_M = 100.0
+
+# Maneuver modifiers that keep a highway or major road group going (see HighwayIdentifier)
+GROUP_MODIFIERS = ("slight left", "slight right", "straight")
+
+
+def enabled():
+    """
+    Whether routes are classified densely: ADAS_DENSE_ROAD_CLASSES is set and a road index is loaded.
+    """
+    return config.DENSE_ROAD_CLASSES and road_index.default_index() is not None
+
+
+def step_segment_ranges(steps):
+    """
+    Which route segments (stretches between consecutive route vertices) each step covers.
+    Arrive steps are a single repeated point and cover none.
+    :return: (starts, ends) arrays; step k covers segments starts[k]:ends[k].
+    """
+    counts = np.array([
+        0 if step.get("maneuver", {}).get("type") == "arrive" else len(step["geometry"]["coordinates"]) - 1
+        for step in steps
+    ], dtype=np.int64)
+    ends = np.cumsum(counts)
+    return ends - counts, ends
+
+
+def smooth_runs(segment_classes, cumulative_m, min_run_m=MIN_RUN_M):
+    """
+    Run-length smoothing: every run shorter than min_run_m takes the class of the last long run
+    before it (the first long run, for short runs at the start).
+    :param segment_classes: Class code per segment.
+    :param cumulative_m: Distance along the route of each vertex (one more than segments).
+    :return: Smoothed class codes per segment.
+    """
+    if not len(segment_classes):
+        return segment_classes
+    run_starts = np.flatnonzero(np.r_[True, segment_classes[1:] != segment_classes[:-1]])
+    run_ends = np.r_[run_starts[1:], len(segment_classes)]
+    long_runs = cumulative_m[run_ends] - cumulative_m[run_starts] >= min_run_m
+    if not long_runs.any():
+        return segment_classes
+    # Index of the last long run at or before each run, forward-filled
+    source_run = np.maximum.accumulate(np.where(long_runs, np.arange(len(run_starts)), -1))
+    source_run[source_run < 0] = np.argmax(long_runs)
+    return np.repeat(segment_classes[run_starts][source_run], run_ends - run_starts)
+
+
+class MatchedRoute:
+    def __init__(self, route_geometry, steps, index=None, min_run_m=MIN_RUN_M):
+        """
+        :param route_geometry: Route [lon, lat] coordinates (list, array or RouteGeometry).
+        :param steps: The route's steps, all legs (see routeprocessing.route_steps).
+        :param index: RegionalRoadIndex, defaults to road_index.default_index().
+        :param min_run_m: Shortest class run kept by smoothing.
+        """
+        index = index if index is not None else road_index.default_index()
+        if index is None:
+            raise ValueError("Dense road classes need a regional road index (ADAS_ROAD_INDEX)")
+        self.geometry = RouteGeometry.from_any(route_geometry)
+        coords = self.geometry.coords
+        segment_count = max(len(coords) - 1, 0)
+        starts, ends = step_segment_ranges(steps)
+        # Step of each segment; segments past the last step's end (geometry and steps disagreeing) join that step
+        covering = np.flatnonzero(ends > starts)
+        last_step = int(covering[-1]) if len(covering) else 0
+        step_of_segment = np.minimum(np.searchsorted(ends, np.arange(segment_count), side="right"), last_step)
+
+        # One nearest-road query for the midpoints of all segments
+        midpoints = (coords[:-1] + coords[1:]) / 2
+        classes_by_highway = np.array(
+            [CLASS_CODES.get(road_type, CLASS_CODES["Other"]) for road_type in index.road_types], dtype=np.int8
+        )
+        segment_classes = classes_by_highway[index.nearest_highways(midpoints[:, ::-1])]
+
+        # The ref rule: A and B roads are highways, except their links
+        ref_highway = np.array([ref_road_type(step.get("ref", "N/A")) == "Highway" for step in steps], dtype=bool)
+        override = ref_highway[step_of_segment] & ~np.isin(segment_classes, LINK_CLASSES)
+        segment_classes[override] = CLASS_CODES["Highway"]
+
+        # Maneuver mask: segments of steps that may be part of a highway or major road group
+        step_groupable = np.array([
+            step.get("maneuver", {}).get("type", "N/A") != "turn"
+            and step.get("maneuver", {}).get("modifier", "N/A") in GROUP_MODIFIERS
+            for step in steps
+        ], dtype=bool)
+        groupable = step_groupable[step_of_segment]
+
+        # Per-segment distance and duration: each step's OSRM figures spread by segment length
+        lengths = np.diff(self.geometry.cumulative_distance)
+        step_lengths = np.bincount(step_of_segment, weights=lengths, minlength=len(steps))
+        share = np.divide(lengths, step_lengths[step_of_segment], out=np.zeros_like(lengths),
+                          where=step_lengths[step_of_segment] > 0)
+        step_distances = np.array([step.get("distance", 0) for step in steps], dtype=np.float64)
+        step_durations = np.array([step.get("duration", 0) for step in steps], dtype=np.float64)
+        self.cumulative_m = np.r_[0.0, np.cumsum(step_distances[step_of_segment] * share)]
+        self.cumulative_s = np.r_[0.0, np.cumsum(step_durations[step_of_segment] * share)]
+
+        self.segment_classes = smooth_runs(segment_classes, self.geometry.cumulative_distance, min_run_m)
+        self.groupable = groupable
+
+    @property
+    def vertex_classes(self):
+        """
+        Class code per route vertex: the class of the stretch starting there (the last vertex repeats the one before).
+        """
+        if not len(self.segment_classes):
+            return np.full(len(self.geometry), CLASS_CODES["Unknown"], dtype=np.int8)
+        return np.r_[self.segment_classes, self.segment_classes[-1:]]
+
+    def class_names(self):
+        """
+        :return: Road type name per route vertex.
+        """
+        return np.array(ROAD_CLASSES, dtype=object)[self.vertex_classes].tolist()
+
+    def runs(self, road_type, require_groupable=False):
+        """
+        Group the maximal stretches of one road type, like the identifiers.
+        :param require_groupable: Also break groups at maneuvers that end them (highways and major roads).
+        :return: List of (start_coords, end_coords, road_type, total_distance_km, total_duration_min).
+        """
+        mask = self.segment_classes == CLASS_CODES[road_type]
+        if require_groupable:
+            mask &= self.groupable
+        edges = np.diff(np.r_[0, mask.astype(np.int8), 0])
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        coords = self.geometry.coords
+        return [
+            (
+                (float(coords[start, 1]), float(coords[start, 0])),
+                (float(coords[end, 1]), float(coords[end, 0])),
+                road_type,
+                round(float(self.cumulative_m[end] - self.cumulative_m[start]) / 1000, 3),   # km
+                round(float(self.cumulative_s[end] - self.cumulative_s[start]) / 60, 2)      # min
+            )
+            for start, end in zip(starts.tolist(), ends.tolist())
+        ]
+
+    def groups(self):
+        """
+        :return: (grouped_highways, grouped_major_roads, grouped_local_roads) for main.adas_segments_from_groups.
+        """
+        return (
+            self.runs("Highway", require_groupable=True),
+            self.runs("Major Road", require_groupable=True),
+            self.runs("Local Road"),
+        )
@@ -0,0 +1,340 @@
+"""
+Background prefetch of the road data around a route's lookup points.
+
+Once OSRM has returned the route, the points whose road type still needs Overpass
+(road_type_query points without a ref rule or regional index answer) are known, but
+each would be looked up with its own small Overpass download. The prefetcher
+downloads the fixed lat/lon tile holding each of those points with one Overpass query
+instead, in step order, on a few background threads that go through the Overpass
+limiter like every other request. Only the points' own tiles are fetched, never the
+whole corridor, so a route costs at most one download per step, like the per-step path.
+Several steps in one tile, and later routes through it, share the download.
+
+Each tile becomes a small RegionalRoadIndex in the TileCache, and get_combined_road_type
+classifies a point from its tile: right away if the tile is loaded, after waiting for it
+if its download is already running, and through osmnx as before if the tile is still
+queued, failed or was never requested. Once a route is classified, its tiles still in
+the queue are cancelled, so they never hold up the next route.
+
+Tiles are also written to the local road cache directory (the osmnx cache, see
+ADAS_LOCAL_GRAPH_DIR) unless a replay server is in use, so later runs load them from
+disk and local_router / road_index pick them up with the rest of the cache.
+
+Enable with ADAS_PREFETCH_TILES=1; see config.py.
+"""
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import config
+import ratelimit
+import road_index
+
+# Retries after Overpass answered 429/503/504 (each after its Retry-After)
+TILE_RETRIES = 2
+
+# Overpass query for the roads of one tile (south, west, north, east), with their nodes
+TILE_QUERY = '[out:json][timeout:60];(way["highway"]({south},{west},{north},{east});>;);out;'
+
+
+def enabled():
+    return config.PREFETCH_TILES
+
+
+def tile_key(lat, lon, tile_deg):
+    """
+    :return: (row, column) of the tile containing (lat, lon).
+    """
+    return int(math.floor(lat / tile_deg)), int(math.floor(lon / tile_deg))
+
+
+def tile_bounds(key, tile_deg, margin_m=road_index.MAX_DISTANCE_M):
+    """
+    (south, west, north, east) of a tile, widened by margin_m so roads just outside it are found
+    for points near its edge.
+    """
+    row, column = key
+    south, west = row * tile_deg, column * tile_deg
+    margin_lat = margin_m / road_index.METRES_PER_DEGREE
+    margin_lon = margin_lat / max(math.cos(math.radians(south + tile_deg / 2)), 0.01)
+    return south - margin_lat, west - margin_lon, south + tile_deg + margin_lat, west + tile_deg + margin_lon
+
+
+def point_tiles(points, tile_deg):
+    """
+    Tiles holding the points, in the order of their first point.
+    :param points: Sequence of (lat, lon).
+    :return: List of tile keys.
+    """
+    return list(dict.fromkeys(tile_key(lat, lon, tile_deg) for lat, lon in points))
+
+
+def fetch_tile_elements(bounds):
+    """
+    Download the roads in bounds from Overpass, within the Overpass limiter.
+    :return: The Overpass response dict.
+    """
+    south, west, north, east = bounds
+    query = TILE_QUERY.format(south=round(south, 6), west=round(west, 6), north=round(north, 6), east=round(east, 6))
+    overpass = ratelimit.limiter("overpass")
+    for attempt in range(TILE_RETRIES + 1):
+        with overpass.slot() as slot:
+            response = requests.post(f"{config.OVERPASS_URL}/interpreter", data={"data": query}, timeout=90)
+            throttled = slot.observe(response.status_code, response.headers.get("Retry-After"))
+        if not throttled or attempt == TILE_RETRIES:
+            break
+    response.raise_for_status()
+    return response.json()
+
+
+def tile_index(data):
+    """
+    RegionalRoadIndex of one Overpass response.
+    """
+    nodes = {}
+    ways = {}
+    for element in data.get("elements", []):
+        if element.get("type") == "node":
+            nodes[element["id"]] = (element["lat"], element["lon"])
+        elif element.get("type") == "way":
+            ways[element["id"]] = element
+    return road_index.RegionalRoadIndex.from_overpass_elements(nodes, ways)
+
+
+class TileCache:
+    def __init__(self, tile_deg=None, max_tiles=None, directory=None, fetch=fetch_tile_elements):
+        """
+        :param tile_deg: Tile size in degrees (default: config.PREFETCH_TILE_DEG).
+        :param max_tiles: Tiles kept in memory, least recently used dropped first (default: config.PREFETCH_MAX_TILES).
+        :param directory: Optional directory the raw Overpass responses are written to and read back from.
+        :param fetch: Callable (south, west, north, east) -> Overpass response dict.
+        """
+        self.tile_deg = tile_deg or config.PREFETCH_TILE_DEG
+        self.max_tiles = max_tiles or config.PREFETCH_MAX_TILES
+        self.directory = directory
+        self.fetch = fetch
+        self.tiles = OrderedDict()   # key -> RegionalRoadIndex
+        self.pending = {}            # key -> Future of a queued or running download
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "waits": 0, "misses": 0, "fetched": 0, "from_disk": 0, "failed": 0, "cancelled": 0}
+
+    def tile_path(self, key):
+        return os.path.join(self.directory, f"tile_{self.tile_deg:g}_{key[0]}_{key[1]}.json")
+
+    def load(self, key):
+        """
+        Read a tile from disk or download it, and keep it. Run on the prefetch threads.
+        """
+        try:
+            data = None
+            if self.directory:
+                try:
+                    with open(self.tile_path(key), "r", encoding="utf-8") as file:
+                        data = json.load(file)
+                    stat = "from_disk"
+                except (OSError, ValueError):
+                    data = None
+            if data is None:
+                data = self.fetch(tile_bounds(key, self.tile_deg))
+                stat = "fetched"
+                if self.directory:
+                    os.makedirs(self.directory, exist_ok=True)
+                    with open(self.tile_path(key), "w", encoding="utf-8") as file:
+                        json.dump(data, file)
+            index = tile_index(data)
+        except (requests.RequestException, OSError, ValueError) as e:
+            print(f"Prefetching tile {key} failed ({e}), classifying its points with osmnx")
+            index = None
+            stat = "failed"
+        with self.lock:
+            self.stats[stat] += 1
+            # Failed tiles are not kept, so the next route through them tries again
+            if index is not None:
+                self.tiles[key] = index
+                self.tiles.move_to_end(key)
+                while len(self.tiles) > self.max_tiles:
+                    self.tiles.popitem(last=False)
+            self.pending.pop(key, None)
+        return index
+
+    def schedule(self, key, executor):
+        """
+        Queue the tile's download on executor unless it is already loaded or queued.
+        :return: Future of the download queued now, or None if the tile is already cached or queued.
+        """
+        with self.lock:
+            if key in self.tiles:
+                return None
+            future = self.pending.get(key)
+            if future is not None and not future.cancelled():
+                return None
+            future = self.pending[key] = executor.submit(self.load, key)
+            return future
+
+    def cancel(self, futures):
+        """
+        Cancel the downloads that are still queued.
+        :param futures: Dict of tile key -> Future, as queued by schedule.
+        :return: Number of downloads cancelled.
+        """
+        cancelled = 0
+        with self.lock:
+            for key, future in futures.items():
+                if future.cancel():
+                    cancelled += 1
+                    if self.pending.get(key) is future:
+                        del self.pending[key]
+            self.stats["cancelled"] += cancelled
+        return cancelled
+
+    def road_type(self, lat, lon, wait=True):
+        """
+        Road type at (lat, lon) from its tile.
+        :param wait: Wait for the tile if its download is running. A queued download is never waited
+                     for, as the tiles ahead of it in the queue could take far longer than one lookup.
+        :return: Road type, or None if the tile is not cached (queued, failed or never requested).
+        """
+        key = tile_key(lat, lon, self.tile_deg)
+        with self.lock:
+            if key in self.tiles:
+                index = self.tiles[key]
+                self.tiles.move_to_end(key)
+                self.stats["hits"] += 1
+                future = None
+            else:
+                future = self.pending.get(key)
+                running = future is not None and future.running()
+                self.stats["waits" if running and wait else "misses"] += 1
+                if not running or not wait:
+                    return None
+        if future is not None:
+            index = future.result()
+        if index is None:
+            return None
+        return index.classify([(lat, lon)])[0]
+
+    def snapshot(self):
+        """
+        :return: Copy of the stats with the tiles cached and pending.
+        """
+        with self.lock:
+            return {**self.stats, "tiles": len(self.tiles), "pending": len(self.pending)}
+
+
+class PrefetchJob:
+    def __init__(self, cache, keys, futures):
+        """
+        Prefetch of one route's lookup points, returned by TilePrefetcher.prefetch.
+        :param cache: TileCache the downloads fill.
+        :param keys: The points' tiles in step order.
+        :param futures: Dict of tile key -> Future of the downloads this job queued (tiles already
+                        cached or queued by another job are not included).
+        """
+        self.cache = cache
+        self.keys = keys
+        self.futures = futures
+
+    def progress(self):
+        """
+        :return: Dict with the route's tiles, the downloads queued for it and how many of those are done.
+        """
+        return {
+            "tiles": len(self.keys),
+            "queued": len(self.futures),
+            "done": sum(1 for future in self.futures.values() if future.done()),
+        }
+
+    def wait(self, timeout=None):
+        for future in self.futures.values():
+            if not future.cancelled():
+                future.result(timeout)
+
+    def cancel(self):
+        """
+        Cancel this job's downloads that have not started, e.g. once the route is classified.
+        :return: Number of downloads cancelled.
+        """
+        return self.cache.cancel(self.futures)
+
+
+class TilePrefetcher:
+    def __init__(self, cache=None, workers=None):
+        """
+        :param cache: TileCache to fill (default: a new one).
+        :param workers: Downloads in flight at once (default: the Overpass concurrency limit, at least 1).
+                        The Overpass limiter still applies on top.
+        """
+        self.cache = cache if cache is not None else TileCache()
+        if workers is None:
+            workers = config.RATE_LIMITS.get("overpass", (0, 0, 0))[1] or 2
+        # A single FIFO queue keeps the downloads in route order
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def prefetch(self, points):
+        """
+        Queue the downloads of the tiles holding the points, in the order of the points.
+        :param points: (lat, lon) lookup points of a route that still need Overpass, in step order.
+        :return: PrefetchJob.
+        """
+        keys = point_tiles(points, self.cache.tile_deg)
+        futures = {}
+        for key in keys:
+            future = self.cache.schedule(key, self.executor)
+            if future is not None:
+                futures[key] = future
+        return PrefetchJob(self.cache, keys, futures)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_default_prefetcher = None
+_default_prefetcher_lock = threading.Lock()
+
+
+def default_prefetcher():
+    """
+    Process-wide prefetcher and tile cache, persisting tiles to config.LOCAL_GRAPH_DIR (not with a replay server).
+    """
+    global _default_prefetcher
+    with _default_prefetcher_lock:
+        if _default_prefetcher is None:
+            directory = config.LOCAL_GRAPH_DIR if config.REPLAY_URL is None else None
+            _default_prefetcher = TilePrefetcher(TileCache(directory=directory))
+        return _default_prefetcher
+
+
+def prefetch_route(points):
+    """
+    Start prefetching the tiles of a route's lookup points if ADAS_PREFETCH_TILES is set.
+    :param points: (lat, lon) points that still need Overpass, in step order.
+    :return: PrefetchJob (cancel it once the route is classified), or None when prefetching is off.
+    """
+    if not enabled() or not points:
+        return None
+    return default_prefetcher().prefetch(points)
+
+
+def cached_road_type(lat, lon):
+    """
+    Road type at (lat, lon) from the prefetched tiles, waiting for a tile whose download is running.
+    :return: Road type, or None when prefetching is off or the tile is not available.
+    """
+    if not enabled():
+        return None
+    return default_prefetcher().cache.road_type(lat, lon)
+
+
+def stats():
+    """
+    :return: Tile cache stats (hits, waits, misses, fetched, from_disk, failed, cancelled, tiles, pending),
+             {} when off.
+    """
+    if not enabled() or _default_prefetcher is None:
+        return {}
+    return _default_prefetcher.cache.snapshot()
@@ -0,0 +1,366 @@
+"""
+Rate limiting and adaptive concurrency for the public upstreams (Nominatim, OSRM, Overpass).
+
+Each upstream gets one UpstreamLimiter per process, combining
+- a token bucket for the request rate, optionally backed by SQLite so several
+  processes (app workers, API server) share one budget, and
+- an AIMD concurrency limit: starts at the configured concurrency, gains a slot per
+  limit successful responses up to the configured maximum, and is halved on a
+  429/503/504, which also pauses the upstream for its Retry-After.
+Limits come from config (ADAS_<SERVICE>_RATE / _CONCURRENCY / _MAX_CONCURRENCY).
+
+Usage:
+    with limiter("osrm").slot() as slot:
+        response = requests.get(url)
+        slot.observe(response.status_code, response.headers.get("Retry-After"))
+
+Libraries that make their own requests (osmnx) are throttled through
+requests_kwargs(), which takes a slot before each real request and releases it
+when the response arrives, so cache hits are never throttled.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import config
+
+THROTTLE_STATUSES = (429, 503, 504)
+
+# Pause applied after a 429/503/504 without a Retry-After header, in seconds
+DEFAULT_BACKOFF_S = {429: 10.0, 503: 5.0, 504: 5.0}
+
+# Requests kept for the wait-time percentiles
+WAIT_WINDOW = 1000
+
+
+def parse_retry_after(value):
+    """
+    :param value: Retry-After header value (seconds or an HTTP date), or None.
+    :return: Seconds to wait, or None.
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    In-process token bucket. Callers reserve a token and sleep for the returned time,
+    so waiting requests are served in order without polling.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: Tokens per second.
+        :param burst: Bucket size, i.e. requests allowed back to back.
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token.
+        :return: Seconds to wait before the request may be sent.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def block(self, seconds):
+        """
+        Hold back all requests for the given time (e.g. Retry-After).
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class SQLiteTokenBucket:
+    """
+    Token bucket shared by all processes using the same SQLite file.
+    """
+
+    def __init__(self, path, name, rate, burst=1):
+        """
+        :param path: SQLite database file.
+        :param name: Bucket name, one row per upstream.
+        """
+        self.path = path
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets "
+                "(name TEXT PRIMARY KEY, tokens REAL, updated REAL, blocked_until REAL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO token_buckets VALUES (?, ?, ?, 0)",
+                (name, float(self.burst), time.time()),
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the bucket usable from any thread
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def reserve(self):
+        with self._connect() as conn:
+            tokens, updated, blocked_until = conn.execute(
+                "SELECT tokens, updated, blocked_until FROM token_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.burst, tokens + max(now - updated, 0) * self.rate) - 1
+            conn.execute(
+                "UPDATE token_buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name)
+            )
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        return max(wait, blocked_until - now)
+
+    def block(self, seconds):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE token_buckets SET blocked_until = MAX(blocked_until, ?) WHERE name = ?",
+                (time.time() + seconds, self.name),
+            )
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted by additive increase / multiplicative decrease.
+    """
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.minimum = minimum
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, outcome):
+        """
+        :param outcome: "ok" grows the limit, "throttled" halves it, anything else leaves it.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif outcome == "throttled":
+                self.limit = max(self.minimum, self.limit / 2)
+            self.condition.notify_all()
+
+
+class Slot:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.outcome = "error"
+
+    def observe(self, status, retry_after=None):
+        """
+        Report the upstream's response.
+        :param status: HTTP status code.
+        :param retry_after: Retry-After header value, if any.
+        :return: True if the upstream throttled the request.
+        """
+        self.outcome = self.limiter.observe(status, retry_after)
+        return self.outcome == "throttled"
+
+
+class UpstreamLimiter:
+    def __init__(self, name, rate=0, concurrency=0, db_path=None, max_concurrency=0):
+        """
+        :param name: Upstream name ("nominatim", "osrm", "overpass").
+        :param rate: Requests per second, 0 for no rate limit.
+        :param concurrency: Requests in flight to start with, 0 for no limit. The adaptive limit starts here.
+        :param db_path: Optional SQLite file to share the rate limit across processes.
+        :param max_concurrency: Ceiling the adaptive limit grows to while responses succeed
+                                (default: concurrency, i.e. it only backs off).
+        """
+        self.name = name
+        self.rate = rate
+        self.bucket = None
+        if rate > 0:
+            burst = max(1, math.floor(rate))
+            self.bucket = SQLiteTokenBucket(db_path, name, rate, burst) if db_path else TokenBucket(rate, burst)
+        maximum = max(max_concurrency, concurrency)
+        self.concurrency = AdaptiveConcurrency(concurrency, maximum) if concurrency > 0 else None
+        self.blocked_until = 0.0  # Retry-After pause when there is no bucket to hold it
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.waits = deque(maxlen=WAIT_WINDOW)
+        self.counts = {"requests": 0, "throttled": 0, "errors": 0}
+        self.total_wait = 0.0
+
+    def acquire(self):
+        """
+        Wait for a concurrency slot and a token.
+        :return: Seconds waited.
+        """
+        start = time.monotonic()
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+        wait = self.bucket.reserve() if self.bucket is not None else self.blocked_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        waited = time.monotonic() - start
+        with self.lock:
+            self.counts["requests"] += 1
+            self.waits.append(waited)
+            self.total_wait += waited
+        return waited
+
+    def release(self, outcome):
+        if self.concurrency is not None:
+            self.concurrency.release(outcome)
+        if outcome == "error":
+            with self.lock:
+                self.counts["errors"] += 1
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold a slot for one request; report the response with slot.observe.
+        """
+        self.acquire()
+        slot = Slot(self)
+        try:
+            yield slot
+        finally:
+            self.release(slot.outcome)
+
+    def observe(self, status, retry_after=None):
+        """
+        Apply a response's status: pause the upstream on 429/503/504.
+        :return: "throttled" or "ok".
+        """
+        if status not in THROTTLE_STATUSES:
+            return "ok"
+        pause = parse_retry_after(retry_after)
+        if pause is None:
+            pause = DEFAULT_BACKOFF_S[status]
+        if self.bucket is not None:
+            self.bucket.block(pause)
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            self.counts["throttled"] += 1
+        print(f"{self.name} responded {status}, pausing requests for {pause:.0f} s")
+        return "throttled"
+
+    def stats(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            stats = {
+                **self.counts,
+                "rate": self.rate,
+                "wait_s_total": round(self.total_wait, 3),
+                "wait_s_p50": round(waits[len(waits) // 2], 4) if waits else None,
+                "wait_s_max": round(waits[-1], 4) if waits else None,
+            }
+        if self.concurrency is not None:
+            stats["concurrency_limit"] = int(self.concurrency.limit)
+            stats["in_flight"] = self.concurrency.in_flight
+        return stats
+
+    # --- Throttling requests made by other libraries (osmnx) ---
+
+    def auth(self, request):
+        """
+        requests auth hook, called before a request is sent: take a slot for this thread.
+        Status endpoints are not throttled.
+        """
+        if not request.url.split("?", 1)[0].endswith("/status") and not getattr(self.local, "held", False):
+            self.acquire()
+            self.local.held = True
+        return request
+
+    def response_hook(self, response, *args, **kwargs):
+        if response.url.split("?", 1)[0].endswith("/status"):
+            return response
+        outcome = self.observe(response.status_code, response.headers.get("Retry-After"))
+        if getattr(self.local, "held", False):
+            self.local.held = False
+            self.release(outcome)
+        return response
+
+    @contextmanager
+    def thread_scope(self):
+        """
+        Release a slot taken by auth() if the request failed without a response.
+        """
+        try:
+            yield
+        finally:
+            if getattr(self.local, "held", False):
+                self.local.held = False
+                self.release("error")
+
+    def requests_kwargs(self):
+        """
+        Keyword arguments for requests calls (e.g. osmnx settings.requests_kwargs) throttled by this limiter.
+        """
+        return {"auth": self.auth, "hooks": {"response": [self.response_hook]}}
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(service):
+    """
+    Process-wide limiter for an upstream, following the current config.RATE_LIMITS.
+    :param service: "nominatim", "osrm" or "overpass".
+    """
+    rate, concurrency, max_concurrency = config.RATE_LIMITS.get(service, (0, 0, 0))
+    key = (service, rate, concurrency, max_concurrency, config.RATE_LIMIT_DB)
+    with _limiters_lock:
+        current = _limiters.get(service)
+        if current is None or current[0] != key:
+            current = _limiters[service] = (
+                key, UpstreamLimiter(service, rate, concurrency, config.RATE_LIMIT_DB, max_concurrency)
+            )
+        return current[1]
+
+
+def stats():
+    """
+    :return: Dict of upstream name -> limiter stats.
+    """
+    with _limiters_lock:
+        limiters = [entry[1] for entry in _limiters.values()]
+    return {item.name: item.stats() for item in limiters}
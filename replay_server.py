@@ -0,0 +1,436 @@
+"""
+Local stand-in for the Nominatim, OSRM and Overpass services.
+
+Serves recorded responses from a fixture directory so the pipeline, load tests
+and benchmarks run without network access:
+- GET  /search?q=<place>              Nominatim geocoding
+- GET  /route/v1/driving/<lon,lat;..> OSRM routing (geometries=geojson or polyline6; alternatives
+                                      returns the recorded alternatives, otherwise only routes[0])
+- POST /api/interpreter               Overpass, answered from osmnx cache files; a query with no
+                                      cache file gets the cached ways in its polygon
+- GET  /api/status                    Overpass slot status
+
+Geocoding and routes come from the route fixtures (fixtures/routes/*.json.gz) and
+an optional fixtures/geocode.json ({"place": {"lat": .., "lon": ..}}). Overpass
+queries are looked up the same way osmnx keys its cache, so cache/ works as-is. A
+query that was never recorded (e.g. a step location of another route) is answered
+with the ways from all cache files that cross the query polygon's bounding box.
+
+Usage:
+    python replay_server.py --port 8765 --latency-ms 50 --failure-rate 0.01
+    ADAS_REPLAY_URL=http://127.0.0.1:8765 streamlit run streamlit_ui.py
+
+or in-process:
+    with ReplayServer() as server:
+        config.use_services(server.url)
+        ...
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, parse_qsl, unquote, urlsplit
+
+import numpy as np
+import requests
+
+from geometry_codec import encode_polyline
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURE_DIR = os.path.join(BASE_DIR, "fixtures")
+DEFAULT_OVERPASS_DIRS = [os.path.join(DEFAULT_FIXTURE_DIR, "overpass"), os.path.join(BASE_DIR, "cache")]
+
+# osmnx keys its cache on the prepared URL of the public endpoint
+CANONICAL_OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+OVERPASS_STATUS = (
+    "Connected as: 0\n"
+    "Current time: 1970-01-01T00:00:00Z\n"
+    "Announced endpoint: none\n"
+    "Rate limit: 0\n"
+    "4 slots available now.\n"
+    "Currently running queries (pid, space limit, time limit, start time):\n"
+)
+
+# osmnx queries an area as (poly:'lat lon lat lon ...')
+POLY_PATTERN = re.compile(r"poly:[\"']([-0-9. ]+)[\"']")
+
+
+def coords_key(coords):
+    """
+    Normalize a sequence of (lat, lon) pairs into a lookup key (5 decimals, about 1 m).
+    """
+    return tuple((round(float(lat), 5), round(float(lon), 5)) for lat, lon in coords)
+
+
+def normalize_place(place):
+    return " ".join(place.lower().split())
+
+
+class ReplayFixtures:
+    """
+    Index of the recorded responses in a fixture directory.
+    """
+
+    def __init__(self, fixture_dir=DEFAULT_FIXTURE_DIR, overpass_dirs=None):
+        self.fixture_dir = fixture_dir
+        self.overpass_dirs = overpass_dirs if overpass_dirs is not None else DEFAULT_OVERPASS_DIRS
+        self.places = {}
+        self.routes = {}
+        self.encoded_routes = {}
+        self.cached_ways = None
+        self.cached_ways_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        for path in sorted(glob.glob(os.path.join(self.fixture_dir, "routes", "*.json.gz"))):
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                fixture = json.load(file)
+            self.add_route([fixture["source_coords"], fixture["destination_coords"]], fixture["osrm"])
+            self.add_place(fixture["source"], *fixture["source_coords"])
+            self.add_place(fixture["destination"], *fixture["destination_coords"])
+
+        geocode_file = os.path.join(self.fixture_dir, "geocode.json")
+        if os.path.exists(geocode_file):
+            with open(geocode_file, "r", encoding="utf-8") as file:
+                for place, entry in json.load(file).items():
+                    self.add_place(place, entry["lat"], entry["lon"], entry.get("display_name"))
+
+    def add_place(self, place, lat, lon, display_name=None):
+        self.places[normalize_place(place)] = {
+            "lat": str(lat),
+            "lon": str(lon),
+            "display_name": display_name or place,
+        }
+
+    def add_route(self, coords, response):
+        """
+        :param coords: Request coordinates as (lat, lon) pairs.
+        :param response: OSRM response dict to return for them.
+        """
+        self.routes[coords_key(coords)] = response
+
+    def geocode(self, query):
+        place = self.places.get(normalize_place(query))
+        return [place] if place else []
+
+    def route(self, coords, geometries="geojson"):
+        """
+        :param geometries: "geojson" returns the fixture as recorded, "polyline6" with encoded geometries.
+        """
+        key = coords_key(coords)
+        response = self.routes.get(key)
+        if response is None or geometries != "polyline6":
+            return response
+        if key not in self.encoded_routes:
+            self.encoded_routes[key] = encode_route_geometries(response)
+        return self.encoded_routes[key]
+
+    def overpass(self, form_data):
+        """
+        Look up an Overpass response by its osmnx cache key.
+        :param form_data: List of (key, value) pairs POSTed to the interpreter.
+        :return: The cached response dict, or None on a miss.
+        """
+        prepared_url = requests.Request("GET", CANONICAL_OVERPASS_URL, params=dict(form_data)).prepare().url
+        digest = sha1(prepared_url.encode("utf-8")).hexdigest()
+        for directory in self.overpass_dirs:
+            path = os.path.join(directory, f"{digest}.json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as file:
+                    return json.load(file)
+        return None
+
+    def overpass_area(self, form_data):
+        """
+        Answer an Overpass query from the ways of all cache files that cross its polygon's bounding box.
+        :return: Response dict, or None if the query has no polygon or no cached node lies in its area.
+        """
+        match = POLY_PATTERN.search(dict(form_data).get("data", ""))
+        if match is None:
+            return None
+        values = [float(value) for value in match.group(1).split()]
+        lats, lons = values[0::2], values[1::2]
+        nodes, ways, bounds = self.load_cached_ways()
+        if not ways:
+            return None
+        hits = np.flatnonzero(
+            (bounds[:, 0] <= max(lats)) & (bounds[:, 2] >= min(lats))
+            & (bounds[:, 1] <= max(lons)) & (bounds[:, 3] >= min(lons))
+        )
+        node_ids = set()
+        for hit in hits:
+            node_ids.update(ways[hit]["nodes"])
+        # Ways passing by without a cached node in the area give osmnx an empty graph: a miss
+        if not any(min(lats) <= nodes[node][0] <= max(lats) and min(lons) <= nodes[node][1] <= max(lons)
+                   for node in node_ids):
+            return None
+        elements = []
+        elements.extend({"type": "node", "id": node, "lat": nodes[node][0], "lon": nodes[node][1]}
+                        for node in sorted(node_ids))
+        elements.extend(ways[hit] for hit in hits)
+        return {"version": 0.6, "generator": "ADAS replay server", "elements": elements}
+
+    def load_cached_ways(self):
+        """
+        Merge the highway ways of all Overpass cache files once, with their bounding boxes.
+        :return: (dict of node id -> (lat, lon), list of ways, array of [min lat, min lon, max lat, max lon])
+        """
+        with self.cached_ways_lock:
+            if self.cached_ways is None:
+                from local_router import load_overpass_elements
+
+                paths = []
+                for directory in self.overpass_dirs:
+                    paths.extend(sorted(glob.glob(os.path.join(directory, "*.json"))))
+                nodes, all_ways = load_overpass_elements(paths)
+                ways, bounds = [], []
+                for way in all_ways.values():
+                    if "highway" not in way.get("tags", {}):
+                        continue
+                    points = [nodes[node] for node in way.get("nodes", []) if node in nodes]
+                    if len(points) < 2:
+                        continue
+                    way = dict(way, nodes=[node for node in way["nodes"] if node in nodes])
+                    lats = [lat for lat, _ in points]
+                    lons = [lon for _, lon in points]
+                    ways.append(way)
+                    bounds.append((min(lats), min(lons), max(lats), max(lons)))
+                self.cached_ways = nodes, ways, np.array(bounds, dtype=float).reshape(-1, 4)
+            return self.cached_ways
+
+
+def encode_route_geometries(response):
+    """
+    Copy of a geojson OSRM response with the route and step geometries as polyline6 strings.
+    """
+    encoded = dict(response, routes=[])
+    for route in response.get("routes", []):
+        legs = []
+        for leg in route.get("legs", []):
+            steps = [dict(step, geometry=encode_polyline(step["geometry"]["coordinates"])) for step in leg.get("steps", [])]
+            legs.append(dict(leg, steps=steps))
+        encoded["routes"].append(dict(route, geometry=encode_polyline(route["geometry"]["coordinates"]), legs=legs))
+    return encoded
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server_version = "ADASReplay/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/search":
+            service = "nominatim"
+        elif url.path.startswith("/route/v1/"):
+            service = "osrm"
+        elif url.path.endswith("/status"):
+            self.send_text(200, OVERPASS_STATUS)
+            return
+        else:
+            self.send_json(404, {"message": f"Unknown endpoint: {url.path}"})
+            return
+
+        if self.inject(service):
+            return
+        params = parse_qs(url.query)
+        if service == "nominatim":
+            self.send_json(200, self.server.fixtures.geocode(params.get("q", [""])[0]))
+            return
+
+        # /route/v1/driving/lon,lat;lon,lat
+        coordinates = unquote(url.path.rsplit("/", 1)[-1])
+        try:
+            coords = [(float(lat), float(lon)) for lon, lat in (pair.split(",") for pair in coordinates.split(";"))]
+        except ValueError:
+            self.send_json(400, {"code": "InvalidQuery", "message": "Query string malformed close to position 0"})
+            return
+        geometries = params.get("geometries", ["geojson"])[0]
+        if geometries not in ("geojson", "polyline6"):
+            self.send_json(400, {"code": "InvalidOptions", "message": f"Geometries {geometries} is not supported"})
+            return
+        response = self.server.fixtures.route(coords, geometries)
+        if response is None:
+            self.send_json(400, {"code": "NoRoute", "message": "No recorded route for these coordinates"})
+            return
+        alternatives = params.get("alternatives", ["false"])[0]
+        if alternatives in ("false", "0") and len(response.get("routes", [])) > 1:
+            response = dict(response, routes=response["routes"][:1])
+        self.send_json(200, response)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if not url.path.endswith("/interpreter"):
+            self.send_json(404, {"message": f"Unknown endpoint: {url.path}"})
+            return
+        if self.inject("overpass"):
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        form_data = parse_qsl(self.rfile.read(length).decode("utf-8"), keep_blank_values=True)
+        fixtures = self.server.fixtures
+        response = fixtures.overpass(form_data)
+        if response is None:
+            response = fixtures.overpass_area(form_data)
+            outcome = "area" if response is not None else "miss"
+            with self.server.lock:
+                self.server.overpass_counts[outcome] = self.server.overpass_counts.get(outcome, 0) + 1
+        if response is None:
+            # Same shape Overpass returns for an area without matching data
+            response = {"version": 0.6, "generator": "ADAS replay server", "elements": []}
+        self.send_json(200, response)
+
+    def inject(self, service):
+        """
+        Apply the configured latency and failure injection.
+        :return: True if a failure response was sent and the request is done.
+        """
+        server = self.server
+        latency_ms = server.latency_ms.get(service, server.latency_ms.get("default", 0))
+        with server.lock:
+            jitter = server.rng.uniform(-server.jitter_ms, server.jitter_ms) if server.jitter_ms else 0
+            fail = server.rng.random() < server.failure_rate.get(service, server.failure_rate.get("default", 0))
+            server.request_counts[service] = server.request_counts.get(service, 0) + 1
+        delay = max(latency_ms + jitter, 0) / 1000
+        if delay:
+            time.sleep(delay)
+        if fail:
+            with server.lock:
+                server.failure_counts[service] = server.failure_counts.get(service, 0) + 1
+            self.send_json(server.failure_status, {"message": "Injected failure"})
+            return True
+        return False
+
+    def send_json(self, status, payload):
+        self.send_body(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def send_text(self, status, text):
+        self.send_body(status, text.encode("utf-8"), "text/plain")
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ReplayServer:
+    """
+    Threaded HTTP server answering Nominatim, OSRM and Overpass requests from fixtures.
+    Can run as a script or in-process on a background thread.
+    """
+
+    def __init__(self, fixture_dir=DEFAULT_FIXTURE_DIR, overpass_dirs=None, host="127.0.0.1", port=0,
+                 latency_ms=0, jitter_ms=0, failure_rate=0.0, failure_status=503, seed=0, verbose=False):
+        """
+        :param fixture_dir: Directory with routes/*.json.gz and an optional geocode.json.
+        :param overpass_dirs: Directories holding osmnx-style Overpass cache files.
+        :param port: Port to listen on; 0 picks a free port.
+        :param latency_ms: Added latency in ms, either a number or a dict per service
+                           ("nominatim", "osrm", "overpass", "default").
+        :param jitter_ms: Uniform +/- jitter added to the latency.
+        :param failure_rate: Probability of an injected failure, a number or a dict per service.
+        :param failure_status: HTTP status returned for injected failures.
+        :param seed: Seed for latency jitter and failure injection, so runs are repeatable.
+        """
+        self.fixtures = ReplayFixtures(fixture_dir, overpass_dirs)
+        self.httpd = ThreadingHTTPServer((host, port), ReplayHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fixtures = self.fixtures
+        self.httpd.latency_ms = latency_ms if isinstance(latency_ms, dict) else {"default": latency_ms}
+        self.httpd.failure_rate = failure_rate if isinstance(failure_rate, dict) else {"default": failure_rate}
+        self.httpd.jitter_ms = jitter_ms
+        self.httpd.failure_status = failure_status
+        self.httpd.rng = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_counts = {}
+        self.httpd.failure_counts = {}
+        # Overpass queries without a cache file: "area" answered from the cached ways, "miss" not at all
+        self.httpd.overpass_counts = {}
+        self.httpd.verbose = verbose
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        with self.httpd.lock:
+            return {"requests": dict(self.httpd.request_counts), "failures": dict(self.httpd.failure_counts),
+                    "overpass": dict(self.httpd.overpass_counts)}
+
+    def start(self):
+        """
+        Serve on a background thread and return the base URL.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve recorded Nominatim, OSRM and Overpass responses.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURE_DIR, help="Fixture directory.")
+    parser.add_argument("--overpass-dir", action="append", help="Overpass cache directory (repeatable).")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency added to every response.")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform +/- jitter on the latency.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of an injected failure.")
+    parser.add_argument("--failure-status", type=int, default=503, help="HTTP status of injected failures.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args(argv)
+
+    server = ReplayServer(
+        fixture_dir=args.fixtures,
+        overpass_dirs=args.overpass_dir,
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    print(f"Replay server listening on {server.url} "
+          f"({len(server.fixtures.routes)} routes, {len(server.fixtures.places)} places)")
+    print(f"Point the app at it with: ADAS_REPLAY_URL={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Served: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Incremental re-routing that reuses the work done for the previous route.
+
+A RerouteSession remembers the last route it processed. When the destination is
+tweaked, or a vehicle asks for a new route from where it is, most steps of the new
+OSRM route are the same as before (a shared prefix, or a shared approach to the same
+destination). The session reuses:
+- road types: every step whose (ref, coordinate) query was classified for the previous
+  route keeps its road type; only the new steps go to the regional index or Overpass,
+- groups: the identifiers' state is checkpointed after every step, so the grouping
+  resumes at the first step that differs from the previous route instead of at the start,
+- ADAS segments: the segments of each closed group are kept and only the groups that
+  are new are run through the ADAS processors.
+The OSRM call itself still has to be made, so a reroute costs one OSRM request plus
+the classifications of the changed steps.
+
+With ADAS_DENSE_ROAD_CLASSES the ADAS segments come from map_matching as usual; that is
+a single vectorized lookup for the whole route.
+
+Usage:
+    session = RerouteSession("Level 2")
+    session.route("Heilbronn", "Stuttgart")
+    session.route("Heilbronn", "München")          # reuses the shared part
+    session.route((49.15, 9.21), "München")        # from a vehicle position
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from main import DEFAULT_CONCURRENCY, process_route_async, adas_segments_from_groups
+from routeprocessing import RouteProcessor
+from identify_highways import HighwayIdentifier
+from identify_major_roads import MajorRoadIdentifier
+from identify_local_roads import LocalRoadIdentifier
+from combined_road_grouper import CombinedRoadGrouper
+from artifacts import default_store
+from singleflight import normalize_place
+
+GROUP_KINDS = ("highway", "major", "local")
+
+
+def shared_prefix_length(previous, current):
+    """
+    :return: Number of leading entries the two sequences have in common.
+    """
+    shared = 0
+    for old, new in zip(previous, current):
+        if old != new:
+            break
+        shared += 1
+    return shared
+
+
+class RerouteSession:
+    def __init__(self, autonomous_level, concurrency=DEFAULT_CONCURRENCY, store=None, render_maps=True):
+        """
+        :param autonomous_level: "Level 0", "Level 1" or "Level 2".
+        :param concurrency: Maximum number of upstream calls in flight at once.
+        :param store: ArtifactStore for the artifacts (default: the process-wide store).
+        :param render_maps: False skips the route JSON and both maps.
+        """
+        self.autonomous_level = autonomous_level.strip()
+        self.concurrency = concurrency
+        self.store = store if store is not None else default_store()
+        self.render_maps = render_maps
+        self.processor = None
+        self.lock = threading.Lock()
+        # Geocoded places (normalized name -> (lat, lon)), so a changed destination does not geocode the source again
+        self.places = {}
+        # What was kept from the last route
+        self.road_types = {}            # (ref, coord) query -> road type
+        self.intersection_data = ()
+        self.checkpoints = [self.initial_checkpoint()]
+        self.closed_groups = {kind: [] for kind in GROUP_KINDS}
+        self.group_segments = {}        # (kind, group) -> ADAS segments of that group alone
+        self.last_stats = {}
+
+    @staticmethod
+    def initial_checkpoint():
+        """
+        Identifier state before the first step: no open group, no closed groups.
+        """
+        return {kind: (None, 0) for kind in GROUP_KINDS}
+
+    def locate(self, place):
+        """
+        :param place: Place name, or a (lat, lon) pair such as a vehicle position.
+        :return: (lat, lon), geocoded at most once per session for names.
+        """
+        if not isinstance(place, str):
+            lat, lon = place
+            return float(lat), float(lon)
+        key = normalize_place(place)
+        if key not in self.places:
+            self.places[key] = self.processor.get_lat_lon(place)
+        return self.places[key]
+
+    def route(self, source, destination, via=()):
+        """
+        Process a route like main.process_route, reusing what the previous route of this session classified.
+        Sessions route one request at a time.
+        :param source: Place name or (lat, lon) pair.
+        :param destination: Place name or (lat, lon) pair.
+        :param via: Optional stops, names or (lat, lon) pairs.
+        :return: The process_route dict, plus "reroute" with the step count, the steps shared with the
+                 previous route and how many road types and groups were reused.
+        """
+        with self.lock:
+            if self.processor is None:
+                self.processor = RouteProcessor()
+            places = (source, *via, destination)
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                waypoint_coords = list(pool.map(self.locate, places))
+            return asyncio.run(process_route_async(
+                waypoint_coords[0], waypoint_coords[-1], self.autonomous_level, self.concurrency,
+                store=self.store, render_maps=self.render_maps, via=waypoint_coords[1:-1], reroute=self,
+            ))
+
+    def known_road_types(self, queries, road_types):
+        """
+        Fill in the road types the previous route already classified.
+        :param queries: (ref, coord) query per step of the new route.
+        :param road_types: Road type per query known so far (e.g. from the regional index), None where unknown.
+        :return: New list, None only where the query still needs classifying.
+        """
+        known = [
+            road_type if road_type is not None else self.road_types.get(query)
+            for query, road_type in zip(queries, road_types)
+        ]
+        self.last_stats = {
+            "steps": len(queries),
+            "reused_road_types": sum(
+                1 for road_type, query in zip(road_types, queries) if road_type is None and query in self.road_types
+            ),
+            "classified": sum(1 for road_type in known if road_type is None),
+        }
+        return known
+
+    def remember_road_types(self, queries, road_types):
+        """
+        Keep the new route's road types for the next reroute (only this route's, so the memo does not grow).
+        """
+        self.road_types = dict(zip(queries, road_types))
+
+    def adas_segments(self, intersection_data, autonomous_level=None):
+        """
+        ADAS segments of the new route, grouping only from the first step that differs from the previous
+        route and running only the new groups through the ADAS processors. Same result as
+        main.compute_adas_segments.
+        :param intersection_data: Tuple of intersection tuples of the new route.
+        :return: List of ADAS segment dicts (new dicts, safe to modify).
+        """
+        autonomous_level = autonomous_level or self.autonomous_level
+        shared = shared_prefix_length(self.intersection_data, intersection_data)
+
+        # Resume the identifiers where the previous route was after the shared steps
+        identifiers = {"highway": HighwayIdentifier(), "major": MajorRoadIdentifier(), "local": LocalRoadIdentifier()}
+        checkpoint = self.checkpoints[shared]
+        closed_groups = {}
+        for kind, (open_group, closed_count) in checkpoint.items():
+            identifiers[kind].current_group = dict(open_group) if open_group is not None else None
+            closed_groups[kind] = self.closed_groups[kind][:closed_count]
+        checkpoints = self.checkpoints[:shared + 1]
+
+        for entry in intersection_data[shared:]:
+            for kind, identifier in identifiers.items():
+                group = identifier.add_entry(entry)
+                if group is not None:
+                    closed_groups[kind].append(group)
+            checkpoints.append({
+                kind: (dict(identifier.current_group) if identifier.current_group is not None else None,
+                       len(closed_groups[kind]))
+                for kind, identifier in identifiers.items()
+            })
+
+        # The groups still open at the destination close there, but may go on after it in a later route
+        grouped = {kind: list(groups) for kind, groups in closed_groups.items()}
+        for kind, identifier in identifiers.items():
+            group = identifier.finish()
+            if group is not None:
+                grouped[kind].append(group)
+
+        group_segments = {}
+        if autonomous_level == "Level 0":
+            # Level 0 works on highway and major road groups combined end to start
+            combined = CombinedRoadGrouper(grouped["highway"], grouped["major"]).combine()
+            grouped_by_kind = [("combined", group) for group in combined]
+        else:
+            grouped_by_kind = [(kind, group) for kind in GROUP_KINDS for group in grouped[kind]]
+        reused_groups = 0
+        adas_segments = []
+        for kind, group in grouped_by_kind:
+            key = (autonomous_level, kind, group)
+            if key in self.group_segments:
+                reused_groups += 1
+                segments = self.group_segments[key]
+            else:
+                segments = self.segments_for_group(autonomous_level, kind, group)
+            group_segments[key] = segments
+            adas_segments.extend(dict(seg) for seg in segments)
+
+        self.intersection_data = tuple(intersection_data)
+        self.checkpoints = checkpoints
+        self.closed_groups = closed_groups
+        self.group_segments = group_segments
+        self.last_stats.update({
+            "shared_steps": shared,
+            "groups": len(grouped_by_kind),
+            "reused_groups": reused_groups,
+        })
+        return adas_segments
+
+    @staticmethod
+    def segments_for_group(autonomous_level, kind, group):
+        """
+        ADAS segments of one group on its own. Every ADAS processor handles its groups one by one, so
+        concatenating these in the batch order gives the batch result.
+        """
+        if kind in ("highway", "combined"):
+            return adas_segments_from_groups([group], [], [], autonomous_level)
+        if kind == "major":
+            return adas_segments_from_groups([], [group], [], autonomous_level)
+        return adas_segments_from_groups([], [], [group], autonomous_level)
+
+    def stats(self):
+        """
+        :return: Dict describing what the last route reused from the one before.
+        """
+        return dict(self.last_stats)
@@ -0,0 +1,264 @@
+"""
+Durable store of complete processed routes, shared by all processes on a host.
+
+The in-memory caches (artifacts, road types, tiles) start empty in every new process, so
+each Streamlit worker or API restart computes its routes from scratch. ResultStore keeps
+whole process_route results in a SQLite file instead: route geometry, the classified
+steps (intersection_data), the road groups, the ADAS segments and the generated maps and
+CSV, one entry per normalized request (places as in singleflight.normalize_place, stops
+and autonomous level).
+
+Every entry records two versions:
+- pipeline_version(): a hash of the pipeline's source code (classification, grouping and
+  ADAS rules) and of the settings that change results (upstream servers, road index,
+  dense classes, local routing),
+- osm_version(): ADAS_OSM_TIMESTAMP, or the modification time of the road index and
+  local graph snapshots.
+An entry written under other versions is never returned; it is deleted when found, and
+all of them are purged when the store is opened. Beyond max_bytes the least recently
+used entries are evicted, so popular routes stay.
+
+Enable with ADAS_RESULT_DB=/path/results.sqlite; see config.py.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import config
+from routeprocessing import ADAS_MAP_ARTIFACT
+from singleflight import normalize_place
+
+# Modules whose code determines the result of process_route
+PIPELINE_MODULES = (
+    "main.py", "routeprocessing.py", "route_geometry.py", "geometry_codec.py", "road_index.py", "map_matching.py",
+    "local_router.py", "prefetch.py", "identify_highways.py", "identify_major_roads.py", "identify_local_roads.py",
+    "combined_road_grouper.py", "adas_stream.py", "adas_features.py", "adas_processor_level0.py",
+    "adas_processor_level1.py", "adas_processor_level2.py", "add_adas_markers.py", "result_store.py",
+)
+
+_source_digest = None
+
+
+def pipeline_version():
+    """
+    Hash of the pipeline modules' source (read once per process) and the result-relevant settings.
+    """
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in PIPELINE_MODULES:
+            try:
+                with open(os.path.join(directory, name), "rb") as file:
+                    digest.update(file.read())
+            except OSError:
+                digest.update(b"missing:" + name.encode())
+        _source_digest = digest.hexdigest()
+    settings = (
+        config.OSRM_BASE_URL, config.NOMINATIM_URL, config.OVERPASS_URL, config.OSRM_GEOMETRIES,
+        config.ROAD_INDEX, config.DENSE_ROAD_CLASSES, config.LOCAL_ROUTING, config.LOCAL_GRAPH_FILE,
+    )
+    return hashlib.sha256((_source_digest + repr(settings)).encode()).hexdigest()[:16]
+
+
+def osm_version():
+    """
+    Version of the OSM data: ADAS_OSM_TIMESTAMP if set, otherwise the modification times of the
+    road index and local graph snapshots in use ("" when neither is used).
+    """
+    if config.OSM_TIMESTAMP:
+        return config.OSM_TIMESTAMP
+    parts = []
+    snapshots = [config.ROAD_INDEX]
+    if config.LOCAL_ROUTING != "off":
+        snapshots.append(config.LOCAL_GRAPH_FILE)
+    for path in snapshots:
+        if path and os.path.exists(path):
+            parts.append(f"{os.path.basename(path)}@{int(os.path.getmtime(path))}")
+    return ";".join(parts)
+
+
+def request_key(source, destination, autonomous_level, via=()):
+    """
+    :return: Normalized request string: places as in normalize_place, the stops in order, the level.
+    """
+    places = [normalize_place(source), *(normalize_place(place) for place in via), normalize_place(destination)]
+    return " -> ".join(places) + " | " + autonomous_level.strip()
+
+
+class ResultStore:
+    def __init__(self, path, max_bytes=None):
+        """
+        :param path: SQLite database file (created if missing).
+        :param max_bytes: Size budget for the stored results, least recently used evicted first
+                          (default: config.RESULT_MAX_BYTES).
+        """
+        self.path = path
+        self.max_bytes = max_bytes if max_bytes is not None else config.RESULT_MAX_BYTES
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "puts": 0, "evictions": 0}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, pipeline TEXT, osm TEXT, has_maps INTEGER, data BLOB, size INTEGER, "
+                "created REAL, accessed REAL, hits INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            # Readers in other processes are not blocked by a writer
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the store usable from any thread
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _count(self, stat, amount=1):
+        with self.lock:
+            self.stats[stat] += amount
+
+    def get(self, source, destination, autonomous_level, via=(), render_maps=True, store=None):
+        """
+        :param render_maps: Whether the caller needs the maps; entries stored without them do not count then.
+        :param store: ArtifactStore the stored maps and CSV are put back into (default: the process-wide store).
+        :return: The process_route result, with "artifacts" pointing into store, or None.
+        """
+        key = request_key(source, destination, autonomous_level, via)
+        with self._connect() as conn:
+            row = conn.execute("SELECT pipeline, osm, has_maps, data FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and (row[0], row[1]) != (pipeline_version(), osm_version()):
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._count("stale")
+                row = None
+            if row is None or (render_maps and not row[2]):
+                self._count("misses")
+                return None
+            conn.execute("UPDATE results SET accessed = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        self._count("hits")
+
+        result, artifact_data = pickle.loads(zlib.decompress(row[3]))
+        if store is None:
+            from artifacts import default_store
+            store = default_store()
+        # Content-addressed: the artifacts get back their digests
+        result["artifacts"] = {name: store.put(data) for name, data in artifact_data.items()}
+        return result
+
+    def put(self, source, destination, autonomous_level, result, via=(), store=None):
+        """
+        Store a process_route result (with intersection_data and groups) and the artifacts it refers to.
+        An entry with maps is not replaced by one without.
+        """
+        if store is None:
+            from artifacts import default_store
+            store = default_store()
+        artifact_data = {}
+        for name, digest in result.get("artifacts", {}).items():
+            data = store.get(digest)
+            if data is not None:
+                artifact_data[name] = data
+        has_maps = ADAS_MAP_ARTIFACT in artifact_data
+        stored = {name: value for name, value in result.items() if name not in ("artifacts", "reroute")}
+        data = zlib.compress(pickle.dumps((stored, artifact_data), protocol=pickle.HIGHEST_PROTOCOL), 1)
+        if len(data) > self.max_bytes:
+            return
+
+        key = request_key(source, destination, autonomous_level, via)
+        now = time.time()
+        with self._connect() as conn:
+            existing = conn.execute("SELECT pipeline, osm, has_maps FROM results WHERE key = ?", (key,)).fetchone()
+            if existing is not None and existing[2] and not has_maps and existing[:2] == (pipeline_version(), osm_version()):
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, pipeline_version(), osm_version(), int(has_maps), data, len(data), now, now),
+            )
+            self._evict(conn)
+        self._count("puts")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def invalidate(self, source=None, destination=None, autonomous_level=None, via=()):
+        """
+        Delete one request's entry, or with no arguments every entry.
+        :return: Number of entries deleted.
+        """
+        with self._connect() as conn:
+            if source is None:
+                return conn.execute("DELETE FROM results").rowcount
+            key = request_key(source, destination, autonomous_level, via)
+            return conn.execute("DELETE FROM results WHERE key = ?", (key,)).rowcount
+
+    def purge_stale(self):
+        """
+        Delete the entries written by another pipeline or OSM data version.
+        :return: Number of entries deleted.
+        """
+        with self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM results WHERE pipeline != ? OR osm != ?", (pipeline_version(), osm_version())
+            ).rowcount
+        self._count("stale", deleted)
+        return deleted
+
+    def snapshot(self):
+        """
+        :return: Copy of the stats with the number of entries and their total size.
+        """
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        with self.lock:
+            return {**self.stats, "entries": entries, "bytes": size}
+
+
+_default_result_store = None
+_default_result_store_path = None
+_default_result_store_lock = threading.Lock()
+
+
+def default_result_store():
+    """
+    Process-wide store at config.RESULT_DB, or None when it is not set. Stale entries are purged on opening.
+    """
+    global _default_result_store, _default_result_store_path
+    path = config.RESULT_DB
+    if not path:
+        return None
+    with _default_result_store_lock:
+        if _default_result_store_path != path:
+            _default_result_store = ResultStore(path)
+            _default_result_store_path = path
+            deleted = _default_result_store.purge_stale()
+            if deleted:
+                print(f"Result store: dropped {deleted} results of an older pipeline or OSM data version")
+        return _default_result_store
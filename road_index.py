@@ -0,0 +1,296 @@
+"""
+Regional road index for classifying road types without a download per step.
+
+Instead of an Overpass query around every step (osmnx graph_from_point), one regional
+road network is loaded per process from a local snapshot and split into straight
+segments held in a shapely STRtree. A whole route's step points are then classified
+in a single vectorized nearest-segment query, from the highway tag of the nearest
+road within 50 m (osmnx_road_type used whichever edge of the 50 m download came
+first, not the nearest one).
+
+Coordinates are indexed as (lon * cos(lat0), lat) in degrees, lat0 being the middle of
+the region, so distances are close to isotropic without projecting.
+
+Snapshots (ADAS_ROAD_INDEX):
+- a GraphML file saved by osmnx (ox.save_graphml),
+- a GeoParquet file of edges (ox.graph_to_gdfs(G, nodes=False).to_parquet(path)),
+- a directory of Overpass JSON responses, such as the osmnx cache,
+- an .npz snapshot written by RegionalRoadIndex.save.
+The snapshot's region is the set of COVERAGE_CELL_DEG grid cells its roads pass through,
+so a patchy source such as the osmnx cache only covers the places it has roads for. Points
+outside the region are classified through osmnx as before; a point inside it with no road
+within the search radius is classified through osmnx too, in case the snapshot has a hole
+there.
+"""
+import glob
+import math
+import os
+import threading
+
+import numpy as np
+
+import config
+
+# Roads further from the point than this are not considered, as with the 50 m osmnx download
+MAX_DISTANCE_M = 50.0
+
+METRES_PER_DEGREE = 111320.0
+
+# Size of the grid cells (about 5 km) that make up a snapshot's region
+COVERAGE_CELL_DEG = 0.05
+
+# Highway values osmnx leaves out of its "all" network
+EXCLUDED_HIGHWAYS = {"abandoned", "construction", "no", "planned", "platform", "proposed", "raceway", "razed"}
+
+
+def highway_road_type(highway_type):
+    """
+    Map an OSM highway tag (or a list of them, of which the first counts) to the app's road type.
+    """
+    if isinstance(highway_type, list):
+        highway_type = highway_type[0]
+    # Highway and Highway_link
+    if highway_type in ["motorway", "trunk"]:
+        return "Highway"
+    elif highway_type in ["motorway_link", "trunk_link"]:
+        return "Highway_link"
+    # Major Road and MajorRoad_link
+    elif highway_type in ["primary", "secondary", "tertiary"]:
+        return "Major Road"
+    elif highway_type in ["primary_link", "secondary_link", "tertiary_link"]:
+        return "MajorRoad_link"
+    elif highway_type in ["residential", "unclassified", "living_street"]:
+        return "Local Road"
+    elif highway_type in ["service", "rest_area"]:
+        return "Service Road"
+    else:
+        return "Other"
+
+
+class RegionalRoadIndex:
+    def __init__(self, starts, ends, highway_codes, highways, max_distance_m=MAX_DISTANCE_M):
+        """
+        Use one of the from_* constructors or load instead of calling this directly.
+        :param starts: (M, 2) [lon, lat] segment starts.
+        :param ends: (M, 2) [lon, lat] segment ends.
+        :param highway_codes: Per segment, an index into highways.
+        :param highways: Distinct highway tag values.
+        :param max_distance_m: Search radius around a point.
+        """
+        self.starts = np.ascontiguousarray(starts, dtype=np.float64).reshape(-1, 2)
+        self.ends = np.ascontiguousarray(ends, dtype=np.float64).reshape(-1, 2)
+        self.highway_codes = np.asarray(highway_codes, dtype=np.int32)
+        self.highways = list(highways)
+        self.max_distance_m = max_distance_m
+        if len(self.starts):
+            points = np.concatenate([self.starts, self.ends])
+            self.bbox = (*points.min(axis=0).tolist(), *points.max(axis=0).tolist())
+        else:
+            self.bbox = None
+        lat0 = (self.bbox[1] + self.bbox[3]) / 2 if self.bbox else 0.0
+        self.scale = math.cos(math.radians(lat0))
+        self.max_distance_deg = max_distance_m / METRES_PER_DEGREE
+        self.road_types = np.array([highway_road_type(highway) for highway in self.highways] + ["Unknown"], dtype=object)
+        self.cells = self._occupied_cells()
+        self._tree = None
+
+    def _occupied_cells(self):
+        """
+        :return: Set of (row, column) COVERAGE_CELL_DEG cells any segment passes through: the cells of
+                 the segment ends, and for segments longer than half a cell, points every half cell.
+        """
+        if not len(self.starts):
+            return set()
+        points = [self.starts, self.ends]
+        lengths = np.abs(self.ends - self.starts).max(axis=1)
+        long_segments = np.flatnonzero(lengths > COVERAGE_CELL_DEG / 2)
+        for number in long_segments.tolist():
+            fractions = np.linspace(0, 1, int(math.ceil(lengths[number] / (COVERAGE_CELL_DEG / 2))) + 1)[:, None]
+            points.append(self.starts[number] + fractions * (self.ends[number] - self.starts[number]))
+        cells = np.floor(np.concatenate(points) / COVERAGE_CELL_DEG).astype(np.int64)
+        # One integer per cell makes the deduplication a 1-D unique
+        keys = np.unique((cells[:, 1] << 32) + (cells[:, 0] & 0xFFFFFFFF))
+        rows = keys >> 32
+        columns = (keys & 0xFFFFFFFF).astype(np.int64)
+        columns[columns >= 1 << 31] -= 1 << 32
+        return set(zip(rows.tolist(), columns.tolist()))
+
+    @classmethod
+    def from_parts(cls, coords, part_index, part_highways, **kwargs):
+        """
+        :param coords: (K, 2) [lon, lat] vertices of all lines, one line after the other.
+        :param part_index: (K,) line number of each vertex.
+        :param part_highways: Highway tag of each line.
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        part_index = np.asarray(part_index)
+        highways, part_codes = np.unique(np.array(part_highways, dtype=object).astype(str), return_inverse=True)
+        same_line = part_index[1:] == part_index[:-1]
+        return cls(
+            coords[:-1][same_line], coords[1:][same_line], part_codes[part_index[:-1][same_line]], highways.tolist(), **kwargs
+        )
+
+    @classmethod
+    def from_edges(cls, edges, **kwargs):
+        """
+        :param edges: GeoDataFrame of road edges with a LineString geometry and a highway column,
+                      e.g. from ox.graph_to_gdfs(G, nodes=False).
+        """
+        import shapely
+
+        if edges.crs is not None and edges.crs.to_epsg() != 4326:
+            edges = edges.to_crs(epsg=4326)
+        highways = [highway[0] if isinstance(highway, list) else highway for highway in edges["highway"]]
+        coords, part_index = shapely.get_coordinates(edges.geometry.values, return_index=True)
+        return cls.from_parts(coords, part_index, highways, **kwargs)
+
+    @classmethod
+    def from_graphml(cls, path, **kwargs):
+        from routeprocessing import load_osmnx
+
+        ox = load_osmnx()
+        return cls.from_edges(ox.graph_to_gdfs(ox.load_graphml(path), nodes=False), **kwargs)
+
+    @classmethod
+    def from_parquet(cls, path, **kwargs):
+        import geopandas
+
+        return cls.from_edges(geopandas.read_parquet(path), **kwargs)
+
+    @classmethod
+    def from_overpass_dir(cls, directory, **kwargs):
+        from local_router import load_overpass_elements
+
+        nodes, ways = load_overpass_elements(sorted(glob.glob(os.path.join(directory, "*.json"))))
+        return cls.from_overpass_elements(nodes, ways, **kwargs)
+
+    @classmethod
+    def from_overpass_elements(cls, nodes, ways, **kwargs):
+        """
+        :param nodes: Dict of node id -> (lat, lon).
+        :param ways: Dict of way id -> Overpass way element (see local_router.load_overpass_elements).
+        """
+        coords, part_index, part_highways = [], [], []
+        for way in ways.values():
+            tags = way.get("tags", {})
+            highway = tags.get("highway")
+            if highway is None or highway in EXCLUDED_HIGHWAYS or tags.get("area") == "yes":
+                continue
+            points = [nodes[node] for node in way.get("nodes", []) if node in nodes]
+            if len(points) < 2:
+                continue
+            coords.extend((lon, lat) for lat, lon in points)
+            part_index.extend([len(part_highways)] * len(points))
+            part_highways.append(highway)
+        if not part_highways:
+            return cls(np.empty((0, 2)), np.empty((0, 2)), [], [], **kwargs)
+        return cls.from_parts(coords, part_index, part_highways, **kwargs)
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        """
+        Load a snapshot, choosing the reader by its extension (or directory).
+        """
+        if os.path.isdir(path):
+            return cls.from_overpass_dir(path, **kwargs)
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".graphml":
+            return cls.from_graphml(path, **kwargs)
+        if extension in (".parquet", ".geoparquet"):
+            return cls.from_parquet(path, **kwargs)
+        if extension == ".npz":
+            return cls.load(path, **kwargs)
+        raise ValueError(f"Unsupported road index snapshot: {path}")
+
+    def save(self, path):
+        np.savez_compressed(
+            path, starts=self.starts, ends=self.ends, highway_codes=self.highway_codes,
+            highways=np.array(self.highways, dtype=object),
+        )
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with np.load(path, allow_pickle=True) as data:
+            return cls(data["starts"], data["ends"], data["highway_codes"], data["highways"].tolist(), **kwargs)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def tree(self):
+        """
+        STRtree over the segments in scaled coordinates, built on first use.
+        """
+        if self._tree is None:
+            import shapely
+
+            segments = np.stack([self.starts, self.ends], axis=1)
+            segments[:, :, 0] *= self.scale
+            self._tree = shapely.STRtree(shapely.linestrings(segments))
+        return self._tree
+
+    def covers(self, lat, lon):
+        """
+        Whether (lat, lon) lies in the snapshot's region: the cells its roads pass through, and all
+        cells within the search radius of the point are part of it.
+        """
+        if not self.cells:
+            return False
+        margin = self.max_distance_deg
+        rows = range(math.floor((lat - margin) / COVERAGE_CELL_DEG), math.floor((lat + margin) / COVERAGE_CELL_DEG) + 1)
+        columns = range(math.floor((lon - margin / self.scale) / COVERAGE_CELL_DEG),
+                        math.floor((lon + margin / self.scale) / COVERAGE_CELL_DEG) + 1)
+        return all((row, column) in self.cells for row in rows for column in columns)
+
+    def nearest_highways(self, coords):
+        """
+        :param coords: Sequence of (lat, lon) points.
+        :return: Array with the highway code of the nearest segment within the search radius
+                 for each point, len(highways) where there is none.
+        """
+        import shapely
+
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        codes = np.full(len(coords), len(self.highways), dtype=np.int32)
+        if not len(coords) or not len(self.starts):
+            return codes
+        points = shapely.points(coords[:, 1] * self.scale, coords[:, 0])
+        input_index, tree_index = self.tree.query_nearest(points, max_distance=self.max_distance_deg)
+        # Equidistant segments are all returned; keep the first per point
+        input_index, first = np.unique(input_index, return_index=True)
+        codes[input_index] = self.highway_codes[tree_index[first]]
+        return codes
+
+    def classify(self, coords):
+        """
+        Road type of the nearest road to each point, "Unknown" where none is within the radius.
+        :param coords: Sequence of (lat, lon) points.
+        :return: List of road types.
+        """
+        return self.road_types[self.nearest_highways(coords)].tolist()
+
+
+_default_index = None
+_default_index_key = None
+_default_index_lock = threading.Lock()
+
+
+def default_index():
+    """
+    Process-wide index loaded from config.ROAD_INDEX, or None when it is not set (or failed to load,
+    in which case road types keep coming from osmnx).
+    """
+    global _default_index, _default_index_key
+    path = config.ROAD_INDEX
+    if not path:
+        return None
+    with _default_index_lock:
+        if _default_index_key != path:
+            try:
+                _default_index = RegionalRoadIndex.from_path(path)
+                print(f"Regional road index: {len(_default_index)} segments from {path}")
+            except (OSError, ValueError, ImportError) as e:
+                print(f"Regional road index not available ({e}), classifying with osmnx")
+                _default_index = None
+            _default_index_key = path
+        return _default_index
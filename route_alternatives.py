@@ -0,0 +1,202 @@
+"""
+Evaluate OSRM's alternative routes by ADAS coverage.
+
+One OSRM request returns the main route and its alternatives. Alternatives share most
+of their steps with each other, so every distinct (ref, coordinate) road type query is
+classified once for all of them, concurrently, and each route reads its road types from
+that shared memo: an extra alternative only costs the steps it does not share. Each
+route then gets its ADAS segments and coverage metrics, and the routes are ranked by
+the share of their distance with the target features (ACC/LKA by default), then by
+duration.
+
+Usage:
+    python route_alternatives.py Heilbronn Stuttgart --level "Level 2"
+"""
+import argparse
+import asyncio
+
+from main import DEFAULT_CONCURRENCY, route_adas_segments, leg_summaries
+from routeprocessing import (
+    RouteProcessor, extract_intersection_data, get_combined_road_type, road_type_query, route_steps, regional_road_types,
+    ADAS_MAP_ARTIFACT,
+)
+from add_adas_markers import render_adas_colored_route, get_color_for_adas
+from artifacts import default_store
+
+# Alternatives requested besides the main route
+DEFAULT_ALTERNATIVES = 2
+
+# Features whose availability ranks the routes
+DEFAULT_TARGET_FEATURES = ("ACC", "LKA")
+
+
+def adas_coverage(adas_segments, route_distance_km, target_features=DEFAULT_TARGET_FEATURES):
+    """
+    Distance covered by each ADAS feature along one route.
+    :param adas_segments: ADAS segment dicts from route_adas_segments.
+    :param route_distance_km: Total route distance.
+    :param target_features: Features the ranking looks for; a segment counts if it has any of them.
+    :return: Dict with feature_km (feature -> km), assisted_km (segments with any feature),
+             target_km (segments with a target feature) and the matching shares of the route distance.
+    """
+    targets = {feature.upper() for feature in target_features}
+    feature_km = {}
+    assisted_km = 0.0
+    target_km = 0.0
+    for seg in adas_segments:
+        features = {feature.upper() for feature in seg["ADAS"]}
+        for feature in features:
+            feature_km[feature] = feature_km.get(feature, 0.0) + seg["distance_km"]
+        if features:
+            assisted_km += seg["distance_km"]
+        if features & targets:
+            target_km += seg["distance_km"]
+
+    def share(km):
+        return km / route_distance_km if route_distance_km > 0 else 0.0
+
+    return {
+        "feature_km": feature_km,
+        "feature_share": {feature: share(km) for feature, km in feature_km.items()},
+        "assisted_km": assisted_km,
+        "assisted_share": share(assisted_km),
+        "target_km": target_km,
+        "target_share": share(target_km),
+    }
+
+
+def rank_alternatives(alternatives):
+    """
+    Sort evaluated routes by target feature share (highest first), then duration (shortest first),
+    and number them with "rank" starting at 1.
+    """
+    ranked = sorted(
+        alternatives,
+        key=lambda alt: (-round(alt["coverage"]["target_share"], 6), alt["estimated_duration_minutes"]),
+    )
+    for rank, alt in enumerate(ranked, 1):
+        alt["rank"] = rank
+    return ranked
+
+
+async def evaluate_alternatives_async(source, destination, autonomous_level, alternatives=DEFAULT_ALTERNATIVES,
+                                      target_features=DEFAULT_TARGET_FEATURES, concurrency=DEFAULT_CONCURRENCY,
+                                      store=None, render_maps=False):
+    """
+    Request OSRM alternatives and classify all of them at once, sharing the road type queries.
+    :param alternatives: Alternatives asked for besides the main route.
+    :param target_features: Features ranked on, see adas_coverage.
+    :param concurrency: Maximum number of upstream calls in flight at once.
+    :param store: ArtifactStore for the ADAS maps (default: the process-wide store).
+    :param render_maps: Render an ADAS map per route into the store.
+    :return: (ranked list of route dicts, stats dict). Each route has the process_route keys plus
+             "alternative" (index in the OSRM response), "coverage" and "rank".
+    """
+    store = store if store is not None else default_store()
+    processor = RouteProcessor()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def upstream(func, *args):
+        async with limit:
+            return await asyncio.to_thread(func, *args)
+
+    waypoint_coords = await asyncio.gather(
+        upstream(processor.get_lat_lon, source),
+        upstream(processor.get_lat_lon, destination),
+    )
+
+    try:
+        data = await upstream(processor.fetch_trip, waypoint_coords, None, alternatives)
+    except Exception as e:
+        raise ValueError(f"Error while calculating the shortest route: {e}")
+    if data["code"] != "Ok":
+        raise ValueError(f"OSRM error: {data['code']} - {data.get('message', 'No message provided')}")
+
+    # One classification per distinct query across all routes
+    routes = []
+    queries = {}
+    for route in data["routes"]:
+        steps, leg_indices = route_steps(route)
+        route_queries = [road_type_query(step) for step in steps]
+        queries.update(dict.fromkeys(route_queries))
+        routes.append((route, steps, leg_indices, route_queries))
+    # Points covered by the regional road index in one lookup, the rest through Overpass
+    known_road_types = await asyncio.to_thread(regional_road_types, list(queries))
+    classifications = {
+        query: asyncio.create_task(upstream(get_combined_road_type, *query))
+        for query, road_type in zip(queries, known_road_types) if road_type is None
+    }
+    await asyncio.gather(*classifications.values())
+    road_types_by_query = {query: task.result() for query, task in classifications.items()}
+    road_types_by_query.update(
+        (query, road_type) for query, road_type in zip(queries, known_road_types) if road_type is not None
+    )
+
+    evaluated = []
+    for index, (route, steps, leg_indices, route_queries) in enumerate(routes):
+        road_types = [road_types_by_query[query] for query in route_queries]
+        intersection_data = tuple(extract_intersection_data(steps, road_types=road_types, leg_indices=leg_indices))
+        route_geometry = route["geometry"]["coordinates"]
+        adas_segments = route_adas_segments(intersection_data, route_geometry, steps, autonomous_level)
+        artifacts = {}
+        if render_maps:
+            adas_map_html = await asyncio.to_thread(render_adas_colored_route, route_geometry, adas_segments)
+            artifacts[ADAS_MAP_ARTIFACT] = store.put(adas_map_html)
+        for seg in adas_segments:
+            seg["color"] = get_color_for_adas(seg["ADAS"])
+
+        route_distance_km = route["distance"] / 1000
+        evaluated.append({
+            "alternative": index,
+            "route_distance_km": route_distance_km,
+            "estimated_duration_minutes": route["duration"] / 60,
+            "adas_segments": adas_segments,
+            "route_geometry": route_geometry,
+            "legs": leg_summaries(route, waypoint_coords),
+            "coverage": adas_coverage(adas_segments, route_distance_km, target_features),
+            "artifacts": artifacts,
+        })
+
+    stats = {
+        "routes": len(routes),
+        "steps": sum(len(route_queries) for _, _, _, route_queries in routes),
+        "classifications": len(queries),
+    }
+    return rank_alternatives(evaluated), stats
+
+
+def evaluate_alternatives(source, destination, autonomous_level, alternatives=DEFAULT_ALTERNATIVES,
+                          target_features=DEFAULT_TARGET_FEATURES, store=None, render_maps=False):
+    """
+    Rank the main route and its OSRM alternatives by ADAS coverage; see evaluate_alternatives_async.
+    Must not be called from a running event loop.
+    :return: (ranked list of route dicts, stats dict with routes, steps and distinct classifications).
+    """
+    return asyncio.run(evaluate_alternatives_async(
+        source, destination, autonomous_level, alternatives, target_features, store=store, render_maps=render_maps
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank alternative routes by ADAS coverage.")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--level", default="Level 2", help="Autonomous level.")
+    parser.add_argument("--alternatives", type=int, default=DEFAULT_ALTERNATIVES, help="Alternatives besides the main route.")
+    parser.add_argument("--features", default=",".join(DEFAULT_TARGET_FEATURES), help="Comma-separated features to rank on.")
+    args = parser.parse_args(argv)
+
+    features = tuple(feature.strip() for feature in args.features.split(",") if feature.strip())
+    ranked, stats = evaluate_alternatives(args.source, args.destination, args.level, args.alternatives, features)
+    print(f"{stats['routes']} routes, {stats['steps']} steps, {stats['classifications']} distinct classifications")
+    for alt in ranked:
+        coverage = alt["coverage"]
+        print(
+            f"#{alt['rank']} (alternative {alt['alternative']}): {alt['route_distance_km']:.1f} km, "
+            f"{alt['estimated_duration_minutes']:.0f} min, {'/'.join(features)} on {coverage['target_km']:.1f} km "
+            f"({coverage['target_share']:.0%}), any ADAS on {coverage['assisted_share']:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
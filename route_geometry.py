@@ -0,0 +1,147 @@
+"""
+Array-backed route geometry with cached derived data.
+
+RouteGeometry wraps an (N, 2) float64 array of [lon, lat] rows and behaves like the
+list of [lon, lat] pairs used elsewhere (len, indexing, iteration), so it can be
+passed to the same functions. Derived data is computed on first use and kept:
+cumulative distance, bounding box, closest-index lookups and an optional spatial index.
+Slices are views on the same memory, and pickling stores only the coordinates.
+"""
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+
+class RouteGeometry:
+    def __init__(self, coordinates):
+        """
+        :param coordinates: [lon, lat] pairs as a list, an (N, 2) array or another RouteGeometry.
+                            Contiguous float64 arrays are used without copying.
+        """
+        if isinstance(coordinates, RouteGeometry):
+            coordinates = coordinates.coords
+        self.coords = np.ascontiguousarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self._reset()
+
+    def _reset(self):
+        self._cumulative = None
+        self._bbox = None
+        self._closest = {}
+        self._index = None
+
+    @classmethod
+    def from_any(cls, geometry):
+        """
+        Return geometry itself if it already is a RouteGeometry (keeping its caches), else wrap it.
+        """
+        return geometry if isinstance(geometry, RouteGeometry) else cls(geometry)
+
+    # --- Sequence behaviour ---
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __bool__(self):
+        return len(self.coords) > 0
+
+    def __iter__(self):
+        return iter(self.coords)
+
+    def __getitem__(self, key):
+        """
+        An int returns one [lon, lat] row; a slice returns a RouteGeometry view without copying.
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self.coords))
+            view = RouteGeometry(self.coords[key])
+            if self._cumulative is not None and step == 1 and stop > start:
+                # The parent's distances already cover the slice
+                view._cumulative = self._cumulative[start:stop] - self._cumulative[start]
+            return view
+        return self.coords[key]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None and dtype != self.coords.dtype:
+            return self.coords.astype(dtype)
+        return self.coords.copy() if copy else self.coords
+
+    def __getstate__(self):
+        # Only the coordinates; the caches are rebuilt on demand
+        return {"coords": self.coords}
+
+    def __setstate__(self, state):
+        self.coords = state["coords"]
+        self._reset()
+
+    def tolist(self):
+        return self.coords.tolist()
+
+    # --- Derived data ---
+
+    @property
+    def cumulative_distance(self):
+        """
+        Distance in metres from the first point to each point (haversine), shape (N,).
+        """
+        if self._cumulative is None:
+            cumulative = np.zeros(len(self.coords))
+            if len(self.coords) > 1:
+                lon = np.radians(self.coords[:, 0])
+                lat = np.radians(self.coords[:, 1])
+                a = (np.sin(np.diff(lat) / 2) ** 2
+                     + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+                np.cumsum(2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0))), out=cumulative[1:])
+            self._cumulative = cumulative
+        return self._cumulative
+
+    @property
+    def length_m(self):
+        return float(self.cumulative_distance[-1]) if len(self.coords) else 0.0
+
+    @property
+    def bbox(self):
+        """
+        (min_lon, min_lat, max_lon, max_lat), or None for an empty geometry.
+        """
+        if self._bbox is None and len(self.coords):
+            min_lon, min_lat = self.coords.min(axis=0)
+            max_lon, max_lat = self.coords.max(axis=0)
+            self._bbox = (float(min_lon), float(min_lat), float(max_lon), float(max_lat))
+        return self._bbox
+
+    def index_at_distance(self, distance_m):
+        """
+        Index of the last point at or before the given distance along the route.
+        """
+        return max(int(np.searchsorted(self.cumulative_distance, distance_m, side="right")) - 1, 0)
+
+    def build_index(self):
+        """
+        Build a spatial index (shapely STRtree) for closest_index on long routes. Optional:
+        without it closest_index scans the array, which is fast enough for one-off lookups.
+        """
+        if self._index is None:
+            import shapely
+
+            self._index = shapely.STRtree(shapely.points(self.coords))
+        return self._index
+
+    def closest_index(self, lat, lon):
+        """
+        Index of the route point closest to (lat, lon), by squared coordinate difference,
+        the first one on ties. Results are memoized, so repeated lookups (e.g. the same
+        segment ends on every simulation tick) cost a dict lookup.
+        """
+        key = (lat, lon)
+        index = self._closest.get(key)
+        if index is None:
+            if self._index is not None:
+                import shapely
+
+                # all_matches returns every point at the nearest distance; the first one wins as with argmin
+                index = int(self._index.query_nearest(shapely.Point(lon, lat), all_matches=True).min())
+            else:
+                delta = self.coords - (lon, lat)
+                index = int(np.argmin(np.einsum("ij,ij->i", delta, delta)))
+            self._closest[key] = index
+        return index
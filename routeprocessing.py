@@ -1,26 +1,72 @@
 import requests
-import folium
-import webbrowser
-from geopy.geocoders import Nominatim
-import tempfile
-import os
+import json
 import csv
-import osmnx as ox
+import io
+from urllib.parse import urlsplit
+import config
+import ratelimit
+import road_index
+import prefetch
+from road_index import highway_road_type
+from geometry_codec import decode_polyline_array, latlon_list
+from singleflight import SingleFlight, normalize_place
+
+_osmnx = None
+
+# Coalesces identical geocode, OSRM and Overpass calls made at the same time by concurrent requests
+upstream_calls = SingleFlight()
+
+# Retries after the upstream answered 429/503/504 (each after its Retry-After) or timed out
+UPSTREAM_RETRIES = 2
+
+# Seconds a geocoding request may take; geopy's default of 1 s turns slow answers into errors
+GEOCODE_TIMEOUT_S = 10
+
+# Names of the artifacts a route request produces (the file names used before they were kept in memory)
+ROUTE_JSON_ARTIFACT = "shortest_path_output.json"
+ROUTE_MAP_ARTIFACT = "route_map.html"
+INTERSECTIONS_CSV_ARTIFACT = "intersections.csv"
+ADAS_MAP_ARTIFACT = "route_map_with_adas.html"
+
+INTERSECTIONS_CSV_HEADER = ["Start Coordinates", "End Coordinates", "Intermediate Coordinate", "Name", "Ref", "Distance", "Duration", "Modifier", "Type", "Road Type", "Road Change", "Leg"]
+
+def load_osmnx():
+    """
+    Import osmnx on first use and apply the configured settings.
+    osmnx pulls in geopandas, shapely and networkx, which is too slow to pay at app startup.
+    :return: The osmnx module.
+    """
+    global _osmnx
+    if _osmnx is None:
+        import osmnx
+        config.apply_osmnx_settings(osmnx)
+        _osmnx = osmnx
+    return _osmnx
 
 class RouteProcessor:
-    def __init__(self, osrm_base_url="https://router.project-osrm.org"):
+    def __init__(self, osrm_base_url=None, nominatim_url=None):
         """
         Initialize the RouteProcessor with the base URL of the OSRM server and the geopy Nominatim geolocator.
+        Both default to the endpoints in config (public servers, or the replay server if ADAS_REPLAY_URL is set).
         """
-        self.osrm_base_url = osrm_base_url
-        self.geolocator = Nominatim(user_agent="route_processor")
+        from geopy.geocoders import Nominatim
+
+        self.osrm_base_url = osrm_base_url or config.OSRM_BASE_URL
+        nominatim = urlsplit(nominatim_url or config.NOMINATIM_URL)
+        self.geolocator = Nominatim(user_agent="route_processor", domain=nominatim.netloc, scheme=nominatim.scheme,
+                                    timeout=GEOCODE_TIMEOUT_S)
 
     def get_lat_lon(self, location):
         """
         Convert a location (e.g., city name) into latitude and longitude using geopy's Nominatim geocoder.
+        A (latitude, longitude) pair, e.g. a vehicle position, is returned as it is.
         """
+        if not isinstance(location, str):
+            latitude, longitude = location
+            return float(latitude), float(longitude)
         try:
-            location_data = self.geolocator.geocode(location)
+            key = ("geocode", self.geolocator.domain, normalize_place(location))
+            location_data = upstream_calls.do(key, self.geocode, location)
             if location_data:
                 return location_data.latitude, location_data.longitude
             else:
@@ -28,71 +74,160 @@ class RouteProcessor:
         except Exception as e:
             raise ValueError(f"Error while fetching latitude and longitude: {e}")
 
-    def calculate_shortest_route(self, source_coords, destination_coords, output_file="route_output.json", map_file="route_map.html", csv_file="intersections.csv"):
+    def geocode(self, location):
+        """
+        Geocode within the Nominatim rate limit, retrying when Nominatim throttles the request or times out.
+        Only a 429/503/504 answer counts as throttling; a client-side timeout is retried without a pause.
+        :return: geopy Location or None.
+        """
+        from geopy.exc import GeocoderRateLimited, GeocoderTimedOut
+
+        nominatim = ratelimit.limiter("nominatim")
+        for attempt in range(UPSTREAM_RETRIES + 1):
+            with nominatim.slot() as slot:
+                try:
+                    location_data = self.geolocator.geocode(location)
+                    slot.observe(200)
+                    return location_data
+                except GeocoderRateLimited as e:
+                    slot.observe(429, e.retry_after)
+                    if attempt == UPSTREAM_RETRIES:
+                        raise
+                except GeocoderTimedOut as e:
+                    # geopy raises this for 503/504 answers too; those carry the response as the cause
+                    response = e.__cause__
+                    status = getattr(response, "status_code", None)
+                    if status in ratelimit.THROTTLE_STATUSES:
+                        slot.observe(status, (getattr(response, "headers", None) or {}).get("retry-after"))
+                    if attempt == UPSTREAM_RETRIES:
+                        raise
+
+    def fetch_route(self, source_coords, destination_coords, geometries=None):
+        """
+        Request a route from the OSRM server and return the parsed JSON response.
+        :param source_coords: Tuple of (latitude, longitude) for the source.
+        :param destination_coords: Tuple of (latitude, longitude) for the destination.
+        :param geometries: "geojson" or "polyline6", defaults to config.OSRM_GEOMETRIES. With polyline6 the
+                           route and step coordinates are (N, 2) numpy arrays instead of lists.
+        :return: The OSRM response as a dict.
+        """
+        return self.fetch_trip([source_coords, destination_coords], geometries)
+
+    def fetch_trip(self, waypoints, geometries=None, alternatives=0):
+        """
+        Request one route through all waypoints in a single OSRM call; the response has one leg per
+        pair of consecutive waypoints.
+        :param waypoints: List of (latitude, longitude) tuples: source, any stops, destination.
+        :param geometries: "geojson" or "polyline6", defaults to config.OSRM_GEOMETRIES.
+        :param alternatives: Number of alternative routes to ask for besides routes[0] (OSRM only
+                             finds them between two waypoints, and may find fewer).
+        :return: The OSRM response as a dict. With config.LOCAL_ROUTING "always", or "fallback" and
+                 OSRM unreachable, the route comes from local_router instead (no alternatives).
+        """
+        if config.LOCAL_ROUTING == "always":
+            return local_route(waypoints)
+        geometries = geometries or config.OSRM_GEOMETRIES
+        # Construct the OSRM API URL
+        coordinates = ";".join(f"{lon},{lat}" for lat, lon in waypoints)
+        url = f"{self.osrm_base_url}/route/v1/driving/{coordinates}"
+
+        # Send the request to the OSRM server, shared with identical requests in flight
+        try:
+            return upstream_calls.do(("osrm", url, geometries, alternatives), request_route, url, geometries, alternatives)
+        except requests.RequestException as e:
+            if config.LOCAL_ROUTING != "fallback":
+                raise
+            print(f"OSRM request failed ({e}), routing on the local road graph")
+            return local_route(waypoints)
+
+    def save_route_artifacts(self, data, source_coords, destination_coords, output_file=None, map_file=None, store=None, via_coords=()):
+        """
+        Save the OSRM response as JSON and the route, with source and destination markers, as an HTML map.
+        :param data: OSRM response with code "Ok".
+        :param source_coords: Tuple of (latitude, longitude) for the source.
+        :param destination_coords: Tuple of (latitude, longitude) for the destination.
+        :param output_file: Optional file to save the route details.
+        :param map_file: Optional file to save the route map.
+        :param store: Optional ArtifactStore to keep both in memory instead.
+        :param via_coords: (latitude, longitude) of the stops between source and destination, marked on the map.
+        :return: Dict of artifact name -> digest for what was put into the store.
+        """
+        artifacts = {}
+        if output_file is None and map_file is None and store is None:
+            return artifacts
+
+        route_json = json.dumps(data, indent=4, default=lambda value: value.tolist())
+        # Save the route details to a file
+        if output_file is not None:
+            with open(output_file, "w") as file:
+                file.write(route_json)
+        if store is not None:
+            artifacts[ROUTE_JSON_ARTIFACT] = store.put(route_json)
+
+        if map_file is None and store is None:
+            return artifacts
+
+        import folium
+
+        # Extract the route geometry
+        route_geometry = data["routes"][0]["geometry"]["coordinates"]
+
+        # Create a map centered on the source coordinates
+        route_map = folium.Map(location=[source_coords[0], source_coords[1]], zoom_start=13)
+
+        # Add the route to the map
+        folium.PolyLine(
+            locations=latlon_list(route_geometry),  # Reverse coordinates for folium
+            color="blue",
+            weight=5,
+            opacity=0.8
+        ).add_to(route_map)
+
+        # Add markers for the source and destination
+        folium.Marker(location=[source_coords[0], source_coords[1]], popup="Source", icon=folium.Icon(color="green")).add_to(route_map)
+        folium.Marker(location=[destination_coords[0], destination_coords[1]], popup="Destination", icon=folium.Icon(color="red")).add_to(route_map)
+        for number, stop_coords in enumerate(via_coords, 1):
+            folium.Marker(location=[stop_coords[0], stop_coords[1]], popup=f"Stop {number}", icon=folium.Icon(color="orange")).add_to(route_map)
+
+        # Render once, then save the map to an HTML file and/or the store
+        map_html = route_map.get_root().render()
+        if map_file is not None:
+            with open(map_file, "w", encoding="utf-8") as file:
+                file.write(map_html)
+        if store is not None:
+            artifacts[ROUTE_MAP_ARTIFACT] = store.put(map_html)
+        return artifacts
+
+    def calculate_shortest_route(self, source_coords, destination_coords, output_file=None, map_file=None, csv_file=None, store=None, via_coords=()):
         """
         Call the OSRM server to calculate the shortest route between source and destination.
-        Save and print the route details, save the route to a map, and save intersection data to a CSV file.
+        Optionally save the route details, the route map and the intersection data to files or an ArtifactStore;
+        the store digests are kept in self.artifacts.
         :param source_coords: Tuple of (latitude, longitude) for the source.
         :param destination_coords: Tuple of (latitude, longitude) for the destination.
-        :param output_file: File to save the route details.
-        :param map_file: File to save the route map.
-        :param csv_file: File to save the intersection data.
+        :param output_file: Optional file to save the route details.
+        :param map_file: Optional file to save the route map.
+        :param csv_file: Optional file to save the intersection data.
+        :param store: Optional ArtifactStore for the same artifacts, kept in memory.
+        :param via_coords: Optional (latitude, longitude) stops between source and destination, all routed in one call.
         :return: distance, duration, intersection_data, route_geometry
         """
         try:
-            # Construct the OSRM API URL
-            url = f"{self.osrm_base_url}/route/v1/driving/{source_coords[1]},{source_coords[0]};{destination_coords[1]},{destination_coords[0]}"
-        
-            # Send the request to the OSRM server
-            response = requests.get(url, params={
-                "overview": "full",       # Include the full geometry of the route
-                "geometries": "geojson",  # Use GeoJSON format for the route geometry
-                "steps": "true"           # Include step-by-step instructions
-            })
-            response.raise_for_status()  # Raise an error for HTTP issues
-
-            # Parse the JSON response
-            data = response.json()
+            data = self.fetch_trip([source_coords, *via_coords, destination_coords])
 
             # Check if the OSRM response is valid
             if data["code"] == "Ok":
-                # Save the route details to a file
-                with open(output_file, "w") as file:
-                    import json
-                    json.dump(data, file, indent=4)
-
-                # Print the route details
-                #print("Route details saved to:", output_file)
-                #print("Route geometry (coordinates):", data["routes"][0]["geometry"]["coordinates"])
-                #print("Total distance (meters):", data["routes"][0]["distance"])
-                #print("Total duration (seconds):", data["routes"][0]["duration"])
-
-                # Extract the route geometry
+                # Save the route details and the route map
+                self.artifacts = self.save_route_artifacts(data, source_coords, destination_coords, output_file, map_file, store, via_coords)
                 route_geometry = data["routes"][0]["geometry"]["coordinates"]
 
-                # Create a map centered on the source coordinates
-                route_map = folium.Map(location=[source_coords[0], source_coords[1]], zoom_start=13)
-
-                # Add the route to the map
-                folium.PolyLine(
-                    locations=[[lat, lon] for lon, lat in route_geometry],  # Reverse coordinates for folium
-                    color="blue",
-                    weight=5,
-                    opacity=0.8
-                ).add_to(route_map)
-
-                # Add markers for the source and destination
-                folium.Marker(location=[source_coords[0], source_coords[1]], popup="Source", icon=folium.Icon(color="green")).add_to(route_map)
-                folium.Marker(location=[destination_coords[0], destination_coords[1]], popup="Destination", icon=folium.Icon(color="red")).add_to(route_map)
-
-                # Save the map to an HTML file
-                route_map.save(map_file)
-                #print("Route map saved to:", map_file)
-
-                # Extract intersection data and save to CSV
-                steps = data["routes"][0]["legs"][0]["steps"]
-                intersection_data = extract_intersection_data(steps)
-                save_to_csv(intersection_data, csv_file)
+                # Extract intersection data across all legs and save to CSV
+                steps, leg_indices = route_steps(data["routes"][0])
+                intersection_data = extract_intersection_data(steps, leg_indices=leg_indices)
+                if csv_file is not None:
+                    save_to_csv(intersection_data, csv_file)
+                if store is not None:
+                    self.artifacts[INTERSECTIONS_CSV_ARTIFACT] = store.put(intersections_csv(intersection_data))
 
                 # Return distance, duration, intersection_data, and route_geometry
                 return data["routes"][0]["distance"], data["routes"][0]["duration"], tuple(intersection_data), route_geometry
@@ -125,6 +260,8 @@ class RouteProcessor:
 
             # Check if the OSRM response is valid
             if data["code"] == "Ok":
+                import folium
+
                 route = data["routes"][0]
                 # Save route details to a file
                 with open(output_file, "w") as file:
@@ -154,24 +291,66 @@ class RouteProcessor:
         except Exception as e:
             raise ValueError(f"Error while calculating the shortest path: {e}")
 
-def extract_intersection_data(steps):
+def road_type_query(step):
+    """
+    Return the (ref, coord) pair a step's road type is classified from.
+    The coordinate is the step's middle point, or its end point if the step has no intermediate points.
+    :param step: One step from the OSRM route output.
+    :return: Tuple of (ref, (lat, lon)).
+    """
+    coords = step["geometry"]["coordinates"]
+    lon, lat = coords[len(coords) // 2] if len(coords) > 2 else coords[-1]
+    return step.get("ref", "N/A"), (float(lat), float(lon))
+
+def route_steps(route):
+    """
+    Concatenate the steps of all legs of an OSRM route, in order.
+    :param route: One route from the OSRM response.
+    :return: (steps, leg_indices): the steps, and for each step the index of the leg it belongs to.
+    """
+    steps = []
+    leg_indices = []
+    for leg_index, leg in enumerate(route["legs"]):
+        steps.extend(leg["steps"])
+        leg_indices.extend([leg_index] * len(leg["steps"]))
+    return steps, leg_indices
+
+def extract_intersection_data(steps, classify=None, road_types=None, leg_indices=None):
     """
     Extract intersection data from the steps information in the OSRM route output.
     :param steps: List of steps from the OSRM route output.
+    :param classify: Optional callable (ref, coord) -> road type. Defaults to get_combined_road_type.
+    :param road_types: Optional road type per step, already classified. Skips classification.
+    :param leg_indices: Optional leg index per step (see route_steps), stored as the last tuple field; 0 otherwise.
     :return: List of tuples containing intersection data.
     """
-    intersection_data = []
+    return list(iter_intersection_data(steps, classify, road_types, leg_indices))
+
+def iter_intersection_data(steps, classify=None, road_types=None, leg_indices=None):
+    """
+    Generator version of extract_intersection_data, yielding each step's intersection tuple as soon as it is built.
+    :param steps: List of steps from the OSRM route output.
+    :param classify: Optional callable (ref, coord) -> road type. Defaults to get_combined_road_type.
+    :param road_types: Optional iterable of road types, one per step, consumed as the steps are built.
+                       May be lazy, e.g. waiting on classifications still running in the background.
+    :param leg_indices: Optional leg index per step, for routes with stops.
+    """
+    if classify is None:
+        classify = get_combined_road_type
+    if road_types is not None:
+        road_types = iter(road_types)
+
     previous_name = None
     previous_ref = None
 
     for i, step in enumerate(steps):
         coords = step["geometry"]["coordinates"]
-        # Swap lon,lat to lat,lon
-        start_coords = (coords[0][1], coords[0][0])
-        end_coords = (coords[-1][1], coords[-1][0])
+        # Swap lon,lat to lat,lon (as plain floats, also for array coordinates)
+        start_coords = (float(coords[0][1]), float(coords[0][0]))
+        end_coords = (float(coords[-1][1]), float(coords[-1][0]))
         if len(coords) > 2:
             mid_index = len(coords) // 2
-            intermediate_coord = (coords[mid_index][1], coords[mid_index][0])
+            intermediate_coord = (float(coords[mid_index][1]), float(coords[mid_index][0]))
         else:
             intermediate_coord = None
 
@@ -182,8 +361,11 @@ def extract_intersection_data(steps):
         modifier = step.get("maneuver", {}).get("modifier", "N/A")
         maneuver_type = step.get("maneuver", {}).get("type", "N/A")
 
-        # Use the new combined logic for road type, passing end_coords if intermediate_coord is None
-        road_type = get_combined_road_type(ref, intermediate_coord if intermediate_coord else end_coords)
+        if road_types is not None:
+            road_type = next(road_types)
+        else:
+            # Use the combined logic for road type, passing end_coords if intermediate_coord is None
+            road_type = classify(ref, intermediate_coord if intermediate_coord else end_coords)
 
         if maneuver_type in ["depart", "arrive"]:
             is_road_change = False
@@ -207,14 +389,21 @@ def extract_intersection_data(steps):
             modifier,
             maneuver_type,
             road_type,
-            is_road_change
+            is_road_change,
+            leg_indices[i] if leg_indices is not None else 0
         )
 
-        intersection_data.append(intersection_tuple)
+        yield intersection_tuple
         previous_name = name
         previous_ref = ref
 
-    return intersection_data
+def write_intersections(intersection_data, file):
+    writer = csv.writer(file)
+    # Write the header
+    writer.writerow(INTERSECTIONS_CSV_HEADER)
+    # Write the data
+    writer.writerows(intersection_data)
+
 
 def save_to_csv(intersection_data, output_csv):
     """
@@ -223,56 +412,141 @@ def save_to_csv(intersection_data, output_csv):
     :param output_csv: Path to the output CSV file.
     """
     with open(output_csv, "w", newline="") as file:
-        writer = csv.writer(file)
-        # Write the header
-        writer.writerow(["Start Coordinates", "End Coordinates", "Intermediate Coordinate", "Name", "Ref", "Distance", "Duration", "Modifier", "Type", "Road Type", "Road Change"])
-        # Write the data
-        writer.writerows(intersection_data)
+        write_intersections(intersection_data, file)
 
     print(f"Intersection data saved to: {output_csv}")
 
+
+def intersections_csv(intersection_data):
+    """
+    Same CSV as save_to_csv, returned as a string instead of written to a file.
+    """
+    buffer = io.StringIO(newline="")
+    write_intersections(intersection_data, buffer)
+    return buffer.getvalue()
+
+def local_route(waypoints):
+    """
+    Route on the cached OSM graph (local_router.py), loaded on first use.
+    """
+    import local_router
+
+    return upstream_calls.do(("local", tuple(waypoints)), local_router.route, list(waypoints))
+
+def request_route(url, geometries="geojson", alternatives=0):
+    osrm = ratelimit.limiter("osrm")
+    for attempt in range(UPSTREAM_RETRIES + 1):
+        with osrm.slot() as slot:
+            response = requests.get(url, params={
+                "overview": "full",       # Include the full geometry of the route
+                "geometries": geometries, # GeoJSON, or polyline6 for compact transfer
+                "steps": "true",          # Include step-by-step instructions
+                "alternatives": str(alternatives) if alternatives else "false"
+            })
+            throttled = slot.observe(response.status_code, response.headers.get("Retry-After"))
+        if not throttled or attempt == UPSTREAM_RETRIES:
+            break
+    response.raise_for_status()  # Raise an error for HTTP issues
+
+    # Parse the JSON response
+    data = response.json()
+    if geometries == "polyline6":
+        decode_route_geometries(data)
+    return data
+
+def decode_route_geometries(data):
+    """
+    Replace the polyline6 strings of an OSRM response with GeoJSON-style geometries holding
+    (N, 2) [lon, lat] arrays, in place, so the response reads the same as a geojson one.
+    """
+    for route in data.get("routes", []):
+        if isinstance(route.get("geometry"), str):
+            route["geometry"] = {"type": "LineString", "coordinates": decode_polyline_array(route["geometry"])}
+        for leg in route.get("legs", []):
+            for step in leg.get("steps", []):
+                if isinstance(step.get("geometry"), str):
+                    step["geometry"] = {"type": "LineString", "coordinates": decode_polyline_array(step["geometry"])}
+    return data
+
+def ref_road_type(ref):
+    """
+    Road type implied by a step's reference number alone: "Highway" for A and B roads, else None.
+    """
+    # If ref is available and starts with "A" or "B", classify as Highway
+    if ref and ref != "N/A" and ref != "" and (ref.startswith("A") or ref.startswith("B")):
+        return "Highway"
+    return None
+
 def get_combined_road_type(ref, coord):
     """
-    Classify the road type based on the reference number or OSMNX.
+    Classify the road type based on the reference number, the regional road index (if configured
+    and covering the point), the prefetched corridor tiles (if enabled) or OSMNX.
     :param ref: The reference of the road.
     :param coord: The coordinate (lat, lon) to use for OSMNX lookup.
     :return: The classified road type.
     """
-    # If ref is available and starts with "A" or "B", classify as Highway
-    if ref and ref != "N/A" and ref != "" and (ref.startswith("A") or ref.startswith("B")):
-        return "Highway"
+    road_type = ref_road_type(ref)
+    if road_type is not None:
+        return road_type
     # Otherwise, use OSMNX with the provided coordinate (intermediate or end)
     if coord:
         lat, lon = coord  # coord is already (lat, lon)
-        try:
-            G = ox.graph_from_point((lat, lon), dist=50, network_type="all")
-            for _, _, data in G.edges(data=True):
-                if "highway" in data:
-                    highway_type = data["highway"]
-                    if isinstance(highway_type, list):
-                        highway_type = highway_type[0]
-                    # Highway and Highway_link
-                    if highway_type in ["motorway", "trunk"]:
-                        return "Highway"
-                    elif highway_type in ["motorway_link", "trunk_link"]:
-                        return "Highway_link"
-                    # Major Road and MajorRoad_link
-                    elif highway_type in ["primary", "secondary", "tertiary"]:
-                        return "Major Road"
-                    elif highway_type in ["primary_link", "secondary_link", "tertiary_link"]:
-                        return "MajorRoad_link"
-                    elif highway_type in ["residential", "unclassified", "living_street"]:
-                        return "Local Road"
-                    elif highway_type in ["service", "rest_area"]:
-                        return "Service Road"
-                    else:
-                        return "Other"
-            return "Unknown"
-        except Exception as e:
-            # print(f"Error fetching road type from OSMNX for ({lat}, {lon}): {e}")
-            return "Error"
+        index = road_index.default_index()
+        if index is not None and index.covers(lat, lon):
+            road_type = index.classify([coord])[0]
+            # No road within the radius: the snapshot may have a hole here, osmnx decides
+            if road_type != "Unknown":
+                return road_type
+        # The corridor prefetch may have the point's tile already (or on its way)
+        road_type = prefetch.cached_road_type(lat, lon)
+        if road_type is not None:
+            return road_type
+        # Concurrent lookups of the same point share one Overpass query
+        return upstream_calls.do(("overpass", config.OVERPASS_URL, lat, lon), osmnx_road_type, lat, lon)
     else:
         return "Unknown"
 
+def regional_road_types(queries):
+    """
+    Classify many (ref, coord) queries (see road_type_query) at once: ref rules first, then one
+    vectorized nearest-edge lookup on the regional road index for all remaining points.
+    :param queries: List of (ref, (lat, lon)) tuples.
+    :return: List with a road type per query, or None where get_combined_road_type is still needed
+             (no regional index configured, the point is outside its region, or no road in the index
+             is within the search radius).
+    """
+    index = road_index.default_index()
+    road_types = [None] * len(queries)
+    if index is None:
+        return road_types
+    pending = []
+    for i, (ref, coord) in enumerate(queries):
+        road_types[i] = ref_road_type(ref)
+        if road_types[i] is None:
+            if not coord:
+                road_types[i] = "Unknown"
+            elif index.covers(*coord):
+                pending.append(i)
+    for i, road_type in zip(pending, index.classify([queries[i][1] for i in pending])):
+        road_types[i] = road_type if road_type != "Unknown" else None
+    return road_types
+
+def osmnx_road_type(lat, lon):
+    """
+    Classify the road at (lat, lon) from the first edge osmnx finds within 50 m.
+    """
+    try:
+        ox = load_osmnx()
+        # osmnx requests go through the Overpass limiter (see config.apply_osmnx_settings)
+        with ratelimit.limiter("overpass").thread_scope():
+            G = ox.graph_from_point((lat, lon), dist=50, network_type="all")
+        for _, _, data in G.edges(data=True):
+            if "highway" in data:
+                return highway_road_type(data["highway"])
+        return "Unknown"
+    except Exception as e:
+        # print(f"Error fetching road type from OSMNX for ({lat}, {lon}): {e}")
+        return "Error"
+
 
 
@@ -0,0 +1,203 @@
+"""
+Headless ADAS drive simulation, faster than real time.
+
+The Streamlit simulation moves the vehicle a few route points per rerun. Simulator
+instead drives a processed route (the process_route result) in simulated time: the
+vehicle moves along the route geometry at a constant speed (by default the route's
+average, so the drive takes the OSRM duration), and the ADAS segments are turned into
+timestamped events at the distances where they happen:
+
+    start            vehicle leaves
+    enable_warning   WARNING_DISTANCE_M before a segment ("In 100 metres, Enable: ...")
+    enable           segment starts
+    disable_warning  WARNING_DISTANCE_M before the segment ends
+    disable          segment ends
+    position         every tick_s simulated seconds, if asked for
+    arrive           vehicle arrives
+
+Events are computed from the cumulative distance along the route, not by stepping
+through it, so a drive of several hours costs as much as its number of events. The
+stream is paced at time_scale times real time (e.g. 1000), or produced as fast as
+possible with time_scale=None, and goes to a generator, a callback or a JSON lines file.
+
+Usage:
+    python simulator.py Heilbronn Stuttgart --level "Level 2" --time-scale 1000 --output events.jsonl
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from route_geometry import RouteGeometry
+
+# Distance before a segment starts or ends at which the driver is warned, in metres
+WARNING_DISTANCE_M = 100.0
+
+# Order of events at the same moment: a segment ends before the next one starts
+EVENT_ORDER = {"start": 0, "disable": 1, "disable_warning": 2, "enable_warning": 3, "enable": 4, "position": 5, "arrive": 6}
+
+
+def segment_ranges(route_geometry, adas_segments):
+    """
+    Where the ADAS segments with features lie along the route.
+    :param route_geometry: RouteGeometry of the route.
+    :return: List of (segment index, start_m, end_m), distances from the route start.
+    """
+    cumulative = route_geometry.cumulative_distance
+    ranges = []
+    for number, seg in enumerate(adas_segments):
+        if not seg["ADAS"]:
+            continue
+        start_idx = route_geometry.closest_index(*seg["start"])
+        end_idx = route_geometry.closest_index(*seg["end"])
+        if start_idx > end_idx:
+            start_idx, end_idx = end_idx, start_idx
+        ranges.append((number, float(cumulative[start_idx]), float(cumulative[end_idx])))
+    return ranges
+
+
+class Simulator:
+    def __init__(self, route_details, speed_kmph=None, warning_distance_m=WARNING_DISTANCE_M):
+        """
+        :param route_details: process_route result (route_geometry, adas_segments, estimated_duration_minutes).
+        :param speed_kmph: Constant vehicle speed; defaults to the route's average speed.
+        :param warning_distance_m: How far ahead segment starts and ends are announced.
+        """
+        self.route_geometry = RouteGeometry.from_any(route_details["route_geometry"])
+        self.adas_segments = route_details.get("adas_segments", [])
+        self.warning_distance_m = warning_distance_m
+        self.length_m = self.route_geometry.length_m
+        if speed_kmph is None:
+            duration_s = route_details.get("estimated_duration_minutes", 0) * 60
+            self.speed_mps = self.length_m / duration_s if duration_s > 0 else 50 / 3.6
+        else:
+            self.speed_mps = speed_kmph / 3.6
+
+    @property
+    def duration_s(self):
+        """
+        Simulated drive time in seconds.
+        """
+        return self.length_m / self.speed_mps if self.speed_mps > 0 else 0.0
+
+    def position_at(self, distance_m):
+        """
+        :return: (lat, lon) of the vehicle after distance_m along the route.
+        """
+        geometry = self.route_geometry
+        index = geometry.index_at_distance(distance_m)
+        if index >= len(geometry) - 1:
+            lon, lat = geometry[-1].tolist()
+            return lat, lon
+        cumulative = geometry.cumulative_distance
+        span = cumulative[index + 1] - cumulative[index]
+        fraction = (distance_m - cumulative[index]) / span if span > 0 else 0.0
+        lon, lat = (geometry[index] + fraction * (geometry[index + 1] - geometry[index])).tolist()
+        return lat, lon
+
+    def segment_events(self):
+        """
+        :return: List of (distance_m, event type, segment index) for the ADAS segments, unsorted.
+        """
+        events = []
+        for number, start_m, end_m in segment_ranges(self.route_geometry, self.adas_segments):
+            events.append((max(start_m - self.warning_distance_m, 0.0), "enable_warning", number))
+            events.append((start_m, "enable", number))
+            events.append((max(end_m - self.warning_distance_m, start_m), "disable_warning", number))
+            events.append((end_m, "disable", number))
+        return events
+
+    def events(self, tick_s=None):
+        """
+        All events of the drive in order, without pacing.
+        :param tick_s: Also emit a "position" event every tick_s simulated seconds.
+        :return: List of event dicts with t (simulated seconds), distance_m, type, lat, lon
+                 and, for segment events, segment, ADAS and road_type.
+        """
+        raw = [(0.0, "start", None), (self.length_m, "arrive", None)] + self.segment_events()
+        if tick_s:
+            tick_m = tick_s * self.speed_mps
+            raw.extend((float(distance), "position", None) for distance in np.arange(tick_m, self.length_m, tick_m))
+        raw.sort(key=lambda event: (event[0], EVENT_ORDER[event[1]]))
+
+        events = []
+        for distance_m, event_type, number in raw:
+            lat, lon = self.position_at(distance_m)
+            event = {
+                "t": round(distance_m / self.speed_mps, 3) if self.speed_mps > 0 else 0.0,
+                "distance_m": round(distance_m, 1),
+                "type": event_type,
+                "lat": lat,
+                "lon": lon,
+            }
+            if number is not None:
+                seg = self.adas_segments[number]
+                event.update(segment=number, ADAS=list(seg["ADAS"]), road_type=seg.get("road_type"))
+            events.append(event)
+        return events
+
+    def iter_events(self, time_scale=None, tick_s=None):
+        """
+        Yield the events paced against the wall clock.
+        :param time_scale: Simulated seconds per real second (1 = real time, 1000 = 1000x), None for no pacing.
+        :param tick_s: See events().
+        """
+        started = time.monotonic()
+        for event in self.events(tick_s):
+            if time_scale:
+                delay = started + event["t"] / time_scale - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield event
+
+    def run(self, callback, time_scale=None, tick_s=None):
+        """
+        Call callback(event) for every event.
+        :return: Number of events.
+        """
+        count = 0
+        for event in self.iter_events(time_scale, tick_s):
+            callback(event)
+            count += 1
+        return count
+
+    def run_to_file(self, path, time_scale=None, tick_s=None):
+        """
+        Write the events as JSON lines, one event per line, flushed as they happen.
+        :return: Number of events.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            def write(event):
+                file.write(json.dumps(event) + "\n")
+                file.flush()
+
+            return self.run(write, time_scale, tick_s)
+
+
+def main(argv=None):
+    from main import process_route
+
+    parser = argparse.ArgumentParser(description="Simulate an ADAS drive along a route without the UI.")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--level", default="Level 2", help="Autonomous level.")
+    parser.add_argument("--speed", type=float, help="Vehicle speed in km/h (default: the route's average).")
+    parser.add_argument("--time-scale", type=float, help="Simulated seconds per real second (default: as fast as possible).")
+    parser.add_argument("--tick", type=float, help="Also emit the position every TICK simulated seconds.")
+    parser.add_argument("--output", help="JSON lines file for the events (default: print them).")
+    args = parser.parse_args(argv)
+
+    route_details = process_route(args.source, args.destination, args.level, render_maps=False)
+    simulator = Simulator(route_details, args.speed)
+    started = time.perf_counter()
+    if args.output:
+        count = simulator.run_to_file(args.output, args.time_scale, args.tick)
+    else:
+        count = simulator.run(lambda event: print(json.dumps(event)), args.time_scale, args.tick)
+    elapsed = time.perf_counter() - started
+    print(f"{count} events, {simulator.duration_s / 60:.1f} simulated minutes in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
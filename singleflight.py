@@ -0,0 +1,69 @@
+"""
+Single-flight deduplication of concurrent identical calls.
+
+While a call for a key is in flight, further calls with the same key wait for it
+and get its result (or exception) instead of repeating the work. Nothing is cached
+once the call finishes, so later calls run again.
+"""
+import threading
+
+
+def normalize_place(place):
+    """
+    Normalize a place name for use in keys: case and whitespace do not matter.
+    """
+    return " ".join(str(place).lower().split())
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs), unless a call with the same key is already running.
+        Waiters share the leader's result object, so callers must not mutate it.
+        :param key: Hashable key identifying identical calls.
+        :return: func's result.
+        """
+        with self.lock:
+            self.stats["calls"] += 1
+            call = self.calls.get(key)
+            if call is not None:
+                self.stats["shared"] += 1
+                call.waiters += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.calls)
@@ -1,49 +1,65 @@
+import time
+_render_start = time.perf_counter()  # Used to report time-to-first-render
+
+import os
 import streamlit as st
-from main import process_route  # Import the main route processing function
-from streamlit_folium import st_folium
+from main import iter_route_events, DETAIL_SKIP_KEYS  # Import the streaming route processing function
 from adas_features import ADASFeatures  # Import the new ADASFeatures class
-import time
-from add_adas_markers import get_color_for_adas  # Import the helper function for ADAS colors
-
-# --- ADAS Message Function ---
-def get_adas_message(vehicle_idx, route_geometry, adas_segments):
-    for seg in adas_segments:
-        # Find closest indices for start and end
-        def find_closest_index(coord):
-            lat, lon = coord
-            return min(
-                range(len(route_geometry)),
-                key=lambda i: (route_geometry[i][1] - lat) ** 2 + (route_geometry[i][0] - lon) ** 2
-            )
-        start_idx = find_closest_index(seg["start"])
-        end_idx = find_closest_index(seg["end"])
-        if start_idx > end_idx:
-            start_idx, end_idx = end_idx, start_idx
+from warmup import prewarm  # Optional pre-warm of the heavy dependencies
+from add_adas_markers import get_color_for_adas, build_adas_colored_map  # Import the helper functions for ADAS colors and maps
+from adas_messages import get_adas_message  # Import the dynamic ADAS message helper
+from artifacts import default_store  # In-memory store holding the generated maps
+from routeprocessing import ADAS_MAP_ARTIFACT
+from geometry_codec import latlon_list
+from route_geometry import RouteGeometry  # Array-backed route geometry kept in session state
+import config
 
-        adas_str = ", ".join(seg["ADAS"]) if isinstance(seg["ADAS"], list) else str(seg["ADAS"])
+# With ADAS_API_URL set, routes are processed by the shared API server instead of this script run
+api_client = None
+if config.API_URL:
+    from api_client import RouteAPIClient
+    api_client = RouteAPIClient(config.API_URL)
 
-        # Before the start point (e.g., 5 points before)
-        if max(start_idx - 5, 0) <= vehicle_idx < start_idx and adas_str.lower() != "none":
-            return f"""
-                <div style='text-align: right; color: green; font-weight: bold; font-size: 18px;'>
-                    In 100 metres, Enable: {adas_str}
-                </div>
-            """
-        # From the start point until 10 points before end
-        if start_idx <= vehicle_idx < max(end_idx - 10, 0) and adas_str.lower() != "none":
-            return f"""
-                <div style='text-align: right; color: green; font-weight: bold; font-size: 18px;'>
-                    Enable: {adas_str}
-                </div>
-            """
-        # Show Disable message from 10 points before end to 10 points after end
-        if max(end_idx - 10, 0) <= vehicle_idx <= min(end_idx + 10, len(route_geometry) - 1) and adas_str.lower() != "none":
-            return f"""
-                <div style='text-align: right; color: orange; font-weight: bold; font-size: 18px;'>
-                    In 100 metres, Disable: {adas_str}
-                </div>
-            """
-    return None
+def has_route():
+    """
+    True once a route with geometry is in the session. The geometry may be a numpy array,
+    which has no truth value, so its length is checked.
+    """
+    route_details = st.session_state.get("route_details")
+    return bool(route_details) and route_details.get("route_geometry") is not None and len(route_details["route_geometry"]) > 0
+
+def load_artifact_text(digest):
+    """
+    Fetch a generated map by digest, from the API server or the local store.
+    """
+    if api_client is not None:
+        return api_client.get_artifact_text(digest)
+    return default_store().get_text(digest)
+
+# --- ADAS Details Helper ---
+def render_adas_details(adas_segments):
+    """
+    Write one block per ADAS segment with its features, distance, duration and color.
+    """
+    for idx, seg in enumerate(adas_segments, 1):
+        adas_str = ", ".join(seg["ADAS"]) if isinstance(seg["ADAS"], list) else str(seg["ADAS"])
+        if adas_str.strip().lower() == "none":
+            continue  # Skip segments with no ADAS
+        distance = seg.get("distance_km", "N/A")
+        duration = seg.get("duration_min", "N/A")
+        color = seg.get("color", "blue")
+        st.markdown(
+            f"""
+            <div style='margin-bottom:10px;'>
+                <b>Segment {idx}:</b><br>
+                <b>ADAS:</b> {adas_str}<br>
+                <b>Distance:</b> {distance} km<br>
+                <b>Duration:</b> {duration} min<br>
+                <b>Color:</b> <span style='color:{color};font-weight:bold'>{color}</span>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -74,6 +90,8 @@ st.markdown("<h1 class='header'>In-Vehicle Navigation System</h1>", unsafe_allow
 st.sidebar.header("Enter the location within Germany")
 source = st.sidebar.text_input("Source Location", "Heilbronn")
 destination = st.sidebar.text_input("Destination Location", "Neckarsulm")
+stops = st.sidebar.text_area("Stops (optional, one per line)", "")
+via = [stop.strip() for stop in stops.splitlines() if stop.strip()]
 autonomous_level = st.sidebar.selectbox(
     "Autonomous Level",
     ["Level 0 ", "Level 1 ", "Level 2 "],
@@ -99,12 +117,52 @@ if st.sidebar.button("Calculate Route"):
     else:
         try:
             # Display the "Processing route..." message on the UI
-            st.write(f"Processing route from {source} to {destination} with Autonomous Level: {autonomous_level}...")
+            via_text = f" via {', '.join(via)}" if via else ""
+            st.write(f"Processing route from {source}{via_text} to {destination} with Autonomous Level: {autonomous_level}...")
+
+            # Stream the route processing, showing partial coloring and ADAS details as they are determined
+            progress_area = st.empty()
+            with progress_area.container():
+                progress_text = st.empty()
+                progress_map_col, progress_details_col = st.columns([3, 1])
+                progress_map = progress_map_col.empty()
+                progress_details = progress_details_col.empty()
+
+            route_details = None
+            partial_route = None
+            partial_segments = []
+            steps_done = 0
+            last_map_update = 0.0
+            route_events = api_client.iter_route_events if api_client is not None else iter_route_events
+            for kind, payload in route_events(source, destination, autonomous_level.strip(), via=via):
+                if kind == "route":
+                    partial_route = payload
+                    partial_route["route_geometry"] = RouteGeometry.from_any(payload["route_geometry"])
+                    progress_text.write(
+                        f"Route found: {payload['route_distance_km']:.1f} km. "
+                        f"Classifying {payload['step_count']} steps..."
+                    )
+                elif kind == "step":
+                    steps_done += 1
+                    progress_text.write(f"Classified {steps_done} of {partial_route['step_count']} steps...")
+                elif kind == "segment":
+                    partial_segments.append(payload)
+                    with progress_details.container():
+                        st.subheader("ADAS Details")
+                        render_adas_details(partial_segments)
+                elif kind == "done":
+                    route_details = payload
 
-            # Call the main route processing function
-            route_details = process_route(source, destination, autonomous_level.strip())
+                # Redraw the partial map when the route or a new segment arrives, at most once a second
+                if kind in ("route", "segment") and time.perf_counter() - last_map_update >= 1.0:
+                    partial_map = build_adas_colored_map(partial_route["route_geometry"], partial_segments)
+                    with progress_map.container():
+                        st.components.v1.html(partial_map._repr_html_(), height=500, width=700)
+                    last_map_update = time.perf_counter()
+            progress_area.empty()
 
-            # Save the results in session state
+            # Save the results in session state, with the geometry as one array plus its cached lookups
+            route_details["route_geometry"] = RouteGeometry.from_any(route_details["route_geometry"])
             st.session_state["route_details"] = route_details
             st.session_state["route_map"] = route_details.get("route_map")
             st.session_state.vehicle_idx = 0
@@ -115,7 +173,7 @@ if st.sidebar.button("Calculate Route"):
 
 # --- Simulation Controls ---
 # Only show simulation controls if a route is available
-if "route_details" in st.session_state and st.session_state["route_details"].get("route_geometry"):
+if has_route():
     st.sidebar.markdown("---")
     st.sidebar.header("Simulation Controls")
     speed_kmph = st.sidebar.slider("Vehicle Speed (kmph)", 10, 100, value=10, step=10)
@@ -137,8 +195,7 @@ else:
 # Move the vehicle if simulation is running
 if (
     st.session_state.get("simulating", False)
-    and "route_details" in st.session_state
-    and st.session_state["route_details"].get("route_geometry")
+    and has_route()
 ):
     route_geometry = st.session_state["route_details"]["route_geometry"]
     if not st.session_state.just_incremented:
@@ -160,7 +217,7 @@ col1, col2 = st.columns([3, 1])  # Left (Map) and Right (Route Info + ADAS Featu
 # --- Left Pane: Map ---
 with col1:
     st.subheader("Route Map")
-    if "route_details" in st.session_state and st.session_state["route_details"].get("route_geometry"):
+    if has_route():
         route_geometry = st.session_state["route_details"]["route_geometry"]
         adas_segments = st.session_state["route_details"].get("adas_segments", [])
         if st.session_state.get("simulating", False):
@@ -177,24 +234,16 @@ with col1:
             from streamlit_folium import st_folium
 
             idx = st.session_state.vehicle_idx
-            vehicle_lat, vehicle_lon = route_geometry[idx][1], route_geometry[idx][0]
+            vehicle_lon, vehicle_lat = route_geometry[idx].tolist()
             # Center the map on the current vehicle position
             m = folium.Map(location=[vehicle_lat, vehicle_lon], zoom_start=13)
 
-            # Helper to find the closest index in route_geometry for a given (lat, lon)
-            def find_closest_index(coord):
-                lat, lon = coord
-                return min(
-                    range(len(route_geometry)),
-                    key=lambda i: (route_geometry[i][1] - lat) ** 2 + (route_geometry[i][0] - lon) ** 2
-                )
-
-            # Build a list of colored segments
+            # Build a list of colored segments (slices are views on the session's geometry array)
             colored_segments = []
             last_idx = 0
             for seg in adas_segments:
-                start_idx = find_closest_index(seg["start"])
-                end_idx = find_closest_index(seg["end"])
+                start_idx = route_geometry.closest_index(*seg["start"])
+                end_idx = route_geometry.closest_index(*seg["end"])
                 if start_idx > end_idx:
                     start_idx, end_idx = end_idx, start_idx
                 color = get_color_for_adas(seg["ADAS"])
@@ -210,7 +259,7 @@ with col1:
             # Draw all segments
             for coords, color in colored_segments:
                 folium.PolyLine(
-                    locations=[[lat, lon] for lon, lat in coords],
+                    locations=latlon_list(coords),
                     color=color,
                     weight=7,
                     opacity=0.9
@@ -224,13 +273,13 @@ with col1:
 
             st_folium(m, width=700, height=500)
         else:
-            # Show the static HTML map from main.py
-            try:
-                with open("route_map_with_adas.html", "r", encoding="utf-8") as f:
-                    map_html = f.read()
+            # Show the static HTML map from main.py, kept in memory for this session's route
+            map_digest = st.session_state["route_details"].get("artifacts", {}).get(ADAS_MAP_ARTIFACT)
+            map_html = load_artifact_text(map_digest) if map_digest else None
+            if map_html:
                 st.components.v1.html(map_html, height=500, width=700)
-            except Exception:
-                st.info("Map file not found. Please calculate a route.")
+            else:
+                st.info("Map is not available. Please calculate the route again.")
     else:
         st.info("No route to display. Please calculate a route first.")
 
@@ -242,37 +291,41 @@ with col2:
 
         # Display all route details returned from main.py
         for key, value in route_details.items():
-            if key in ["adas_segments", "route_geometry"]:
-                continue  # Skip printing adas_segments and route_geometry here
+            if key in DETAIL_SKIP_KEYS:
+                continue  # Skip printing adas_segments, route_geometry, legs, steps, groups and artifact digests here
             pretty_key = key.replace("_", " ").capitalize()
             if isinstance(value, float):
                 st.write(f"**{pretty_key}:** {value:.2f}")
             else:
                 st.write(f"**{pretty_key}:** {value}")
 
+        # Per-leg summary for routes with stops
+        legs = route_details.get("legs", [])
+        if len(legs) > 1:
+            for number, leg in enumerate(legs, 1):
+                st.write(f"**Leg {number}:** {leg['distance_km']:.2f} km, {leg['duration_minutes']:.2f} min")
+
     # --- ADAS Segments Table ---
     if "route_details" in st.session_state and "adas_segments" in st.session_state["route_details"]:
         st.markdown("---")
         st.subheader("ADAS Details")
         adas_segments = st.session_state["route_details"]["adas_segments"]
-        for idx, seg in enumerate(adas_segments, 1):
-            adas_str = ", ".join(seg["ADAS"]) if isinstance(seg["ADAS"], list) else str(seg["ADAS"])
-            if adas_str.strip().lower() == "none":
-                continue  # Skip segments with no ADAS
-            distance = seg.get("distance_km", "N/A")
-            duration = seg.get("duration_min", "N/A")
-            color = seg.get("color", "blue")
-            st.markdown(
-                f"""
-                <div style='margin-bottom:10px;'>
-                    <b>Segment {idx}:</b><br>
-                    <b>ADAS:</b> {adas_str}<br>
-                    <b>Distance:</b> {distance} km<br>
-                    <b>Duration:</b> {duration} min<br>
-                    <b>Color:</b> <span style='color:{color};font-weight:bold'>{color}</span>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+        render_adas_details(adas_segments)
+
+# --- Time-to-First-Render and Worker Pre-Warm ---
+if "first_render_s" not in st.session_state:
+    st.session_state["first_render_s"] = round(time.perf_counter() - _render_start, 3)
+    print(f"Time to first render: {st.session_state['first_render_s']} s")
+
+
+@st.cache_resource(show_spinner=False)
+def prewarm_worker():
+    """
+    Run warmup.WARMUP_STEPS once per process, after the page has been sent: import osmnx,
+    folium and geopy and load the local road graph and the regional road index, if configured.
+    """
+    return prewarm()
 
 
+if os.environ.get("ADAS_PREWARM", "1") != "0":
+    prewarm_worker()
@@ -0,0 +1,342 @@
+"""
+ADAS availability along recorded GPS traces (GPX or CSV drive logs).
+
+Traces are read in batches of points (batch_size, 100,000 by default), so memory stays
+bounded however long the log is. Each batch is matched to the road network with
+vectorized nearest-road queries on the regional road index (road_index.py; the trace's
+region must be covered by ADAS_ROAD_INDEX), giving a road type per point. Only a point
+every min_run_m / 2 is queried, plus the points between two of them that disagree, which
+keeps ingestion well above 100,000 points/s on one core. Consecutive points of one road
+type form runs, smoothed as in map_matching.py: a run shorter than min_run_m (GPS noise,
+passing a junction) takes the road type of the run before it. Every finished run becomes an
+intersection tuple and goes through ADASSegmentStream, the same grouping and ADAS rules
+as process_route, with two differences: a trace has no maneuvers, so groups only end
+where the road type changes, and no ref numbers, so roads are typed by OSM highway tag
+alone.
+
+Results are written as they become final, through an exporter.RouteExporter (steps are
+the runs, plus road groups and ADAS segments) and/or a callback.
+
+CSV files need lat and lon columns; a time column (seconds or ISO timestamps) gives
+durations, and a trace_id column splits one file into several drives.
+
+Usage:
+    python trace_ingest.py drives.csv --level "Level 2" --output exports/ --format geoparquet
+"""
+import argparse
+import time
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+import road_index
+from adas_stream import ADASSegmentStream
+from map_matching import MIN_RUN_M
+from route_geometry import RouteGeometry
+
+DEFAULT_BATCH_SIZE = 100000
+
+
+def parse_times(values):
+    """
+    :param values: Numbers (seconds) or timestamp strings.
+    :return: float64 array of seconds, NaN where missing.
+    """
+    import pandas as pd
+
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64)
+    times = pd.to_datetime(values, utc=True, errors="coerce", format="mixed")
+    seconds = (times - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    return seconds.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def iter_csv_batches(path, batch_size=DEFAULT_BATCH_SIZE, lat_column="lat", lon_column="lon",
+                     time_column="time", trace_column="trace_id"):
+    """
+    Read a CSV trace in batches.
+    :return: Generator of (trace_ids or None, lat, lon, time_s or None) arrays.
+    """
+    import pandas as pd
+
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [lat_column, lon_column] + [column for column in (time_column, trace_column) if column in header]
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=batch_size):
+        chunk = chunk.dropna(subset=[lat_column, lon_column])
+        yield (
+            chunk[trace_column].astype(str).to_numpy() if trace_column in chunk else None,
+            chunk[lat_column].to_numpy(dtype=np.float64),
+            chunk[lon_column].to_numpy(dtype=np.float64),
+            parse_times(chunk[time_column]) if time_column in chunk else None,
+        )
+
+
+def iter_gpx_batches(path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Read the track points of a GPX file in batches, one trace per <trk>, without loading the whole file.
+    :return: Generator of (trace_ids, lat, lon, time_s) arrays.
+    """
+    trace_ids, lats, lons, times = [], [], [], []
+    track = 0
+
+    def batch():
+        return np.array(trace_ids), np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64), parse_times(times)
+
+    for event, element in ElementTree.iterparse(path, events=("end",)):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "trkpt":
+            trace_ids.append(str(track))
+            lats.append(float(element.get("lat")))
+            lons.append(float(element.get("lon")))
+            time_text = next((child.text for child in element if child.tag.rsplit("}", 1)[-1] == "time"), None)
+            times.append(time_text)
+            element.clear()
+            if len(lats) >= batch_size:
+                yield batch()
+                trace_ids, lats, lons, times = [], [], [], []
+        elif tag == "trk":
+            track += 1
+            element.clear()
+    if lats:
+        yield batch()
+
+
+class TraceMatcher:
+    def __init__(self, trace_id, autonomous_level, index, min_run_m=MIN_RUN_M):
+        """
+        Streaming road type runs and ADAS segments of one trace.
+        :param index: RegionalRoadIndex covering the trace.
+        """
+        self.trace_id = trace_id
+        self.index = index
+        self.min_run_m = min_run_m
+        self.stream = ADASSegmentStream(autonomous_level)
+        self.last_point = None      # (lat, lon, time_s) of the previous batch's last point
+        self.tail = None            # the previous batch's last run, which this batch may continue
+        self.current = None         # smoothed run being extended: dict with road_type, start, end, distance, duration, long
+        self.points = 0
+
+    def add_points(self, lat, lon, time_s=None):
+        """
+        Match a batch of consecutive points.
+        :return: List of ("step", entry), ("group", group) and ("segment", seg) events that became final.
+        """
+        count = len(lat)
+        if not count:
+            return []
+        self.points += count
+        if time_s is None:
+            time_s = np.full(count, np.nan)
+
+        # Distances and durations from the previous point (the previous batch's last point for the first one)
+        if self.last_point is not None:
+            lat = np.r_[self.last_point[0], lat]
+            lon = np.r_[self.last_point[1], lon]
+            time_s = np.r_[self.last_point[2], time_s]
+        distances = np.diff(RouteGeometry(np.column_stack([lon, lat])).cumulative_distance, prepend=0.0)
+        durations = np.nan_to_num(np.diff(time_s, prepend=np.nan), nan=0.0).clip(min=0.0)
+        if self.last_point is not None:
+            lat, lon, distances, durations = lat[1:], lon[1:], distances[1:], durations[1:]
+        self.last_point = (lat[-1], lon[-1], time_s[-1])
+        road_types = self.index.road_types[self.road_codes(lat, lon, np.cumsum(distances))]
+
+        # Runs of one road type in this batch, each covering the stretch from the point before it
+        run_starts = np.flatnonzero(np.r_[True, road_types[1:] != road_types[:-1]])
+        run_ends = np.r_[run_starts[1:], count] - 1
+        run_distances = np.add.reduceat(distances, run_starts)
+        run_durations = np.add.reduceat(durations, run_starts)
+
+        runs = [
+            {
+                "road_type": road_types[start],
+                "start": (float(lat[start]), float(lon[start])),
+                "end": (float(lat[end]), float(lon[end])),
+                "distance": distance,
+                "duration": duration,
+            }
+            for start, end, distance, duration in zip(run_starts.tolist(), run_ends.tolist(), run_distances.tolist(), run_durations.tolist())
+        ]
+        # The batch's last run may go on in the next batch, so it is only complete once that starts
+        if self.tail is not None:
+            if runs[0]["road_type"] == self.tail["road_type"]:
+                self.extend(self.tail, runs.pop(0))
+            runs.insert(0, self.tail)
+        self.tail = runs.pop()
+
+        events = []
+        for run in runs:
+            events.extend(self.add_run(run))
+        return events
+
+    def road_codes(self, lat, lon, cumulative_m):
+        """
+        Nearest-road highway codes of a batch, querying only part of the points: one sample every
+        min_run_m / 2, plus every point between two samples that disagree. Points between two
+        samples of the same road type take that type; a different road there would be a run
+        shorter than min_run_m, which add_run merges into the run around it anyway.
+        :return: Highway code per point (see RegionalRoadIndex.nearest_highways).
+        """
+        count = len(lat)
+        spacing = self.min_run_m / 2
+        samples = np.unique(np.r_[np.searchsorted(cumulative_m, np.arange(0.0, cumulative_m[-1], spacing)), count - 1])
+        sample_codes = self.index.nearest_highways(np.column_stack([lat[samples], lon[samples]]))
+        codes = sample_codes[np.searchsorted(samples, np.arange(count), side="right") - 1]
+
+        # Points between samples of different road types, as one ragged range per gap
+        gaps = np.flatnonzero(sample_codes[1:] != sample_codes[:-1])
+        first, lengths = samples[gaps] + 1, samples[gaps + 1] - samples[gaps] - 1
+        if lengths.sum():
+            between = np.repeat(first - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(lengths.sum())
+            codes[between] = self.index.nearest_highways(np.column_stack([lat[between], lon[between]]))
+        return codes
+
+    def add_run(self, run):
+        """
+        Smooth a complete run as map_matching.smooth_runs does: a run shorter than min_run_m takes
+        the road type of the last long run before it (of the first long run, at the trace's start).
+        """
+        current = self.current
+        long_run = run["distance"] >= self.min_run_m
+        if current is None:
+            self.current = dict(run, long=long_run)
+            return []
+        if not current["long"]:
+            if long_run:
+                current["road_type"] = run["road_type"]
+                current["long"] = True
+            self.extend(current, run)
+            return []
+        if not long_run or run["road_type"] == current["road_type"]:
+            self.extend(current, run)
+            return []
+        events = self.close_run()
+        self.current = dict(run, start=current["end"], long=True)
+        return events
+
+    @staticmethod
+    def extend(run, following):
+        run["end"] = following["end"]
+        run["distance"] += following["distance"]
+        run["duration"] += following["duration"]
+
+    def close_run(self):
+        """
+        Turn the current run into an intersection tuple (see routeprocessing.iter_intersection_data)
+        and feed it to the ADAS stream.
+        """
+        run = self.current
+        entry = (
+            run["start"], run["end"], None, "", "", run["distance"], run["duration"],
+            "straight", "continue", run["road_type"], False, 0,
+        )
+        return [("step", entry)] + self.stream.add_entry(entry)
+
+    def finish(self):
+        """
+        End the trace: close the last run and the open groups.
+        :return: Remaining events.
+        """
+        events = []
+        if self.tail is not None:
+            events.extend(self.add_run(self.tail))
+            self.tail = None
+        if self.current is not None:
+            events.extend(self.close_run())
+            self.current = None
+        return events + self.stream.finish()
+
+
+def ingest_batches(batches, autonomous_level, exporter=None, callback=None, index=None, min_run_m=MIN_RUN_M, trace_id="trace"):
+    """
+    Match traces batch by batch and write the results as they become final.
+    :param batches: Iterable of (trace_ids or None, lat, lon, time_s or None), e.g. iter_csv_batches.
+    :param exporter: Optional exporter.RouteExporter; the trace id is its route_id.
+    :param callback: Optional callable(trace_id, kind, payload) for every event.
+    :param index: RegionalRoadIndex (default: road_index.default_index()).
+    :param trace_id: Trace id when the batches carry none.
+    :return: Dict with points, traces, runs, groups, segments and feature_km (feature -> km).
+    """
+    index = index if index is not None else road_index.default_index()
+    if index is None:
+        raise ValueError("Trace ingestion needs a regional road index covering the traces (ADAS_ROAD_INDEX)")
+    summary = {"points": 0, "traces": 0, "runs": 0, "groups": 0, "segments": 0, "feature_km": {}}
+    counts = {"step": "runs", "group": "groups", "segment": "segments"}
+    matcher = None
+
+    def emit(events):
+        for kind, payload in events:
+            number = summary[counts[kind]]
+            summary[counts[kind]] += 1
+            if kind == "segment":
+                for feature in payload["ADAS"]:
+                    summary["feature_km"][feature] = summary["feature_km"].get(feature, 0.0) + payload["distance_km"]
+            if exporter is not None:
+                if kind == "step":
+                    exporter.add_step(matcher.trace_id, number, payload)
+                elif kind == "group":
+                    exporter.add_group(matcher.trace_id, number, payload)
+                else:
+                    exporter.add_segment(matcher.trace_id, number, payload)
+            if callback is not None:
+                callback(matcher.trace_id, kind, payload)
+
+    for trace_ids, lat, lon, time_s in batches:
+        summary["points"] += len(lat)
+        if trace_ids is None:
+            trace_ids = np.full(len(lat), trace_id)
+        # Split the batch where the trace changes
+        bounds = np.r_[0, np.flatnonzero(trace_ids[1:] != trace_ids[:-1]) + 1, len(lat)]
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            if matcher is None or matcher.trace_id != trace_ids[start]:
+                if matcher is not None:
+                    emit(matcher.finish())
+                matcher = TraceMatcher(str(trace_ids[start]), autonomous_level, index, min_run_m)
+                summary["traces"] += 1
+            emit(matcher.add_points(lat[start:end], lon[start:end], time_s[start:end] if time_s is not None else None))
+    if matcher is not None:
+        emit(matcher.finish())
+        if exporter is not None:
+            exporter.routes += summary["traces"]
+    return summary
+
+
+def ingest(path, autonomous_level, exporter=None, callback=None, index=None, batch_size=DEFAULT_BATCH_SIZE, min_run_m=MIN_RUN_M):
+    """
+    Ingest a .gpx or .csv trace file; see ingest_batches.
+    """
+    if path.lower().endswith(".gpx"):
+        batches = iter_gpx_batches(path, batch_size)
+    else:
+        batches = iter_csv_batches(path, batch_size)
+    return ingest_batches(batches, autonomous_level, exporter, callback, index, min_run_m)
+
+
+def main(argv=None):
+    from exporter import RouteExporter, FORMAT_EXTENSIONS, DEFAULT_ROW_GROUP_SIZE
+
+    parser = argparse.ArgumentParser(description="ADAS availability along recorded GPS traces.")
+    parser.add_argument("trace", help="GPX or CSV file (lat, lon, optional time and trace_id columns).")
+    parser.add_argument("--level", default="Level 2", help="Autonomous level.")
+    parser.add_argument("--output", help="Directory to export runs, groups and ADAS segments to.")
+    parser.add_argument("--format", default="geoparquet", choices=sorted(FORMAT_EXTENSIONS))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--min-run", type=float, default=MIN_RUN_M, help="Shortest road type run in metres.")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.output:
+        with RouteExporter(args.output, args.format, DEFAULT_ROW_GROUP_SIZE) as exporter:
+            summary = ingest(args.trace, args.level, exporter, batch_size=args.batch_size, min_run_m=args.min_run)
+    else:
+        summary = ingest(args.trace, args.level, batch_size=args.batch_size, min_run_m=args.min_run)
+    elapsed = time.perf_counter() - started
+    print(f"{summary['points']} points in {summary['traces']} traces, {elapsed:.1f} s "
+          f"({summary['points'] / elapsed if elapsed > 0 else 0:.0f} points/s)")
+    print(f"{summary['runs']} road type runs, {summary['groups']} groups, {summary['segments']} ADAS segments")
+    for feature, km in sorted(summary["feature_km"].items()):
+        print(f"  {feature}: {km:.1f} km")
+
+
+if __name__ == "__main__":
+    main()
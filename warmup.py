@@ -0,0 +1,63 @@
+"""
+Optional pre-warm step for app workers.
+
+The heavy dependencies (osmnx with geopandas/shapely/networkx, folium, geopy) are
+imported lazily on first use. prewarm() loads them ahead of time, once per
+process, so the first route request of a fresh worker does not pay for them.
+streamlit_ui.py runs it through st.cache_resource after the first render.
+"""
+import time
+
+
+def _load_osmnx():
+    from routeprocessing import load_osmnx
+    load_osmnx()
+
+
+def _load_folium():
+    import folium  # noqa: F401
+
+
+def _load_geopy():
+    from geopy.geocoders import Nominatim  # noqa: F401
+
+
+def _load_local_graph():
+    import config
+
+    if config.LOCAL_ROUTING in ("fallback", "always"):
+        from local_router import default_graph
+        default_graph()
+
+
+def _load_road_index():
+    from road_index import default_index
+    default_index()
+
+
+# (name, callable) pairs run by prewarm(), in order
+WARMUP_STEPS = [
+    ("osmnx", _load_osmnx),
+    ("folium", _load_folium),
+    ("geopy", _load_geopy),
+    ("local_graph", _load_local_graph),
+    ("road_index", _load_road_index),
+]
+
+
+def prewarm(steps=None):
+    """
+    Run the warm-up steps and time each one.
+    A failing step is reported and skipped; the app then loads it lazily as before.
+    :param steps: Optional list of (name, callable) pairs, defaults to WARMUP_STEPS.
+    :return: Dict of step name -> seconds taken (or the error message).
+    """
+    timings = {}
+    for name, func in steps or WARMUP_STEPS:
+        start = time.perf_counter()
+        try:
+            func()
+            timings[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            timings[name] = f"failed: {e}"
+    return timings